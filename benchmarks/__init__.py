@@ -0,0 +1,31 @@
+"""
+Headless benchmarks for Gaphas' hot paths.
+
+The benchmarks build synthetic canvases with a configurable number of
+`gaphas.item.Element` and `gaphas.item.Line` items (half of the items are
+boxes, the other half lines connecting two boxes) and time:
+
+- building the canvas
+- `Canvas.update_now()`
+- `Solver.solve()`
+- `View.get_item_at_point()` and `View.get_port_at_point()`
+- zooming a view
+- spatial index rebuilds
+- pickling and unpickling the canvas
+
+No GTK+ main loop or window is required: a plain `gaphas.view.View` is used
+and bounding boxes are calculated on an in-memory Cairo surface.
+
+Run the suite from the source directory::
+
+    $ python -m benchmarks --sizes 1000,10000 --output results.json
+
+Results are written as JSON, so numbers from different releases can be
+compared with `benchmarks.compare`.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+
+# vim:sw=4:et:ai
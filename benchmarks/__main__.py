@@ -0,0 +1,45 @@
+"""
+Run the benchmark suite:
+
+    $ python -m benchmarks [--sizes 1000,10000] [--repeat 5] [--output FILE]
+                           [benchmark-prefix ...]
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import sys
+import json
+from optparse import OptionParser
+
+from benchmarks import suite
+
+
+def main(argv=sys.argv[1:]):
+    parser = OptionParser(usage='%prog [options] [benchmark-prefix ...]')
+    parser.add_option('-s', '--sizes', default=','.join(map(str, suite.SIZES)),
+                      help='comma separated list of canvas sizes [%default]')
+    parser.add_option('-r', '--repeat', type='int', default=suite.REPEAT,
+                      help='number of repetitions per benchmark [%default]')
+    parser.add_option('-o', '--output', default=None,
+                      help='write JSON results to this file')
+    options, names = parser.parse_args(argv)
+
+    sizes = [int(s) for s in options.sizes.split(',') if s]
+    results = suite.run(sizes, options.repeat, names, log=sys.stderr)
+
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(results, f, indent=2)
+        finally:
+            f.close()
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim:sw=4:et:ai
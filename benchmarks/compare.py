@@ -0,0 +1,70 @@
+"""
+Compare two benchmark result files.
+
+    $ python -m benchmarks.compare old.json new.json
+
+A benchmark is reported as a regression if its best timing got more than
+``THRESHOLD`` slower.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import sys
+import json
+
+
+# Relative slow down that is considered a regression
+THRESHOLD = 0.1
+
+
+def load(filename):
+    f = open(filename)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """
+    Compare two result dictionaries, as created by `benchmarks.suite.run()`.
+    Returns a list of tuples (name, size, old best, new best, ratio,
+    regression). Benchmarks that are not in both results are ignored.
+
+    >>> old = dict(results=[dict(name='a', size=10, best=1.0)])
+    >>> new = dict(results=[dict(name='a', size=10, best=1.5),
+    ...                     dict(name='b', size=10, best=1.0)])
+    >>> compare(old, new)
+    [('a', 10, 1.0, 1.5, 1.5, True)]
+    """
+    old_results = dict(((r['name'], r['size']), r['best']) for r in old['results'])
+    report = []
+    for r in new['results']:
+        key = r['name'], r['size']
+        if key not in old_results:
+            continue
+        old_best, new_best = old_results[key], r['best']
+        ratio = old_best and new_best / old_best or 1.0
+        report.append(key + (old_best, new_best, ratio, ratio > 1.0 + threshold))
+    return report
+
+
+def main(argv=sys.argv):
+    if len(argv) != 3:
+        print 'Usage: %s old.json new.json' % argv[0]
+        return 2
+    report = compare(load(argv[1]), load(argv[2]))
+    regressions = 0
+    for name, size, old_best, new_best, ratio, regression in report:
+        print '%-26s %8d %10.4fs %10.4fs %6.2fx%s' % (name, size, old_best,
+                new_best, ratio, regression and '  REGRESSION' or '')
+        regressions += regression
+    return regressions and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+# vim:sw=4:et:ai
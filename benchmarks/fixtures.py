@@ -0,0 +1,86 @@
+"""
+Synthetic canvases used by the benchmarks.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import math
+import cairo
+
+from gaphas.canvas import Canvas
+from gaphas.examples import Box
+from gaphas.item import Line
+from gaphas.view import View
+
+
+# Distance between two boxes on the grid
+SPACING = 60
+
+
+def create_canvas(count):
+    """
+    Create a canvas with ``count`` items. Half of the items are boxes, placed
+    on a square grid. The other half are lines, each connecting a box to its
+    right-hand neighbour (or the box below, at the end of a row).
+
+    >>> canvas = create_canvas(10)
+    >>> len(canvas.get_all_items())
+    10
+    >>> len(list(canvas.get_connections()))
+    10
+    """
+    canvas = Canvas()
+    nboxes = max(1, count - count // 2)
+    columns = int(math.ceil(math.sqrt(nboxes)))
+
+    boxes = []
+    for n in xrange(nboxes):
+        box = Box(40, 30)
+        box.matrix.translate((n % columns) * SPACING, (n // columns) * SPACING)
+        canvas.add(box)
+        boxes.append(box)
+
+    for n in xrange(count - nboxes):
+        b1 = boxes[n % nboxes]
+        b2 = boxes[(n + 1) % nboxes]
+        line = Line()
+        canvas.add(line)
+        connect(canvas, line, line.handles()[0], b1, b1.ports()[1])
+        connect(canvas, line, line.handles()[-1], b2, b2.ports()[3])
+
+    canvas.update_now()
+    return canvas
+
+
+def connect(canvas, line, handle, item, port):
+    """
+    Connect ``handle`` of ``line`` to ``port`` of ``item``, the way
+    `gaphas.aspect.ItemConnector` does, but without the need for a view.
+    """
+    pos = canvas.get_matrix_i2i(line, item).transform_point(*handle.pos)
+    glue_pos, dist = port.glue(pos)
+    handle.pos = canvas.get_matrix_i2i(item, line).transform_point(*glue_pos)
+    constraint = port.constraint(canvas, line, handle, item)
+    canvas.connect_item(line, handle, item, port, constraint)
+
+
+def create_context():
+    """
+    Create a Cairo context on a zero-sized in-memory surface. This is enough
+    to calculate bounding boxes.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
+    return cairo.Context(surface)
+
+
+def create_view(canvas):
+    """
+    Create a headless view for ``canvas``, with bounding boxes calculated.
+    """
+    view = View(canvas)
+    view.update_bounding_box(create_context())
+    return view
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,176 @@
+"""
+The benchmarks themselves.
+
+Each benchmark is a function that takes a size (the number of items on the
+canvas) and the canvas fixture, and returns a tuple ``(setup, run)``.
+``setup`` (which may be ``None``) is called before every repetition and is
+not timed, ``run`` is the code that is timed.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import sys
+import time
+import platform
+import pickle
+from random import Random
+from timeit import default_timer
+
+# Ensure extra pickle reducers/reconstructors are loaded:
+import gaphas.picklers
+
+from benchmarks.fixtures import create_canvas, create_view
+
+
+# Default canvas sizes (number of items)
+SIZES = (1000, 10000, 100000)
+
+# Number of times each benchmark is executed
+REPEAT = 5
+
+# Number of points queried by the hit-testing benchmarks
+POINTS = 1000
+
+# Registered benchmarks, as (name, function, repeat) tuples
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=None):
+    """
+    Register a benchmark function.
+    """
+    def register(func):
+        BENCHMARKS.append((name, func, repeat))
+        return func
+    return register
+
+
+def random_points(view, count=POINTS, seed=0):
+    """
+    Return ``count`` points (in view coordinates) within the view's bounding
+    box. The same seed results in the same points.
+    """
+    r = Random(seed)
+    b = view.bounding_box
+    return [(b.x + r.random() * b.width, b.y + r.random() * b.height)
+            for n in xrange(count)]
+
+
+@benchmark('canvas.build', repeat=1)
+def bench_build(size, canvas, view):
+    return None, lambda: create_canvas(size)
+
+
+@benchmark('canvas.update_now')
+def bench_update_now(size, canvas, view):
+    items = canvas.get_all_items()
+    def setup():
+        # Do not use request_update(): outside a main loop this triggers
+        # an update right away.
+        canvas._dirty_items.update(items)
+        canvas._dirty_matrix_items.update(items)
+    return setup, canvas.update_now
+
+
+@benchmark('solver.solve')
+def bench_solve(size, canvas, view):
+    solver = canvas.solver
+    def setup():
+        for c in solver.constraints:
+            solver.request_resolve_constraint(c)
+    return setup, solver.solve
+
+
+@benchmark('view.get_item_at_point')
+def bench_item_at_point(size, canvas, view):
+    points = random_points(view)
+    def run():
+        for p in points:
+            view.get_item_at_point(p)
+    return None, run
+
+
+@benchmark('view.get_port_at_point')
+def bench_port_at_point(size, canvas, view):
+    points = random_points(view)
+    def run():
+        for p in points:
+            view.get_port_at_point(p, exclude=())
+    return None, run
+
+
+@benchmark('view.zoom')
+def bench_zoom(size, canvas, view):
+    def run():
+        view.zoom(1.25)
+        view.zoom(0.8)
+    return None, run
+
+
+@benchmark('index.rebuild')
+def bench_index_rebuild(size, canvas, view):
+    return None, canvas.index.rebuild
+
+
+@benchmark('pickle.dumps')
+def bench_pickle_dumps(size, canvas, view):
+    return None, lambda: pickle.dumps(canvas, pickle.HIGHEST_PROTOCOL)
+
+
+@benchmark('pickle.loads')
+def bench_pickle_loads(size, canvas, view):
+    data = pickle.dumps(canvas, pickle.HIGHEST_PROTOCOL)
+    return None, lambda: pickle.loads(data)
+
+
+def measure(run, setup=None, repeat=REPEAT):
+    """
+    Time ``run`` ``repeat`` times. Return a list of timings (in seconds).
+    """
+    timings = []
+    for n in xrange(repeat):
+        if setup:
+            setup()
+        t0 = default_timer()
+        run()
+        timings.append(default_timer() - t0)
+    return timings
+
+
+def run(sizes=SIZES, repeat=REPEAT, names=None, log=None):
+    """
+    Run the benchmarks for each canvas size. ``names`` can be used to
+    select a subset of benchmarks (by prefix). Progress is written to
+    ``log``, a file like object, if provided.
+
+    Returns a dictionary that can be serialized as JSON.
+    """
+    results = []
+    for size in sizes:
+        canvas = create_canvas(size)
+        view = create_view(canvas)
+        for name, func, brepeat in BENCHMARKS:
+            if names and not [n for n in names if name.startswith(n)]:
+                continue
+            setup, stmt = func(size, canvas, view)
+            timings = measure(stmt, setup, brepeat or repeat)
+            result = dict(name=name,
+                          size=size,
+                          repeat=len(timings),
+                          best=min(timings),
+                          mean=sum(timings) / len(timings),
+                          timings=timings)
+            results.append(result)
+            if log:
+                log.write('%-26s %8d  best %10.4fs  mean %10.4fs\n' % (
+                        name, size, result['best'], result['mean']))
+                log.flush()
+
+    return dict(created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                python=sys.version.split()[0],
+                platform=platform.platform(),
+                results=results)
+
+
+# vim:sw=4:et:ai
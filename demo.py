@@ -33,7 +33,10 @@ from gaphas.item import Line, NW, SE
 from gaphas.tool import PlacementTool, HandleTool
 from gaphas.segment import Segment
 import gaphas.guide
-from gaphas.painter import PainterChain, ItemPainter, HandlePainter, FocusedItemPainter, ToolPainter, BoundingBoxPainter
+from gaphas.painter import PainterChain, ItemPainter, HandlePainter, FocusedItemPainter, ToolPainter, BoundingBoxPainter, CostPainter
+from gaphas.tracer import ItemCosts
+from gaphas.tilecache import TileCache, ItemCache
+from gaphas.export import Exporter
 from gaphas import state
 from gaphas.util import text_extents, text_underline
 from gaphas.freehand import FreeHandPainter
@@ -118,7 +121,8 @@ def create_window(canvas, title, zoom=1.0):
         append(FreeHandPainter(ItemPainter())). \
         append(HandlePainter()). \
         append(FocusedItemPainter()). \
-        append(ToolPainter())
+        append(ToolPainter()). \
+        append(CostPainter())
     view.bounding_box_painter = FreeHandPainter(BoundingBoxPainter())
     w = gtk.Window()
     w.set_title(title)
@@ -235,27 +239,7 @@ def create_window(canvas, title, zoom=1.0):
     b = gtk.Button('Write demo.png')
 
     def on_clicked(button):
-        svgview = View(view.canvas)
-        svgview.painter = ItemPainter()
-
-        # Update bounding boxes with a temporaly CairoContext
-        # (used for stuff like calculating font metrics)
-        tmpsurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
-        tmpcr = cairo.Context(tmpsurface)
-        svgview.update_bounding_box(tmpcr)
-        tmpcr.show_page()
-        tmpsurface.flush()
-       
-        w, h = svgview.bounding_box.width, svgview.bounding_box.height
-        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(w), int(h))
-        cr = cairo.Context(surface)
-        svgview.matrix.translate(-svgview.bounding_box.x, -svgview.bounding_box.y)
-        cr.save()
-        svgview.paint(cr)
-
-        cr.restore()
-        cr.show_page()
-        surface.write_to_png('demo.png')
+        Exporter(view.canvas).write_png('demo.png')
 
     b.connect('clicked', on_clicked)
     v.add(b)
@@ -263,38 +247,62 @@ def create_window(canvas, title, zoom=1.0):
     b = gtk.Button('Write demo.svg')
 
     def on_clicked(button):
-        svgview = View(view.canvas)
-        svgview.painter = ItemPainter()
-
-        # Update bounding boxes with a temporaly CairoContext
-        # (used for stuff like calculating font metrics)
-        tmpsurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
-        tmpcr = cairo.Context(tmpsurface)
-        svgview.update_bounding_box(tmpcr)
-        tmpcr.show_page()
-        tmpsurface.flush()
-       
-        w, h = svgview.bounding_box.width, svgview.bounding_box.height
-        surface = cairo.SVGSurface('demo.svg', w, h)
-        cr = cairo.Context(surface)
-        svgview.matrix.translate(-svgview.bounding_box.x, -svgview.bounding_box.y)
-        svgview.paint(cr)
-        cr.show_page()
-        surface.flush()
-        surface.finish()
+        Exporter(view.canvas).write_svg('demo.svg')
+
+    b.connect('clicked', on_clicked)
+    v.add(b)
+
+    b = gtk.Button('Write demo.pdf')
+
+    def on_clicked(button):
+        Exporter(view.canvas).write_pdf('demo.pdf', page_size=(595, 842))
 
     b.connect('clicked', on_clicked)
     v.add(b)
 
     
-    b = gtk.Button('Dump QTree')
+    b = gtk.Button('Dump index')
 
     def on_clicked(button, li):
-        view._qtree.dump()
+        view.canvas.index.dump()
 
     b.connect('clicked', on_clicked, [0])
     v.add(b)
 
+    b = gtk.ToggleButton('Tile cache')
+
+    def on_toggled(button):
+        if button.get_active():
+            view.tile_cache = TileCache()
+        else:
+            view.tile_cache = None
+
+    b.connect('toggled', on_toggled)
+    v.add(b)
+
+    b = gtk.ToggleButton('Item cache')
+
+    def on_toggled(button):
+        if button.get_active():
+            view.item_cache = ItemCache()
+        else:
+            view.item_cache = None
+
+    b.connect('toggled', on_toggled)
+    v.add(b)
+
+    b = gtk.ToggleButton('Item costs')
+
+    def on_toggled(button):
+        if button.get_active():
+            view.canvas.costs = ItemCosts()
+        else:
+            view.canvas.costs = None
+        view.queue_draw_refresh()
+
+    b.connect('toggled', on_toggled)
+    v.add(b)
+
 
     b = gtk.Button('Pickle (save)')
 
@@ -31,13 +31,18 @@ __version__ = "$Revision$"
 # $HeadURL$
 
 from collections import namedtuple
+from contextlib import contextmanager
+from itertools import count
 import logging
 
 from cairo import Matrix
 from gaphas import tree
 from gaphas import solver
+from gaphas.solver import Solver
 from gaphas import table
-from gaphas.decorators import nonrecursive, async, PRIORITY_HIGH_IDLE
+from gaphas.geometry import Rectangle
+from gaphas.rtree import RTree
+from gaphas.decorators import sliced, PRIORITY_HIGH_IDLE
 from state import observed, reversible_method, reversible_pair
 
 
@@ -55,6 +60,10 @@ Connection = namedtuple('Connection',
         'item handle connected port constraint callback')
 
 
+# Generation numbers for matrix updates, shared by all canvases
+_matrix_generations = count(1)
+
+
 class ConnectionError(Exception):
     """
     Exception raised when there is an error when connecting an items with
@@ -86,20 +95,56 @@ class Context(object):
 class Canvas(object):
     """
     Container class for items.
+
+    A custom constraint solver, such as a `solver.DependencySolver`, can be
+    provided. By default a `solver.Solver` is used.
+
+    The canvas keeps the bounding boxes of its items, in canvas coordinates,
+    in a spatial index that is shared by all views. By default this is an
+    `rtree.RTree`, another `spatialindex.SpatialIndex` can be provided as
+    ``index``. Bounding boxes are calculated by the views, each item's
+    bounding box by one view only (see `pop_dirty_bounds()`).
+
+    Updates are timed if a `tracer.Tracer` is set as ``tracer``. The time
+    spent in item methods is recorded per item class if a
+    `tracer.ItemCosts` is set as ``costs``.
     """
 
-    def __init__(self):
+    tracer = None
+
+    costs = None
+
+    # True while the update steps are executed (see _update_steps())
+    _updating = False
+    _update_again = False
+
+    def __init__(self, solver=None, index=None):
         self._tree = tree.Tree()
-        self._solver = solver.Solver()
+        self._solver = solver is None and Solver() or solver
         self._connections = table.Table(Connection, range(4))
         self._dirty_items = set()
         self._dirty_matrix_items = set()
-        self._dirty_index = False
+        if index is None:
+            index = RTree()
+        self._index = index
+
+        # Items of which the bounding box has to be calculated again
+        self._dirty_bounds = set()
+
+        # The number of matrices calculated in the last update_matrices()
+        self.matrix_update_count = 0
+
+        # Items touched and removed in a batch (see batch())
+        self._batch_items = None
+        self._batch_removed = []
 
         self._registered_views = set()
     
     solver = property(lambda s: s._solver)
 
+    index = property(lambda s: s._index,
+                     doc="Spatial index of item bounds in canvas coordinates")
+
 
     @observed
     def add(self, item, parent=None, index=None):
@@ -115,9 +160,8 @@ class Canvas(object):
         >>> i._canvas is c
         True
         """
-        assert item not in self._tree.nodes, 'Adding already added node %s' % item
+        assert item not in self._tree, 'Adding already added node %s' % item
         self._tree.add(item, parent, index)
-        self._dirty_index = True
 
         self.update_matrix(item, parent)
 
@@ -134,11 +178,28 @@ class Canvas(object):
         """
         item._set_canvas(None)
         self._tree.remove(item)
-        self._update_views(removed_items=(item,))
+        if self._batch_items is None:
+            self._remove_from_views((item,))
+        else:
+            self._batch_items.add(item)
+            self._batch_removed.append(item)
         self._dirty_items.discard(item)
         self._dirty_matrix_items.discard(item)
 
 
+    def _remove_from_views(self, items):
+        """
+        Notify the views of removed items and remove the items from the
+        index.
+        """
+        self._update_views(removed_items=items)
+        self._dirty_bounds.difference_update(items)
+        index = self._index
+        for item in items:
+            if item in index:
+                index.remove(item)
+
+
     def remove(self, item):
         """
         Remove item from the canvas.
@@ -162,6 +223,88 @@ class Canvas(object):
                            'index': lambda self, item: self._tree.get_siblings(item).index(item) })
 
 
+    @observed
+    def add_many(self, items, parents=None, indices=None):
+        """
+        Add a list of items to the canvas. ``parents`` is the list of parent
+        items (by default all items are added as top level items). A parent
+        should be on the canvas already, or precede its children in
+        ``items``.
+
+        The items are added in one go: the tree is updated once, the
+        items are updated in a batch (see `batch()`) and only one undo
+        action is recorded. If ``indices`` are provided, items are placed
+        at that position in the list of children of their parent.
+
+        >>> c = Canvas()
+        >>> from gaphas import item
+        >>> i, ii, iii = item.Item(), item.Item(), item.Item()
+        >>> c.add_many([i, ii, iii], [None, i, i])
+        >>> len(c._tree.nodes)
+        3
+        >>> c.get_children(i) == [ii, iii]
+        True
+        >>> iii._canvas is c
+        True
+        """
+        if parents is None:
+            parents = [None] * len(items)
+        for item in items:
+            assert item not in self._tree, 'Adding already added node %s' % item
+        self._tree.add_many(items, parents, indices)
+
+        with self.batch():
+            for item, parent in zip(items, parents):
+                self.update_matrix(item, parent)
+                item._set_canvas(self)
+                self.request_update(item)
+
+
+    @observed
+    def _remove_many(self, items):
+        """
+        Remove a list of items, as `_remove()` does. Items should be in
+        depth-first order, descendants of the items should be in the list
+        too.
+        """
+        for item in items:
+            item._set_canvas(None)
+        self._tree.remove_many(items)
+        if self._batch_items is None:
+            self._remove_from_views(items)
+        else:
+            self._batch_items.update(items)
+            self._batch_removed.extend(items)
+        self._dirty_items.difference_update(items)
+        self._dirty_matrix_items.difference_update(items)
+
+
+    def remove_many(self, items):
+        """
+        Remove a list of items, and their children, from the canvas.
+
+        >>> c = Canvas()
+        >>> from gaphas import item
+        >>> i, ii, iii = item.Item(), item.Item(), item.Item()
+        >>> c.add_many([i, ii, iii], [None, i, None])
+        >>> c.remove_many([i])
+        >>> c._tree.nodes == [iii]
+        True
+        >>> ii._canvas
+        """
+        removed = set(items)
+        for item in items:
+            removed.update(self.get_all_children(item))
+        removed = self.sort(removed)
+        for item in removed:
+            self.remove_connections_to_item(item)
+        self._remove_many(removed)
+
+    reversible_pair(add_many, _remove_many,
+                    bind1={'parents': lambda self, items: map(self.get_parent, items),
+                           'indices': lambda self, items: [self._tree.get_siblings(item).index(item) for item in items] })
+
+
     @observed
     def reparent(self, item, parent, index=None):
         """
@@ -169,8 +312,6 @@ class Canvas(object):
         """
         self._tree.reparent(item, parent, index)
 
-        self._dirty_index = True
-
     reversible_method(reparent, reverse=reparent,
                       bind={'parent': lambda self, item: self.get_parent(item),
                             'index': lambda self, item: self._tree.get_siblings(item).index(item) })
@@ -509,14 +650,13 @@ class Canvas(object):
         >>> c.add(i2)
         >>> i3 = item.Line()
         >>> c.add (i3)
-        >>> c.update() # ensure items are indexed
-        >>> i1._canvas_index
-        0
         >>> s = c.sort([i2, i3, i1])
         >>> s[0] is i1 and s[1] is i2 and s[2] is i3
         True
+
+        The order is maintained by the tree, no (re)indexing is required.
         """
-        return self._tree.sort(items, index_key='_canvas_index', reverse=reverse)
+        return self._tree.sort(items, reverse=reverse)
 
 
     def get_matrix_i2c(self, item, calculate=False):
@@ -577,11 +717,54 @@ class Canvas(object):
         if matrix:
             self._dirty_matrix_items.add(item)
 
-        self.update()
+        if self._batch_items is None:
+            self.update()
+        else:
+            self._batch_items.add(item)
 
     reversible_method(request_update, reverse=request_update)
 
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that defers updates. Within a batch, update requests
+        are collected, but no update is performed: the constraint solver is
+        not run and views are not notified. When the (outermost) batch ends,
+        one update is performed.
+
+        The set of touched items (items that requested an update or were
+        removed) is provided as context.
+
+        >>> from gaphas import item
+        >>> c = Canvas()
+        >>> with c.batch() as touched:
+        ...     for n in range(3):
+        ...         c.add(item.Item())
+        ...     c.require_update()
+        True
+        >>> len(touched)
+        3
+        >>> c.require_update()
+        False
+        """
+        if self._batch_items is not None:
+            # Nested batch, the outer batch will update
+            yield self._batch_items
+            return
+
+        touched = self._batch_items = set()
+        try:
+            yield touched
+        finally:
+            self._batch_items = None
+            removed = [item for item in self._batch_removed if item._canvas is not self]
+            self._batch_removed = []
+            if removed:
+                self._remove_from_views(removed)
+            self.update_now()
+
+
     def request_matrix_update(self, item):
         """
         Schedule only the matrix to be updated.
@@ -608,26 +791,47 @@ class Canvas(object):
         return bool(self._dirty_items)
 
 
-    @async(single=True, priority=PRIORITY_HIGH_IDLE)
+    @sliced(priority=PRIORITY_HIGH_IDLE)
     def update(self):
         """
         Update the canvas, if called from within a gtk-mainloop, the
-        update job is scheduled as idle job.
+        update job is scheduled as idle job. The ``post_update()`` calls of
+        a big update are spread over several idle jobs (see
+        `decorators.sliced`), the items are updated in the index and the
+        views when all items are done.
         """
-        self.update_now()
+        return self._update_steps(sliced=True)
 
 
     def _pre_update_items(self, items, cr):
         context_map = dict()
         c = Context(cairo=cr)
-        for item in items:
-            item.pre_update(c)
+        costs = self.costs
+        if costs is None:
+            for item in items:
+                item.pre_update(c)
+        else:
+            for item in items:
+                costs.call(item, 'pre_update', c)
 
 
     def _post_update_items(self, items, cr):
+        """
+        Call ``post_update()`` for ``items``, yield after each item. Items
+        removed from the canvas in the mean time are skipped.
+        """
         c = Context(cairo=cr)
-        for item in items:
-            item.post_update(c)
+        costs = self.costs
+        if costs is None:
+            for item in items:
+                if item._canvas is self:
+                    item.post_update(c)
+                yield
+        else:
+            for item in items:
+                if item._canvas is self:
+                    costs.call(item, 'post_update', c)
+                yield
 
 
     def _extend_dirty_items(self, dirty_items):
@@ -638,28 +842,105 @@ class Canvas(object):
 
             dirty_items = self.sort(set(dirty_items), reverse=True)
 
-    @nonrecursive
-    def update_now(self):
+    def _add_dirty_ancestors(self, dirty_items):
+        """
+        Add the ancestors of the items in ``dirty_items`` to the set. The
+        ancestors shared by dirty items are visited only once.
+
+        >>> from gaphas import item
+        >>> c = Canvas()
+        >>> i, ii, iii, iv = item.Item(), item.Item(), item.Item(), item.Item()
+        >>> c.add_many([i, ii, iii, iv], [None, i, ii, ii])
+        >>> dirty = set([iii, iv])
+        >>> c._add_dirty_ancestors(dirty)
+        >>> dirty == set([i, ii, iii, iv])
+        True
         """
-        Peform an update of the items that requested an update.
+        get_ancestors = self._tree._get_ancestors
+        done = set()
+        for item in list(dirty_items):
+            for parent in get_ancestors(item):
+                if parent in done:
+                    break
+                done.add(parent)
+                dirty_items.add(parent)
+
+
+    def update_now(self):
         """
+        Peform an update of the items that requested an update. An update
+        scheduled with `update()` is finished first.
+
+        If an update is executing already, e.g. when called from an item's
+        ``post_update()`` during a sliced update (see `update()`), the
+        items can not be updated right away. This method returns without
+        updating, and the executing update does another pass when it's done:
 
-        if self._dirty_index:
-            self.update_index()
-            self._dirty_index = False
+        >>> from gaphas import item
+        >>> class Updater(item.Item):
+        ...     def post_update(self, context):
+        ...         print 'post_update'
+        ...         if not hasattr(self, 'done'):
+        ...             self.done = True
+        ...             self.request_update()
+        ...             self.canvas.update_now()
+        ...             print 'returned'
+        >>> c = Canvas()
+        >>> c.add(Updater())
+        post_update
+        returned
+        post_update
+
+        If a `tracer.Tracer` is set as ``tracer``, the phases of the update
+        are recorded.
+        """
+        Canvas.update.finish(self)
+        if self._updating:
+            self._update_again = True
+            return
+        for step in self._update_steps():
+            pass
+
+
+    def _update_steps(self, sliced=False):
+        """
+        Generator performing the update, see `update_now()`. It yields
+        between the ``post_update()`` calls of the items. If the update is
+        ``sliced``, items may request an update in the mean time, those are
+        updated in the next update. Nothing is done if an update is
+        executing already. Another pass is done if `update_now()` was
+        called during the update.
+        """
+        if self._updating:
+            return
+        self._updating = True
+        try:
+            self._update_again = True
+            while self._update_again:
+                self._update_again = False
+                for step in self._update_items(sliced):
+                    yield
+        finally:
+            self._updating = False
+            self._update_again = False
 
+
+    def _update_items(self, sliced):
         sort = self.sort
         extend_dirty_items = self._extend_dirty_items
+        tracer = self.tracer
+        if tracer: tracer.begin('Canvas.update_now')
 
         # perform update requests for parents of dirty items
-        dirty_items = self._dirty_items
-        for item in set(dirty_items):
-            dirty_items.update(self._tree.get_ancestors(item))
+        self._add_dirty_ancestors(self._dirty_items)
 
         # order the dirty items, so they are updated bottom to top
         dirty_items = sort(self._dirty_items, reverse=True)
 
         self._dirty_items.clear()
+        dirty_matrix_items = set()
+
+        if tracer: tracer.phase('sort', len(dirty_items))
 
         try:
             cr = self._obtain_cairo_context()
@@ -668,10 +949,14 @@ class Canvas(object):
             # full update (only called for items that requested a full update)
             self._pre_update_items(dirty_items, cr)
 
+            if tracer: tracer.phase('pre_update', len(dirty_items))
+
             # recalculate matrices
             dirty_matrix_items = self.update_matrices(self._dirty_matrix_items)
             self._dirty_matrix_items.clear()
 
+            if tracer: tracer.phase('matrices', self.matrix_update_count)
+
             self.update_constraints(dirty_matrix_items)
 
             # no matrix can change during constraint solving
@@ -682,6 +967,8 @@ class Canvas(object):
 
             assert not self._dirty_items, 'No items may have been marked dirty (%s)' % (self._dirty_items,)
 
+            if tracer: tracer.phase('constraints', len(dirty_matrix_items))
+
             # normalize items, which changed after constraint solving;
             # store those items, whose matrices changed
             normalized_items = self._normalize(dirty_items)
@@ -689,6 +976,8 @@ class Canvas(object):
             # recalculate matrices of normalized items
             dirty_matrix_items.update(self.update_matrices(normalized_items))
 
+            if tracer: tracer.phase('normalize', len(normalized_items))
+
             # ensure constraints are still true after normalization
             self._solver.solve()
 
@@ -697,63 +986,110 @@ class Canvas(object):
 
             assert not self._dirty_items, 'No items may have been marked dirty (%s)' % (self._dirty_items,)
 
-            self._post_update_items(dirty_items, cr)
+            if tracer: tracer.phase('resolve', len(dirty_items))
+
+            for step in self._post_update_items(dirty_items, cr):
+                yield
+            if tracer: tracer.phase('post_update', len(dirty_items))
 
         except Exception, e:
             logging.error('Error while updating canvas', exc_info=e)
 
-        assert len(self._dirty_items) == 0 and len(self._dirty_matrix_items) == 0, \
+        # Items may have requested an update in between post_update() calls
+        # of a sliced update, otherwise no update requests are allowed.
+        assert sliced or (len(self._dirty_items) == 0 and len(self._dirty_matrix_items) == 0), \
                 'dirty: %s; matrix: %s' % (self._dirty_items, self._dirty_matrix_items)
 
-        self._update_views(dirty_items, dirty_matrix_items)
+        if sliced:
+            # Skip items removed in the mean time
+            dirty_items = [item for item in dirty_items if item._canvas is self]
+            dirty_matrix_items = set(item for item in dirty_matrix_items
+                                     if item._canvas is self)
+
+        try:
+            self._update_item_bounds(dirty_matrix_items)
+
+            if tracer: tracer.phase('index', len(dirty_matrix_items))
+
+            self._update_views(dirty_items, dirty_matrix_items)
+
+            if tracer: tracer.phase('views', len(self._registered_views))
+        finally:
+            if tracer: tracer.end()
 
 
     def update_matrices(self, items):
         """
-        Recalculate matrices of the items. Items' children matrices are
-        recalculated, too.
+        Recalculate matrices of the items. The items are processed parents
+        first. If the matrix of an item changed, the matrices of its
+        children are recalculated, too. Subtrees of items whose matrix did
+        not change are skipped.
+
+        Each pass has a unique generation number, items are stamped with the
+        generation in which their matrix was last recalculated (so no matrix
+        is calculated twice in a pass). The number of recalculated matrices
+        is stored as ``matrix_update_count``.
 
-        Return items, which matrices were recalculated.
+        Return items, which matrices changed.
+
+        >>> from gaphas import item
+        >>> c = Canvas()
+        >>> i, ii, iii = item.Item(), item.Item(), item.Item()
+        >>> c.add_many([i, ii, iii], [None, i, ii])
+        >>> i.matrix.translate(5, 0)
+        >>> len(c.update_matrices([i, iii]))
+        3
+        >>> c.matrix_update_count
+        3
+        >>> len(c.update_matrices([i, ii]))
+        0
+        >>> c.matrix_update_count
+        2
         """
+        generation = next(_matrix_generations)
+        get_parent = self._tree.get_parent
+        get_children = self._tree.get_children
+        update_matrix = self.update_matrix
         changed = set()
-        for item in items:
-            parent = self._tree.get_parent(item)
-            if parent is not None and parent in items:
-                # item's matrix will be updated thanks to parent's matrix
-                # update
+        recalculated = 0
+        for item in self.sort(items):
+            if item._matrix_generation == generation:
+                # Updated as part of a parent's subtree
                 continue
-
-            self.update_matrix(item, parent)
-            changed.add(item)
-
-            changed_children = self.update_matrices(set(self.get_children(item)))
-            changed.update(changed_children)
-
+            stack = [item]
+            while stack:
+                item = stack.pop()
+                item._matrix_generation = generation
+                recalculated += 1
+                if update_matrix(item, get_parent(item)):
+                    changed.add(item)
+                    stack.extend(get_children(item))
+
+        self.matrix_update_count = recalculated
         return changed
 
 
     def update_matrix(self, item, parent=None):
         """
-        Update matrices of an item.
+        Update matrices of an item. Returns ``True`` if the item to canvas
+        matrix changed.
         """
-        try:
-            orig_matrix_i2c = Matrix(*item._matrix_i2c)
-        except:
-            orig_matrix_i2c = None
-
-        item._matrix_i2c = Matrix(*item.matrix)
+        matrix_i2c = Matrix(*item.matrix)
 
         if parent is not None:
             try:
-                item._matrix_i2c = item._matrix_i2c.multiply(parent._matrix_i2c)
+                matrix_i2c = matrix_i2c.multiply(parent._matrix_i2c)
             except AttributeError:
                 # Fall back to old behaviour
-                item._matrix_i2c *= parent._matrix_i2c
+                matrix_i2c *= parent._matrix_i2c
 
-        if orig_matrix_i2c is None or orig_matrix_i2c != item._matrix_i2c:
+        if item._matrix_i2c is None or item._matrix_i2c != matrix_i2c:
             # calculate c2i matrix and view matrices
-            item._matrix_c2i = Matrix(*item._matrix_i2c)
+            item._matrix_i2c = matrix_i2c
+            item._matrix_c2i = Matrix(*matrix_i2c)
             item._matrix_c2i.invert()
+            return True
+        return False
 
 
     def update_constraints(self, items):
@@ -814,12 +1150,109 @@ class Canvas(object):
 
     def update_index(self):
         """
-        Provide each item in the canvas with an index attribute. This makes
-        for fast searching of items.
+        Provide each item in the canvas with an index attribute
+        (``_canvas_index``).
+
+        This is not required for sorting (see `sort()`), since the tree
+        maintains the order of its nodes.
         """
         self._tree.index_nodes('_canvas_index')
 
 
+    def set_item_bounds(self, item, bounds):
+        """
+        Set the bounding box of ``item``. ``bounds`` is in item
+        coordinates, the index keeps it in canvas coordinates, so it can be
+        projected again when the item's matrix changes.
+
+        >>> from gaphas import item
+        >>> c = Canvas()
+        >>> i = item.Item()
+        >>> c.add(i)
+        >>> i.matrix.translate(10, 20)
+        >>> c.request_matrix_update(i)
+        >>> c.set_item_bounds(i, Rectangle(0, 0, 5, 5))
+        >>> c.get_item_bounds(i)
+        Rectangle(10, 20, 5, 5)
+        """
+        self._index.add(item, self._project_bounds(item, bounds), bounds)
+        self._dirty_bounds.discard(item)
+
+
+    def pop_dirty_bounds(self, items):
+        """
+        Return the items in ``items`` of which the bounding box has to be
+        calculated: items that have been updated since their bounding box
+        was set, and items without a bounding box. The items are no longer
+        considered dirty, so the caller should set their bounding boxes.
+
+        Views call this before calculating bounding boxes, so an item's
+        bounding box is only calculated once, not once per view.
+
+        >>> from gaphas import item
+        >>> c = Canvas()
+        >>> i = item.Item()
+        >>> c.add(i)
+        >>> c.update_now()
+        >>> c.pop_dirty_bounds([i]) == [i]
+        True
+        >>> c.set_item_bounds(i, Rectangle(0, 0, 5, 5))
+        >>> c.pop_dirty_bounds([i])
+        []
+        """
+        dirty = self._dirty_bounds
+        index = self._index
+        result = [item for item in items if item in dirty or item not in index]
+        dirty.difference_update(result)
+        return result
+
+
+    def get_item_bounds(self, item):
+        """
+        Get the bounding box of ``item``, in canvas coordinates. A KeyError
+        is raised if no bounding box has been set.
+        """
+        return self._index.get_bounds(item)
+
+
+    def has_item_bounds(self, item):
+        """
+        Return True if ``item`` has a bounding box that is up to date, i.e.
+        it has not been updated since its bounding box was set (see
+        `pop_dirty_bounds()`).
+        """
+        return item in self._index and item not in self._dirty_bounds
+
+
+    def _project_bounds(self, item, bounds):
+        """
+        Project ``bounds`` from item to canvas coordinates.
+        """
+        i2c = item._matrix_i2c.transform_point
+        x0, y0 = i2c(bounds.x, bounds.y)
+        x1, y1 = i2c(bounds.x1, bounds.y1)
+        return Rectangle(x0, y0, x1=x1, y1=y1)
+
+
+    def _update_item_bounds(self, items):
+        """
+        Project the bounding boxes of items, whose matrix changed, to
+        canvas coordinates again. Registered views are asked to redraw the
+        old areas first.
+        """
+        index = self._index
+        items = [item for item in items if item in index]
+        if not items:
+            return
+        for view in self._registered_views:
+            view.queue_draw_item(*items)
+        get_data = index.get_data
+        project_bounds = self._project_bounds
+        for item in items:
+            bounds = get_data(item)
+            index.add(item, project_bounds(item, bounds), bounds)
+
+
     def register_view(self, view):
         """
         Register a view on this canvas. This method is called when setting
@@ -840,6 +1273,8 @@ class Canvas(object):
         """
         Send an update notification to all registered views.
         """
+        if dirty_items:
+            self._dirty_bounds.update(dirty_items)
         for v in self._registered_views:
             v.request_update(dirty_items, dirty_matrix_items, removed_items)
 
@@ -873,7 +1308,10 @@ class Canvas(object):
         Persist canvas. Dirty item sets and views are not saved.
         """
         d = dict(self.__dict__)
-        for n in ('_dirty_items', '_dirty_matrix_items', '_dirty_index', '_registered_views'):
+        for n in ('_dirty_items', '_dirty_matrix_items', '_registered_views',
+                  '_batch_items', '_batch_removed', 'tracer', 'costs',
+                  '_updating', '_update_again', '_sliced_job_update',
+                  '_dirty_bounds'):
             try:
                 del d[n]
             except KeyError:
@@ -887,10 +1325,14 @@ class Canvas(object):
 
         Before loading the state, the constructor is called.
         """
+        self._index = RTree()
+        self._batch_items = None
+        self._batch_removed = []
+        self.matrix_update_count = 0
         self.__dict__.update(state)
         self._dirty_items = set(self._tree.nodes)
         self._dirty_matrix_items = set(self._tree.nodes)
-        self._dirty_index = True
+        self._dirty_bounds = set()
         self._registered_views = set()
         #self.update()
 
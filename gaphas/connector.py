@@ -26,15 +26,34 @@ class Position(object):
     (Variable(3, 20), Variable(5, 20))
     >>> vp[0], vp[1]
     (Variable(3, 20), Variable(5, 20))
+
+    The variables can be kept in a `solver.VariableStore`, either by passing
+    a store or by setting the ``store`` class attribute, so all new
+    positions (and thus handles) use it:
+
+    >>> from gaphas.solver import VariableStore
+    >>> store = VariableStore()
+    >>> vp = Position((3, 5), store=store)
+    >>> store.get_positions([vp])
+    array('d', [3.0, 5.0])
     """
 
     x = solvable(varname='_v_x')
     y = solvable(varname='_v_y')
 
-    def __init__(self, pos, strength=NORMAL):
-        self.x, self.y = pos
-        self.x.strength = strength
-        self.y.strength = strength
+    # Default variable store for new positions
+    store = None
+
+    def __init__(self, pos, strength=NORMAL, store=None):
+        if store is None:
+            store = self.store
+        if store is not None:
+            self.set_x(store.variable(pos[0], strength))
+            self.set_y(store.variable(pos[1], strength))
+        else:
+            self.x, self.y = pos
+            self.x.strength = strength
+            self.y.strength = strength
 
     @observed
     def _set_pos(self, pos):
@@ -92,8 +111,8 @@ class Handle(object):
       not capable of pickling ``instancemethod`` or ``function`` objects.
     """
 
-    def __init__(self, pos=(0, 0), strength=NORMAL, connectable=False, movable=True):
-        self._pos = Position(pos, strength)
+    def __init__(self, pos=(0, 0), strength=NORMAL, connectable=False, movable=True, store=None):
+        self._pos = Position(pos, strength, store)
         self._connectable = connectable
         self._movable = movable
         self._visible = True
@@ -99,6 +99,19 @@ class Constraint(object):
         return self._weakest[0]
 
 
+    def solved_variables(self):
+        """
+        Return the variables that may be changed when the constraint is
+        solved. This information is used by `solver.DependencySolver` to
+        schedule constraints. By default the weakest variable is returned.
+
+        Constraints that change other variables than the weakest one should
+        override this method. Scheduling is less efficient if this
+        information is incorrect, the outcome is still the same though.
+        """
+        return (self.weakest(),)
+
+
     def mark_dirty(self, v):
         """
         Mark variable v dirty and if possible move it to the end of
@@ -213,6 +226,10 @@ class CenterConstraint(Constraint):
         _update(self.center, v)
 
 
+    def solved_variables(self):
+        return (self.center,)
+
+
 
 class LessThanConstraint(Constraint):
     """
@@ -257,6 +274,19 @@ class LessThanConstraint(Constraint):
                 self.delta.value = self.bigger.value - self.smaller.value
 
 
+    def solved_variables(self):
+        """
+        The variable that is solved for is left alone, the other one is
+        changed.
+        """
+        var = self.weakest()
+        if var is self.smaller:
+            return (self.bigger,)
+        elif var is self.bigger:
+            return (self.smaller,)
+        return (var,)
+
+
 
 
 # Constants for the EquationConstraint
@@ -541,6 +571,11 @@ class LineConstraint(Constraint):
         _update(py, y)
 
 
+    def solved_variables(self):
+        # The point's variables are registered last
+        return self._variables[-2:]
+
+
 
 class PositionConstraint(Constraint):
     """
@@ -569,6 +604,11 @@ class PositionConstraint(Constraint):
         _update(self._point[1], y)
 
 
+    def solved_variables(self):
+        # The point's variables are registered last
+        return self._variables[-2:]
+
+
 
 class LineAlignConstraint(Constraint):
     """
@@ -619,4 +659,9 @@ class LineAlignConstraint(Constraint):
         _update(py, y)
 
 
+    def solved_variables(self):
+        # The point's variables are registered last
+        return self._variables[-2:]
+
+
 # vim:sw=4:et:ai
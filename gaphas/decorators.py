@@ -6,6 +6,7 @@ __version__ = "$Revision$"
 # $HeadURL$
 
 import threading
+from timeit import default_timer as timer
 import gobject
 from gobject import PRIORITY_HIGH, PRIORITY_HIGH_IDLE, PRIORITY_DEFAULT, \
         PRIORITY_DEFAULT_IDLE, PRIORITY_LOW
@@ -143,6 +144,120 @@ class async(object):
         return wrapper
 
 
+class sliced(object):
+    """
+    Run a generator method in time slices. Instead of calling the method,
+    an idle handler is scheduled (at ``priority``) that runs the generator
+    until it has run for ``budget`` seconds; this is checked every time the
+    generator yields. The rest of the work is done in the following idle
+    handlers, so the main loop can handle events and redraw the screen in
+    between. The method should yield between small chunks of work, at
+    points where the work done so far is consistent.
+
+    Only one job is scheduled per instance. If the method is called again
+    while a job is scheduled, it's called again (with the latest arguments)
+    when the job is done.
+
+    Outside of the gtk main loop the method is executed directly:
+
+    >>> class A(object):
+    ...     @sliced(budget=0)
+    ...     def a(self, n):
+    ...         for i in range(n):
+    ...             print 'slice', i, gobject.main_depth()
+    ...             yield
+    >>> A().a(2)
+    slice 0 0
+    slice 1 0
+
+    Within the main loop, with no budget, every step is run in its own idle
+    handler:
+
+    >>> def delayed():
+    ...     a = A()
+    ...     a.a(3)
+    ...     a.a(1)
+    ...     print 'after'
+    ...     gobject.timeout_add(100, gtk.main_quit)
+    >>> gobject.timeout_add(1, delayed) > 0 # timeout id may vary
+    True
+    >>> import gtk
+    >>> gtk.main()
+    after
+    slice 0 1
+    slice 1 1
+    slice 2 1
+    slice 0 1
+
+    The rest of a scheduled job can be executed directly by calling the
+    ``finish`` attribute of the method with the instance, e.g.
+    ``A.a.finish(a)``. Nothing is done if the job is executing already.
+    """
+
+    def __init__(self, budget=0.01, priority=PRIORITY_HIGH_IDLE):
+        self.budget = budget
+        self.priority = priority
+
+    def __call__(self, func):
+        job_id = '_sliced_job_%s' % func.__name__
+
+        def run(holder, job, budget=None):
+            """
+            Run the job for ``budget`` seconds (or to the end). A job is a
+            [generator, arguments for the next call, executing, source id]
+            list. Returns True if there is work left.
+            """
+            if job[2]:
+                return True
+            job[2] = True
+            try:
+                start = timer()
+                while True:
+                    for step in job[0]:
+                        if budget is not None and timer() - start >= budget:
+                            return True
+                    if job[1] is None:
+                        break
+                    args, kwargs = job[1]
+                    job[1] = None
+                    job[0] = func(holder, *args, **kwargs)
+            except:
+                delattr(holder, job_id)
+                raise
+            finally:
+                job[2] = False
+            delattr(holder, job_id)
+            return False
+
+        def finish(holder):
+            """
+            Run the rest of the job scheduled for ``holder``, if any.
+            """
+            job = getattr(holder, job_id, None)
+            if job and not job[2]:
+                gobject.source_remove(job[3])
+                run(holder, job)
+
+        def wrapper(holder, *args, **kwargs):
+            job = getattr(holder, job_id, None)
+            if gobject.main_depth() == 0:
+                finish(holder)
+                for step in func(holder, *args, **kwargs):
+                    pass
+            elif job:
+                job[1] = (args, kwargs)
+            else:
+                job = [func(holder, *args, **kwargs), None, False, None]
+                setattr(holder, job_id, job)
+                job[3] = gobject.idle_add(run, holder, job, self.budget,
+                                          priority=self.priority)
+
+        wrapper.finish = finish
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+
 def nonrecursive(func):
     """
     Enforce a function or method is not executed recursively:
@@ -18,6 +18,9 @@ class Box(Element):
      SW +---+ SE
     """
 
+    # Half the (default) line width
+    bounds_padding = 1
+
     def __init__(self, width=10, height=10):
         super(Box, self).__init__(width, height)
 
@@ -53,6 +56,10 @@ class PortoBox(Box):
          SW +--------+ SE
                 x
     """
+
+    # The ports are drawn outside of the box
+    bounds_padding = None
+
     def __init__(self, width=10, height=10):
         super(PortoBox, self).__init__(width, height)
 
@@ -154,6 +161,9 @@ class FatLine(Item):
 
     todo: rectangle port instead of line port would be nicer
     """
+
+    bounds_padding = 5
+
     def __init__(self):
         super(FatLine, self).__init__()
         self._handles.extend((Handle(), Handle()))
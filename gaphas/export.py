@@ -0,0 +1,545 @@
+"""
+Render a canvas to PNG, PDF and SVG files, without a `view.GtkView`.
+
+The `Exporter` uses a plain `view.View` and its painters. The bounding
+boxes are kept in a spatial index of the exporter, the index of the canvas
+(shared by the views on the canvas) is not changed. Bounding boxes that
+are up to date in the canvas are reused, the others are calculated in
+chunks. The output is rendered in tiles (or pages), so only the items in a
+tile are drawn at a time and only one tile is kept in memory::
+
+    exporter = Exporter(canvas, scale=2.0, progress=report)
+    exporter.write_png('diagram.png')
+    exporter.write_pdf('diagram.pdf', page_size=(595, 842))
+
+``progress`` is called as ``progress(stage, done, total)``, where stage is
+'bounding_box' (``done`` items of ``total``) or 'render' (``done`` tiles
+or pages of ``total``).
+
+The `ParallelExporter` renders the tiles in a pool of worker processes,
+from a pickled snapshot of the canvas, and stitches them in the current
+process.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import sys
+import struct
+import zlib
+import pickle
+from array import array
+from itertools import izip
+from math import floor, ceil
+from multiprocessing import Pool, cpu_count
+
+import cairo
+
+from gaphas.canvas import Context
+from gaphas.geometry import Rectangle
+from gaphas.painter import ItemPainter
+from gaphas.rtree import RTree
+from gaphas.view import View
+
+# Ensure extra pickle reducers/reconstructors are loaded:
+import gaphas.picklers
+
+
+# Offsets of the red, green and blue bytes in a FORMAT_RGB24 pixel
+if sys.byteorder == 'little':
+    _RGB_OFFSETS = (2, 1, 0)
+else:
+    _RGB_OFFSETS = (1, 2, 3)
+
+
+def _png_chunk(f, tag, data):
+    """
+    Write a PNG chunk to file ``f``.
+    """
+    f.write(struct.pack('!I', len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack('!I', zlib.crc32(tag + data) & 0xffffffff))
+
+
+class _PNGWriter(object):
+    """
+    Write an 8 bit RGB PNG image to file ``f``, row by row.
+    """
+
+    def __init__(self, f, width, height):
+        self._f = f
+        self._compressor = zlib.compressobj()
+        f.write('\x89PNG\r\n\x1a\n')
+        # 8 bit RGB, no interlacing
+        _png_chunk(f, 'IHDR', struct.pack('!IIBBBBB', width, height,
+                                          8, 2, 0, 0, 0))
+
+    def write_row(self, row):
+        """
+        Write a row of RGB values.
+        """
+        # Filter type 0, followed by the RGB values
+        compressed = self._compressor.compress('\0' + row)
+        if compressed:
+            _png_chunk(self._f, 'IDAT', compressed)
+
+    def close(self):
+        _png_chunk(self._f, 'IDAT', self._compressor.flush())
+        _png_chunk(self._f, 'IEND', '')
+
+
+def _rgb_rows(surface):
+    """
+    Return the pixels of a FORMAT_RGB24 image surface as a list of strings
+    of RGB values, one per row.
+    """
+    width = surface.get_width()
+    stride = surface.get_stride()
+    data = str(surface.get_data())
+    r, g, b = _RGB_OFFSETS
+    rows = []
+    for y in xrange(surface.get_height()):
+        pixels = data[y * stride:y * stride + width * 4]
+        row = bytearray(width * 3)
+        row[0::3] = pixels[r::4]
+        row[1::3] = pixels[g::4]
+        row[2::3] = pixels[b::4]
+        rows.append(str(row))
+    return rows
+
+
+class Exporter(object):
+    """
+    Render ``canvas`` to files. The items are drawn with ``painter``
+    (an `painter.ItemPainter` by default), at ``scale``. ``padding`` pixels
+    (or points) are added around the items.
+
+    Images are rendered in tiles of ``tile_size`` x ``tile_size`` pixels.
+    For `write_png()` strips of ``tile_size`` rows are rendered.
+    """
+
+    def __init__(self, canvas, painter=None, scale=1.0, padding=0,
+                 tile_size=1024, progress=None):
+        self.view = View(canvas)
+        self.view.painter = painter or ItemPainter()
+        self.scale = scale
+        if scale != 1.0:
+            self.view.zoom(scale)
+        self.padding = padding
+        self.tile_size = tile_size
+        self.progress = progress
+        self._bounds = None
+        # Bounding boxes of the items, in view coordinates
+        self._index = RTree()
+
+
+    def _report(self, stage, done, total):
+        if self.progress:
+            self.progress(stage, done, total)
+
+
+    def update_bounding_box(self, items=None, chunk_size=1000):
+        """
+        Calculate the bounding boxes of ``items`` (all items by default),
+        ``chunk_size`` items at a time. This is done by the write methods
+        if it has not been done before.
+
+        Bounding boxes that are up to date in the canvas are used as they
+        are. The others are calculated, but not stored in the canvas.
+        """
+        view = self.view
+        canvas = view.canvas
+        index = self._index
+        if items is None:
+            items = canvas.get_all_items()
+            index.clear()
+        get_bounds = view.bounding_box_painter.get_bounds
+
+        # Used for stuff like calculating font metrics
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
+        cr = cairo.Context(surface)
+        total = len(items)
+        for i in xrange(0, total, chunk_size):
+            for item in items[i:i + chunk_size]:
+                if canvas.has_item_bounds(item):
+                    bounds = view._canvas_to_view(canvas.get_item_bounds(item))
+                else:
+                    bounds = get_bounds(item, cr)
+                index.add(item, bounds)
+            self._report('bounding_box', min(i + chunk_size, total), total)
+
+        b = Rectangle(*index.soft_bounds)
+        p = self.padding
+        self._bounds = Rectangle(floor(b.x - p), floor(b.y - p),
+                                 x1=ceil(b.x1 + p), y1=ceil(b.y1 + p))
+
+
+    def _get_bounds(self):
+        if self._bounds is None:
+            self.update_bounding_box()
+        return self._bounds
+
+    bounds = property(_get_bounds,
+                      doc="The area to export, in view coordinates")
+
+
+    def tiles(self, width, height):
+        """
+        Iterate (column, row, area) tuples for the tiles of ``width`` x
+        ``height`` covering the bounds, row by row. The tiles at the
+        right and bottom edge may be smaller.
+        """
+        b = self.bounds
+        rows = int(ceil(float(b.height) / height))
+        columns = int(ceil(float(b.width) / width))
+        for row in xrange(rows):
+            y = b.y + row * height
+            for column in xrange(columns):
+                x = b.x + column * width
+                yield column, row, Rectangle(x, y,
+                                             min(width, b.x1 - x),
+                                             min(height, b.y1 - y))
+
+
+    def get_items_in_rectangle(self, rect):
+        """
+        Return the items whose bounding box intersects ``rect`` (in view
+        coordinates), in the canvas' processing order.
+        """
+        if self._bounds is None:
+            self.update_bounding_box()
+        return self.view.canvas.sort(self._index.find_intersect(rect))
+
+
+    def render(self, cr, area):
+        """
+        Draw the items in ``area`` (in view coordinates) on ``cr``. Only
+        the items whose bounding box intersects the area are drawn.
+        """
+        view = self.view
+        items = self.get_items_in_rectangle(area)
+        cr.save()
+        try:
+            cr.rectangle(*area)
+            cr.clip()
+            view.painter.paint(Context(cairo=cr, items=items, area=area))
+        finally:
+            cr.restore()
+
+
+    def render_tile(self, area, format=cairo.FORMAT_ARGB32, background=None):
+        """
+        Render ``area`` (in view coordinates) in a new image surface. The
+        surface is filled with ``background`` (an (r, g, b) tuple) first,
+        if provided.
+        """
+        x, y = int(floor(area[0])), int(floor(area[1]))
+        surface = cairo.ImageSurface(format, int(ceil(area[0] + area[2])) - x,
+                                     int(ceil(area[1] + area[3])) - y)
+        # Draw in view coordinates, also if painters reset the matrix
+        surface.set_device_offset(-x, -y)
+        cr = cairo.Context(surface)
+        if background:
+            cr.set_source_rgb(*background)
+            cr.paint()
+        self.render(cr, area)
+        del cr
+        surface.flush()
+        surface.set_device_offset(0, 0)
+        return surface
+
+
+    def write_png(self, filename, background=(1, 1, 1)):
+        """
+        Write the canvas to one PNG file, on a ``background`` color. The
+        image is rendered and compressed in strips, so the image does not
+        have to fit in memory.
+        """
+        bounds = self.bounds
+        width, height = int(bounds.width), int(bounds.height)
+        if width <= 0 or height <= 0:
+            raise ValueError, 'Nothing to export'
+        strip_height = self.tile_size
+        strips = int(ceil(float(height) / strip_height))
+
+        f = open(filename, 'wb')
+        try:
+            writer = _PNGWriter(f, width, height)
+            for i in xrange(strips):
+                y = bounds.y + i * strip_height
+                area = Rectangle(bounds.x, y, width,
+                                 min(strip_height, bounds.y1 - y))
+                surface = self.render_tile(area, cairo.FORMAT_RGB24,
+                                           background)
+                for row in _rgb_rows(surface):
+                    writer.write_row(row)
+                del surface
+                self._report('render', i + 1, strips)
+            writer.close()
+        finally:
+            f.close()
+
+
+    def write_png_tiles(self, pattern, background=None):
+        """
+        Write the canvas to PNG files of ``tile_size`` x ``tile_size``
+        pixels. The file names are ``pattern % (column, row)``, e.g.
+        'tile-%d-%d.png'. The tiles are transparent, unless a
+        ``background`` color is provided. Returns the file names.
+        """
+        size = self.tile_size
+        tiles = list(self.tiles(size, size))
+        filenames = []
+        for i, (column, row, area) in enumerate(tiles):
+            filename = pattern % (column, row)
+            self.render_tile(area, background=background).write_to_png(filename)
+            filenames.append(filename)
+            self._report('render', i + 1, len(tiles))
+        return filenames
+
+
+    def _write_page(self, surface, area):
+        """
+        Render ``area`` as a page of (vector) ``surface``.
+        """
+        surface.set_device_offset(-area.x, -area.y)
+        cr = cairo.Context(surface)
+        self.render(cr, area)
+        cr.show_page()
+
+
+    def write_pdf(self, filename, page_size=None):
+        """
+        Write the canvas to a PDF file. If a ``page_size`` (width, height)
+        is provided, the canvas is split in pages of that size. By default
+        the canvas is written on one page.
+        """
+        b = self.bounds
+        width, height = page_size or (b.width, b.height)
+        tiles = list(self.tiles(width, height))
+        surface = cairo.PDFSurface(filename, width, height)
+        for i, (column, row, area) in enumerate(tiles):
+            self._write_page(surface, area)
+            self._report('render', i + 1, len(tiles))
+        surface.finish()
+
+
+    def write_svg(self, filename, page_size=None):
+        """
+        Write the canvas to an SVG file. If a ``page_size`` (width, height)
+        is provided, the canvas is split in files of that size, the file
+        names are ``filename % (column, row)``. Returns the file names.
+        """
+        b = self.bounds
+        width, height = page_size or (b.width, b.height)
+        filenames = []
+        tiles = list(self.tiles(width, height))
+        for i, (column, row, area) in enumerate(tiles):
+            name = page_size and filename % (column, row) or filename
+            surface = cairo.SVGSurface(name, width, height)
+            self._write_page(surface, area)
+            surface.finish()
+            filenames.append(name)
+            self._report('render', i + 1, len(tiles))
+        return filenames
+
+
+def _zoom_rect(rect, zoom):
+    """
+    Return rectangle ``rect`` zoomed by factor ``zoom``.
+
+    >>> _zoom_rect((10, 20, 30, 40), 2)
+    Rectangle(20, 40, 60, 80)
+    """
+    x, y, w, h = rect
+    return Rectangle(x * zoom, y * zoom, w * zoom, h * zoom)
+
+
+# The exporter of a worker process, see `_init_worker()`
+_worker = None
+
+
+def _init_worker(state):
+    """
+    Load the pickled (canvas, painter, scale, index, bounds, zoom) snapshot
+    of a `ParallelExporter` in a worker process. The worker renders at
+    ``scale`` times ``zoom``, the bounding boxes are zoomed accordingly.
+    """
+    global _worker
+    canvas, painter, scale, index, bounds, zoom = pickle.loads(state)
+    _worker = Exporter(canvas, painter, scale * zoom)
+    if zoom != 1.0:
+        zoomed = RTree()
+        for item in canvas.get_all_items():
+            if item in index:
+                zoomed.add(item, _zoom_rect(index.get_bounds(item), zoom))
+        index, bounds = zoomed, _zoom_rect(bounds, zoom)
+    _worker._index = index
+    _worker._bounds = bounds
+
+
+def _render_rgb(args):
+    area, background = args
+    return _rgb_rows(_worker.render_tile(area, cairo.FORMAT_RGB24, background))
+
+
+def _render_argb(area):
+    surface = _worker.render_tile(area)
+    return (surface.get_width(), surface.get_height(), surface.get_stride(),
+            str(surface.get_data()))
+
+
+def _write_png_tile(args):
+    area, filename, background = args
+    _worker.render_tile(area, background=background).write_to_png(filename)
+
+
+def _write_svg_tile(args):
+    area, filename, width, height = args
+    surface = cairo.SVGSurface(filename, width, height)
+    _worker._write_page(surface, area)
+    surface.finish()
+
+
+class ParallelExporter(Exporter):
+    """
+    Exporter that renders the tiles in ``processes`` worker processes (by
+    default one per CPU).
+
+    For each export the canvas, the painter and the bounding boxes of the
+    exporter are pickled and loaded in the workers.
+    Changes to the canvas made during an export are not exported. The
+    workers are stopped when the export is done.
+
+    `write_png()` and `write_pdf()` stitch the tiles rendered by the workers
+    in the current process, `write_png_tiles()` and `write_svg()` files
+    are written by the workers. Note that PDF pages are rendered as
+    images, at ``resolution`` pixels per inch (of 72 points).
+    """
+
+    def __init__(self, canvas, painter=None, scale=1.0, padding=0,
+                 tile_size=1024, progress=None, processes=None):
+        super(ParallelExporter, self).__init__(canvas, painter, scale,
+                                               padding, tile_size, progress)
+        self.processes = processes
+
+
+    def _imap(self, func, args, zoom=1.0):
+        """
+        Call ``func`` for each of ``args`` in the worker processes, iterate
+        the results in order. At most two tasks per worker are handed out
+        at a time, so finished tiles do not pile up in memory.
+
+        The workers render ``zoom`` times bigger than this exporter, areas
+        in ``args`` should be zoomed as well.
+        """
+        view = self.view
+        state = pickle.dumps((view.canvas, view.painter, self.scale,
+                              self._index, self.bounds, zoom),
+                             pickle.HIGHEST_PROTOCOL)
+        processes = self.processes or cpu_count()
+        pool = Pool(processes, _init_worker, (state,))
+        try:
+            batch = 2 * processes
+            for i in xrange(0, len(args), batch):
+                for result in pool.map(func, args[i:i + batch]):
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+    def write_png(self, filename, background=(1, 1, 1)):
+        """
+        Write the canvas to one PNG file, on a ``background`` color.
+        See `Exporter.write_png()`.
+        """
+        bounds = self.bounds
+        width, height = int(bounds.width), int(bounds.height)
+        if width <= 0 or height <= 0:
+            raise ValueError, 'Nothing to export'
+        size = self.tile_size
+        tiles = list(self.tiles(size, size))
+        columns = tiles[-1][0] + 1
+
+        f = open(filename, 'wb')
+        try:
+            writer = _PNGWriter(f, width, height)
+            tile_row = []
+            results = self._imap(_render_rgb,
+                                 [(area, background) for c, r, area in tiles])
+            for i, rows in enumerate(results):
+                tile_row.append(rows)
+                if len(tile_row) == columns:
+                    for parts in izip(*tile_row):
+                        writer.write_row(''.join(parts))
+                    del tile_row[:]
+                self._report('render', i + 1, len(tiles))
+            writer.close()
+        finally:
+            f.close()
+
+
+    def write_png_tiles(self, pattern, background=None):
+        """
+        See `Exporter.write_png_tiles()`.
+        """
+        size = self.tile_size
+        tiles = list(self.tiles(size, size))
+        filenames = [pattern % (column, row) for column, row, area in tiles]
+        results = self._imap(_write_png_tile,
+                             [(area, filename, background) for (c, r, area), filename
+                              in izip(tiles, filenames)])
+        for i, result in enumerate(results):
+            self._report('render', i + 1, len(tiles))
+        return filenames
+
+
+    def write_pdf(self, filename, page_size=None, resolution=72):
+        """
+        Write the canvas to a PDF file, the pages are rendered as images of
+        ``resolution`` pixels per inch. The ``page_size`` is in points, as
+        for `Exporter.write_pdf()`: the resolution does not change the size
+        of the pages, only the number of pixels rendered for them.
+        """
+        b = self.bounds
+        width, height = page_size or (b.width, b.height)
+        zoom = resolution / 72.0
+        points = 1.0 / zoom
+        tiles = list(self.tiles(width, height))
+        surface = cairo.PDFSurface(filename, width, height)
+        results = self._imap(_render_argb,
+                             [_zoom_rect(area, zoom) for c, r, area in tiles],
+                             zoom)
+        for i, (w, h, stride, data) in enumerate(results):
+            image = cairo.ImageSurface.create_for_data(array('B', data),
+                    cairo.FORMAT_ARGB32, w, h, stride)
+            cr = cairo.Context(surface)
+            cr.scale(points, points)
+            cr.set_source_surface(image, 0, 0)
+            cr.paint()
+            cr.show_page()
+            del cr, image
+            self._report('render', i + 1, len(tiles))
+        surface.finish()
+
+
+    def write_svg(self, filename, page_size=None):
+        """
+        See `Exporter.write_svg()`. Only SVG files split in pages are
+        written by the workers.
+        """
+        if not page_size:
+            return super(ParallelExporter, self).write_svg(filename)
+        tiles = list(self.tiles(*page_size))
+        filenames = [filename % (column, row) for column, row, area in tiles]
+        results = self._imap(_write_svg_tile,
+                             [(area, name) + tuple(page_size)
+                              for (c, r, area), name in izip(tiles, filenames)])
+        for i, result in enumerate(results):
+            self._report('render', i + 1, len(tiles))
+        return filenames
+
+
+# vim:sw=4:et:ai
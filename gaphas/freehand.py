@@ -163,7 +163,7 @@ class FreeHandPainter(object):
         self.subpainter.set_view(view)
 
     def paint(self, context):
-        subcontext = Context(cairo=FreeHandCairoContext(context.cairo, self.sloppiness), items=context.items, area=context.area)
+        subcontext = Context(cairo=FreeHandCairoContext(context.cairo, self.sloppiness), items=context.items, area=context.area, cacheable=getattr(context, 'cacheable', None))
         self.subpainter.paint(subcontext)
 
 
@@ -14,7 +14,7 @@ except ImportError:
     from weakset import WeakSet
 
 from matrix import Matrix
-from geometry import distance_line_point, distance_rectangle_point
+from geometry import Rectangle, distance_line_point, distance_rectangle_point
 from connector import Handle, LinePort
 from solver import solvable, WEAK, NORMAL, STRONG, VERY_STRONG, REQUIRED
 from constraint import EqualsConstraint, LessThanConstraint, LineConstraint, LineAlignConstraint
@@ -40,10 +40,16 @@ class Item(object):
     - _matrix_c2i:  canvas to item coordinates matrix
     - _matrix_i2v:  item to view coordinates matrices
     - _matrix_v2i:  view to item coordinates matrices
+    - _matrix_generation: canvas matrix update pass in which the matrices
+                    were last calculated
     - _sort_key:  used to sort items
     - _canvas_projections:  used to sort items
     """
 
+    # Distance the item draws outside of the bounding box of its handles.
+    # If set, `bounds()` is declared from the handles.
+    bounds_padding = None
+
     def __init__(self):
         self._canvas = None
         self._matrix = Matrix()
@@ -54,6 +60,7 @@ class Item(object):
         # used by gaphas.canvas.Canvas to hold conversion matrices
         self._matrix_i2c = None
         self._matrix_c2i = None
+        self._matrix_generation = 0
 
         # used by gaphas.view.GtkView to hold item 2 view matrices (view=key)
         self._matrix_i2v = WeakKeyDictionary()
@@ -192,6 +199,50 @@ class Item(object):
         """
         pass
 
+
+    def draw_proxy(self, context):
+        """
+        Render a simplified representation of the item. This method is
+        called instead of `draw()` if the item is drawn smaller than
+        `painter.ItemPainter.lod_size` pixels. Besides the attributes
+        described in `draw()`, the context contains:
+
+        - bounds: the bounds of the item (see `bounds()`, or else the
+          extents of its handles), in view coordinates
+
+        By default the bounding box is filled.
+        """
+        cr = context.cairo
+        cr.save()
+        try:
+            cr.identity_matrix()
+            cr.rectangle(*context.bounds)
+            cr.set_source_rgba(0, 0, 0, .2)
+            cr.fill()
+        finally:
+            cr.restore()
+
+
+    def bounds(self):
+        """
+        Declare the bounding box of the item, in item coordinates, as a
+        `geometry.Rectangle`. If None is returned, the item is drawn to
+        calculate its bounding box (see `painter.BoundingBoxPainter`).
+
+        By default the bounding box of the handles, expanded by
+        ``bounds_padding``, is declared if ``bounds_padding`` is set.
+        Items that only draw within that area can set ``bounds_padding``,
+        so they do not have to be drawn on every update.
+        """
+        padding = self.bounds_padding
+        if padding is None or not self._handles:
+            return None
+        xs = [float(h.pos.x) for h in self._handles]
+        ys = [float(h.pos.y) for h in self._handles]
+        b = Rectangle(min(xs), min(ys), x1=max(xs), y1=max(ys))
+        b.expand(padding)
+        return b
+
     
     def handles(self):
         """
@@ -279,7 +330,8 @@ class Item(object):
         Persist all, but calculated values (``_matrix_?2?``).
         """
         d = dict(self.__dict__)
-        for n in ('_matrix_i2c', '_matrix_c2i', '_matrix_i2v', '_matrix_v2i'):
+        for n in ('_matrix_i2c', '_matrix_c2i', '_matrix_i2v', '_matrix_v2i',
+                  '_matrix_generation'):
             try:
                 del d[n]
             except KeyError:
@@ -296,6 +348,7 @@ class Item(object):
             setattr(self, n, None)
         for n in ('_matrix_i2v', '_matrix_v2i'):
             setattr(self, n, WeakKeyDictionary())
+        self._matrix_generation = 0
         self.__dict__.update(state)
         self._canvas_projections = WeakSet(state['_canvas_projections'])
 
@@ -492,6 +545,10 @@ class Line(Item):
     draw_tail(context). The coordinate system is altered so the methods do
     not have to know about the angle of the line segment (e.g. drawing a line
     from (10, 10) via (0, 0) to (10, -10) will draw an arrow point).
+
+    Declared bounds (see `Item.bounds()`) include half the line width. Lines
+    that draw heads or tails bigger than that should set
+    ``bounds_padding`` to their size.
     """
 
     def __init__(self):
@@ -757,6 +814,29 @@ class Line(Item):
         ### cr.stroke()
 
 
+    def bounds(self):
+        """
+        See Item.bounds().
+        """
+        b = super(Line, self).bounds()
+        if b is not None:
+            b.expand(self.line_width / 2.)
+        return b
+
+
+    def draw_proxy(self, context):
+        """
+        Draw the line through the handles, without line ends.
+        See Item.draw_proxy(context).
+        """
+        cr = context.cairo
+        cr.set_line_width(self.line_width)
+        cr.move_to(*self._handles[0].pos)
+        for h in self._handles[1:]:
+            cr.line_to(*h.pos)
+        cr.stroke()
+
+
 
 __test__ = {
     'Line._set_orthogonal': Line._set_orthogonal,
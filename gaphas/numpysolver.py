@@ -0,0 +1,441 @@
+"""
+Constraint solver backend that solves batches of simple constraints with
+NumPy.
+
+Most constraints on a canvas are `EqualsConstraint`, `LessThanConstraint`,
+`CenterConstraint` and `BalanceConstraint` instances between plain
+`solver.Variable` objects. Instead of solving those one by one, the
+`NumpySolver` keeps the values of their variables in a float array and
+the constraints of each kind in an index array into it. The marked
+constraints are solved per kind with a few array operations. Other constraints (`EquationConstraint`, constraints with
+projections and custom constraints) are solved the normal way.
+
+Solving is done in waves: first all marked constraints are solved, then
+all constraints marked as a result of that, and so forth. As a consequence
+constraints that contradict each other may end up in a different state
+than with the default solver, which solves constraints one at a time.
+
+This module requires NumPy.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+from itertools import izip
+
+import numpy
+
+from gaphas.solver import Solver, Variable, WorkQueue, Projection, \
+        JuggleError, EPSILON, _sample_constraints
+from gaphas.state import observed, observers, reversible_pair
+from gaphas.constraint import EqualsConstraint, LessThanConstraint, \
+        CenterConstraint, BalanceConstraint
+
+
+#
+# Each batch solver takes an array of operand values (one row per
+# constraint) and an array of roles (the column of the weakest variable).
+# It returns the columns of the variables to update, the new values and a
+# mask telling which constraints need to update a variable (or None).
+#
+
+def solve_equals(values, roles):
+    """
+    ``a + delta = b``, the operands are ``(a, b, delta)``.
+
+    >>> values = numpy.array([[1., 2., 0.], [1., 2., 1.]])
+    >>> targets, new_values, mask = solve_equals(values, numpy.array([0, 1]))
+    >>> targets.tolist(), new_values.tolist(), mask
+    ([0, 1], [2.0, 2.0], None)
+    """
+    a, b, delta = values.T
+    return roles, numpy.where(roles == 0, b - delta, a + delta), None
+
+
+def solve_less_than(values, roles):
+    """
+    ``smaller <= bigger - delta``, the operands are
+    ``(smaller, bigger, delta)``. The weakest variable is left alone, the
+    other variable is updated.
+
+    >>> values = numpy.array([[3., 2., 0.], [10., 8., 5.], [1., 8., 5.]])
+    >>> targets, new_values, mask = solve_less_than(values, numpy.array([0, 1, 0]))
+    >>> targets.tolist(), new_values.tolist(), mask.tolist()
+    ([1, 0, 1], [3.0, 3.0, 6.0], [True, True, False])
+    """
+    smaller, bigger, delta = values.T
+    return (1 - roles,
+            numpy.where(roles == 0, smaller + delta, bigger - delta),
+            smaller > bigger - delta)
+
+
+def solve_center(values, roles):
+    """
+    ``center = (a + b) / 2``, the operands are ``(a, b, center)``.
+
+    >>> targets, new_values, mask = solve_center(numpy.array([[1., 3., 0.]]), numpy.array([0]))
+    >>> targets.tolist(), new_values.tolist(), mask
+    ([2], [2.0], None)
+    """
+    a, b, center = values.T
+    return numpy.zeros_like(roles) + 2, (a + b) / 2.0, None
+
+
+def solve_balance(values, roles):
+    """
+    Keep a variable at ``band[0] + (band[1] - band[0]) * balance``, the
+    operands are ``(band[0], band[1], v, balance)``.
+
+    >>> targets, new_values, mask = solve_balance(numpy.array([[2., 3., 2.4, .3]]), numpy.array([2]))
+    >>> targets.tolist(), new_values.tolist(), mask
+    ([2], [2.3], None)
+    """
+    b1, b2, v, balance = values.T
+    return roles, b1 + (b2 - b1) * balance, None
+
+
+# Constraint kinds that are solved in batches, as (constraint class,
+# function returning the operands, allowed roles, batch solver) tuples.
+# Only constraints of exactly this class are batched, since subclasses may
+# override solve_for().
+KINDS = (
+    (EqualsConstraint, lambda c: (c.a, c.b, c.delta), (0, 1), solve_equals),
+    (LessThanConstraint, lambda c: (c.smaller, c.bigger, c.delta), (0, 1), solve_less_than),
+    (CenterConstraint, lambda c: (c.a, c.b, c.center), (0, 1, 2), solve_center),
+    (BalanceConstraint, lambda c: (c.band[0], c.band[1], c.v, c.balance), (0, 1, 2), solve_balance),
+)
+
+
+class Batch(object):
+    """
+    The constraints of one kind, with the slots of their operands (see
+    `NumpySolver`) in an index array, one row per constraint. Rows are
+    reused: removing a constraint moves the last row in its place.
+
+    >>> b = Batch(KINDS[0])
+    >>> b.add('c1', (0, 1, 2))
+    >>> b.add('c2', (3, 4, 5))
+    >>> b.add('c3', (6, 7, 8))
+    >>> b.remove('c1').tolist()
+    [0, 1, 2]
+    >>> b.constraints, b.rows['c3']
+    (['c3', 'c2'], 0)
+    >>> b.index[:len(b)].tolist()
+    [[6, 7, 8], [3, 4, 5]]
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.constraints = []
+        self.rows = {}
+        self.index = None
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def add(self, constraint, slots):
+        row = len(self.constraints)
+        if self.index is None:
+            self.index = numpy.zeros((16, len(slots)), dtype=numpy.intp)
+        elif row == len(self.index):
+            index = numpy.zeros((row * 2, self.index.shape[1]), dtype=numpy.intp)
+            index[:row] = self.index
+            self.index = index
+        self.index[row] = slots
+        self.constraints.append(constraint)
+        self.rows[constraint] = row
+
+    def remove(self, constraint):
+        """
+        Remove a constraint, return the slots of its operands.
+        """
+        row = self.rows.pop(constraint)
+        slots = self.index[row].copy()
+        last = len(self.constraints) - 1
+        if row != last:
+            moved = self.constraints[last]
+            self.constraints[row] = moved
+            self.rows[moved] = row
+            self.index[row] = self.index[last]
+        self.constraints.pop()
+        return slots
+
+
+class NumpySolver(Solver):
+    """
+    Solver that solves batches of simple constraints with NumPy.
+
+    The values of the variables used by batched constraints are kept in
+    one float array. Each variable has a slot in this array, as does each
+    constant operand (e.g. a ``delta`` that's a plain number). Per
+    constraint kind a `Batch` holds the slots of the operands of its
+    constraints. Those are updated when constraints are added or removed,
+    so solving a wave only requires the rows of the marked constraints and
+    their weakest variables.
+
+    Variables changed outside the solver are copied into the array when
+    they're marked dirty (`request_resolve()`). Constant operands are read
+    when the constraint is added.
+
+    >>> from gaphas.solver import Variable, WEAK
+    >>> from gaphas.constraint import EquationConstraint
+    >>> a, b, c = Variable(1.0), Variable(2.0, WEAK), Variable(3.0, WEAK)
+    >>> s = NumpySolver()
+    >>> eq = s.add_constraint(EqualsConstraint(a, b))
+    >>> s.add_constraint(EquationConstraint(lambda b, c: b + c, b=b, c=c))
+    EquationConstraint(<lambda>, c=Variable(3, 10), b=Variable(2, 10))
+    >>> s.solve()
+    >>> a, b, c
+    (Variable(1, 20), Variable(1, 10), Variable(-1, 10))
+    >>> a.value = 4
+    >>> s.solve()
+    >>> a, b, c
+    (Variable(4, 20), Variable(4, 10), Variable(-4, 10))
+    >>> s.remove_constraint(eq)
+    >>> len(s._slots), s._free_slots
+    (0, [0, 1, 2])
+    """
+
+    max_waves = 100
+
+    # Smaller batches are solved one by one: for a few constraints
+    # NumPy's overhead outweighs the gain.
+    min_batch = 32
+
+    def __init__(self):
+        super(NumpySolver, self).__init__()
+        # Constraints marked during solving
+        self._next_wave = []
+        self._next_wave_set = set()
+
+        # Packed values, variable -> slot and slot -> variable mappings.
+        # Slots of constants map to None.
+        self._values = numpy.zeros(64)
+        self._slots = {}
+        self._slot_refs = {}
+        self._slot_variables = []
+        self._free_slots = []
+
+        # Batch per constraint class and constraint -> batch mapping
+        self._batches = dict((kind[0], Batch(kind)) for kind in KINDS)
+        self._batch_of = {}
+
+
+    def _alloc_slot(self, value, variable=None):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_variables[slot] = variable
+        else:
+            slot = len(self._slot_variables)
+            if slot == len(self._values):
+                values = numpy.zeros(slot * 2)
+                values[:slot] = self._values
+                self._values = values
+            self._slot_variables.append(variable)
+        self._values[slot] = value
+        return slot
+
+
+    def _operand_slot(self, op):
+        if isinstance(op, Variable):
+            try:
+                slot = self._slots[op]
+            except KeyError:
+                slot = self._slots[op] = self._alloc_slot(op._value, op)
+                self._slot_refs[op] = 1
+            else:
+                self._slot_refs[op] += 1
+            return slot
+        return self._alloc_slot(float(op))
+
+
+    def _release_slot(self, slot):
+        v = self._slot_variables[slot]
+        if v is not None:
+            refs = self._slot_refs[v] - 1
+            if refs:
+                self._slot_refs[v] = refs
+                return
+            del self._slots[v]
+            del self._slot_refs[v]
+            self._slot_variables[slot] = None
+        self._free_slots.append(slot)
+
+
+    @observed
+    def add_constraint(self, constraint):
+        """
+        See `Solver.add_constraint()`. Constraints that can be solved in
+        batches are packed.
+        """
+        super(NumpySolver, self).add_constraint(constraint)
+        batch = self._batches.get(type(constraint))
+        if batch is not None and not constraint._solver_has_projections \
+                and constraint not in self._batch_of:
+            operands = batch.kind[1](constraint)
+            if all(isinstance(op, Variable) or not hasattr(op, 'strength')
+                   for op in operands):
+                batch.add(constraint, map(self._operand_slot, operands))
+                self._batch_of[constraint] = batch
+        return constraint
+
+
+    @observed
+    def remove_constraint(self, constraint):
+        """
+        See `Solver.remove_constraint()`.
+        """
+        super(NumpySolver, self).remove_constraint(constraint)
+        batch = self._batch_of.pop(constraint, None)
+        if batch is not None:
+            map(self._release_slot, batch.remove(constraint))
+
+    reversible_pair(add_constraint, remove_constraint)
+
+
+    def _mark(self, c):
+        if c not in self._next_wave_set:
+            self._next_wave_set.add(c)
+            self._next_wave.append(c)
+
+
+    def request_resolve(self, variable, projections_only=False):
+        """
+        See `Solver.request_resolve()`. The value of the variable is copied
+        to the packed values. During solving, constraints are queued for
+        the next wave.
+        """
+        while isinstance(variable, Projection):
+            variable = variable.variable()
+        slot = self._slots.get(variable)
+        if slot is not None:
+            self._values[slot] = variable._value
+
+        if not self._solving:
+            return super(NumpySolver, self).request_resolve(variable, projections_only)
+
+        for c in variable._constraints:
+            if not projections_only or c._solver_has_projections:
+                c.mark_dirty(variable)
+                self._mark(c)
+
+
+    def request_resolve_constraint(self, c):
+        if self._solving:
+            self._mark(c)
+        else:
+            super(NumpySolver, self).request_resolve_constraint(c)
+
+
+    def solve_batch(self, batch, constraints):
+        """
+        Solve ``constraints``, all in ``batch``, on the packed values.
+
+        Returns the constraints that can not be solved as a batch (because
+        the weakest variable has another role).
+        """
+        cls, operands, roles, batch_solver = batch.kind
+        n = len(constraints)
+        rows = batch.rows
+        slots = self._slots
+        index = batch.index[numpy.fromiter((rows[c] for c in constraints),
+                                           numpy.intp, n)]
+        weakest = numpy.fromiter((slots[c.weakest()] for c in constraints),
+                                 numpy.intp, n)
+        role = (index == weakest[:, numpy.newaxis]).argmax(1)
+        batched = role < len(roles)
+        rest = [constraints[i] for i in numpy.flatnonzero(~batched)]
+        if rest:
+            index, role = index[batched], role[batched]
+            if not len(role):
+                return rest
+
+        all_values = self._values
+        values = all_values[index]
+        targets, new_values, mask = batch_solver(values, role)
+        rng = numpy.arange(len(role))
+        old_values = values[rng, targets]
+        changed = numpy.abs(new_values - old_values) > EPSILON
+        if mask is not None:
+            changed &= mask
+
+        target_slots = index[rng, targets][changed]
+        new_values = new_values[changed]
+        all_values[target_slots] = new_values
+
+        # Copy the values to the variables and mark the dependent
+        # constraints for the next wave
+        variables = self._slot_variables
+        changes = izip(target_slots.tolist(), new_values.tolist())
+        if observers:
+            for slot, value in changes:
+                variables[slot].value = value
+        else:
+            # Nobody records the changes (e.g. for undo), so the
+            # variables can be updated directly
+            mark = self._mark
+            for slot, value in changes:
+                v = variables[slot]
+                v._value = value
+                for c in v._constraints:
+                    c.mark_dirty(v)
+                    mark(c)
+        return rest
+
+
+    def solve(self):
+        """
+        Solve the marked constraints, in waves.
+        """
+        wave = self._marked_cons
+        self._marked_cons = WorkQueue()
+        waves = 0
+        batch_of = self._batch_of
+        try:
+            self._solving = True
+            while wave:
+                waves += 1
+                if waves > self.max_waves:
+                    raise JuggleError, 'Variable juggling detected, %s are still dirty after %d waves' % (_sample_constraints(wave), self.max_waves)
+
+                self._next_wave = []
+                self._next_wave_set = set()
+
+                marked = dict((batch, []) for batch in self._batches.itervalues())
+                others = []
+                seen = set()
+                for c in wave:
+                    if c in seen or c.disabled:
+                        continue
+                    seen.add(c)
+                    batch = batch_of.get(c)
+                    if batch is None:
+                        others.append(c)
+                    else:
+                        marked[batch].append(c)
+
+                for batch, constraints in marked.iteritems():
+                    if len(constraints) >= self.min_batch:
+                        others.extend(self.solve_batch(batch, constraints))
+                    else:
+                        others.extend(constraints)
+
+                for c in others:
+                    c.solve()
+
+                wave = self._next_wave
+        except:
+            # Keep the constraints that still need solving marked
+            marked_cons = self._marked_cons
+            for c in wave:
+                marked_cons.move_to_end(c)
+            for c in self._next_wave:
+                marked_cons.move_to_end(c)
+            raise
+        finally:
+            self._solving = False
+            self._next_wave = []
+            self._next_wave_set = set()
+
+
+# vim:sw=4:et:ai
@@ -10,6 +10,8 @@ and handles).
 __version__ = "$Revision$"
 # $HeadURL$
 
+from timeit import default_timer as timer
+
 from cairo import Matrix, ANTIALIAS_NONE, LINE_JOIN_ROUND
 
 from gaphas.canvas import Context
@@ -27,14 +29,29 @@ TOLERANCE = 0.8
 class Painter(object):
     """
     Painter interface.
+
+    Painters that draw at a fixed position in the view (e.g. an overlay), or
+    draw something that changes without the view being invalidated, should
+    not be ``cacheable``. When the view is rendered in tiles (see
+    `tilecache.TileCache`), they are painted on top of the tiles.
     """
 
+    cacheable = True
+
     def __init__(self, view=None):
         self.view = view
 
     def set_view(self, view):
         self.view = view
 
+    def __getstate__(self):
+        """
+        Persist painter settings. The view is not saved.
+        """
+        d = dict(self.__dict__)
+        d['view'] = None
+        return d
+
     def paint(self, context):
         """
         Do the paint action (called from the View).
@@ -73,10 +90,14 @@ class PainterChain(Painter):
 
     def paint(self, context):
         """
-        See Painter.paint().
+        See Painter.paint(). If the context has a ``cacheable`` flag set
+        (True or False), only the painters that are (not) cacheable paint.
         """
+        cacheable = getattr(context, 'cacheable', None)
         for painter in self._painters:
-            painter.paint(context)
+            if cacheable is None or isinstance(painter, PainterChain) \
+                    or getattr(painter, 'cacheable', True) == cacheable:
+                painter.paint(context)
 
 
 class DrawContext(Context):
@@ -93,17 +114,74 @@ class DrawContext(Context):
 
 
 class ItemPainter(Painter):
+    """
+    Draw the items. Items whose declared bounds (or else their handles)
+    span less than ``lod_size`` pixels in both directions are drawn as
+    simplified proxies (see `item.Item.draw_proxy()`). By default items
+    are always drawn in full detail.
+    """
 
     draw_all = False
 
+    # Name under which draw() calls are recorded in the canvas' costs
+    cost_name = 'draw'
+
+    # Paint items from the view's item cache, if it has one
+    use_item_cache = True
+
+    lod_size = 0
+
+    def __init__(self, view=None, lod_size=None):
+        super(ItemPainter, self).__init__(view)
+        if lod_size is not None:
+            self.lod_size = lod_size
+
+    def _item_extents(self, item):
+        """
+        Return the extents of ``item`` in view coordinates, as declared by
+        ``item.bounds()`` or else the extents of its handles. Unlike the
+        bounding box in the view, no margin is added for the handles.
+        Returns None if the item has no extents.
+        """
+        bounds = item.bounds()
+        if bounds is None:
+            points = [tuple(h.pos) for h in item.handles()]
+            if not points:
+                return None
+        else:
+            points = [(x, y) for x in (bounds.x, bounds.x1)
+                             for y in (bounds.y, bounds.y1)]
+        i2v = self.view.get_matrix_i2v(item).transform_point
+        xs, ys = zip(*[i2v(x, y) for x, y in points])
+        return Rectangle(min(xs), min(ys), x1=max(xs), y1=max(ys))
+
     def _draw_item(self, item, cairo, area=None):
+        view = self.view
+        lod_size = self.lod_size
+        if lod_size:
+            bounds = self._item_extents(item)
+            if bounds is not None and bounds.width < lod_size \
+                    and bounds.height < lod_size:
+                self._render_item(item, cairo, area, proxy_bounds=bounds)
+                return
+        item_cache = view.item_cache
+        if item_cache is not None and self.use_item_cache \
+                and item_cache.paint(cairo, self, item):
+            return
+        self._render_item(item, cairo, area)
+
+    def _render_item(self, item, cairo, area=None, proxy_bounds=None):
+        """
+        Draw the item. If ``proxy_bounds`` are provided, a simplified
+        representation of the item is drawn in those bounds.
+        """
         view = self.view
         cairo.save()
         try:
             cairo.set_matrix(view.matrix)
             cairo.transform(view.canvas.get_matrix_i2c(item))
 
-            item.draw(DrawContext(painter=self,
+            context = DrawContext(painter=self,
                                   cairo=cairo,
                                   _area=area,
                                   _item=item,
@@ -111,7 +189,21 @@ class ItemPainter(Painter):
                                   focused=(item is view.focused_item),
                                   hovered=(item is view.hovered_item),
                                   dropzone=(item is view.dropzone_item),
-                                  draw_all=self.draw_all))
+                                  draw_all=self.draw_all,
+                                  bounds=proxy_bounds)
+            if proxy_bounds is None:
+                draw, name = item.draw, self.cost_name
+            else:
+                draw, name = item.draw_proxy, 'draw_proxy'
+            costs = view.canvas.costs
+            if costs is None:
+                draw(context)
+            else:
+                start = timer()
+                try:
+                    draw(context)
+                finally:
+                    costs.add(type(item), name, timer() - start)
 
         finally:
             cairo.restore()
@@ -247,24 +339,54 @@ class BoundingBoxPainter(ItemPainter):
     """
     This specific case of an ItemPainter is used to calculate the bounding
     boxes (in canvas coordinates) for the items.
+
+    The bounding box covers what the item draws and its handles. It does
+    not include the size of the handles, since that does not scale with the
+    view: views add a margin (`view.View.bounding_box_margin`) themselves.
+
+    Items that declare their bounding box (see `item.Item.bounds()`) are not
+    drawn.
     """
 
     draw_all = True
 
-    def _draw_item(self, item, cairo, area=None):
-        cairo = CairoBoundingBoxContext(cairo)
-        super(BoundingBoxPainter, self)._draw_item(item, cairo)
-        bounds = cairo.get_bounds()
+    cost_name = 'bounding_box'
 
-        # Update bounding box with handles.
+    use_item_cache = False
+
+    lod_size = 0
+
+    def get_bounds(self, item, cairo):
+        """
+        Return the bounding box of ``item`` in view coordinates.
+        """
         view = self.view
         i2v = view.get_matrix_i2v(item).transform_point
-        for h in item.handles():
-            cx, cy = i2v(*h.pos)
-            bounds += (cx - 5, cy - 5, 9, 9)
+        costs = view.canvas.costs
+        if costs is None:
+            declared = item.bounds()
+        else:
+            declared = costs.call(item, 'bounds')
 
-        bounds.expand(1)
-        view.set_item_bounding_box(item, bounds)
+        if declared is None:
+            cairo = CairoBoundingBoxContext(cairo)
+            super(BoundingBoxPainter, self)._draw_item(item, cairo)
+            drawn = cairo.get_bounds()
+            points = drawn and [(drawn.x, drawn.y), (drawn.x1, drawn.y1)] or []
+        else:
+            points = [i2v(x, y) for x in (declared.x, declared.x1)
+                                for y in (declared.y, declared.y1)]
+
+        # Update bounding box with handles.
+        points.extend(i2v(*h.pos) for h in item.handles())
+        if not points:
+            points.append(i2v(0, 0))
+        xs, ys = zip(*points)
+        return Rectangle(min(xs), min(ys), x1=max(xs), y1=max(ys))
+
+
+    def _draw_item(self, item, cairo, area=None):
+        self.view.set_item_bounding_box(item, self.get_bounds(item, cairo))
 
 
     def _draw_items(self, items, cairo, area=None):
@@ -372,6 +494,45 @@ class FocusedItemPainter(Painter):
             PaintFocused(item, view).paint(context)
 
 
+class CostPainter(Painter):
+    """
+    Debug painter that shows the most expensive item classes, as recorded
+    by the `tracer.ItemCosts` set on the canvas, in the top left corner of
+    the view. Nothing is drawn if the canvas has no costs set.
+
+    The costs are drawn at a fixed position in the view, so they are not
+    cached in tiles.
+    """
+
+    cacheable = False
+
+    def __init__(self, view=None, count=5):
+        super(CostPainter, self).__init__(view)
+        self.count = count
+
+    def paint(self, context):
+        costs = self.view.canvas.costs
+        if costs is None:
+            return
+        lines = costs.report(self.count)
+        if not lines:
+            return
+        cairo = context.cairo
+        cairo.save()
+        cairo.identity_matrix()
+        cairo.set_font_size(10)
+        height = 13
+        width = max(cairo.text_extents(line)[4] for line in lines)
+        cairo.rectangle(4, 4, width + 8, height * len(lines) + 6)
+        cairo.set_source_rgba(1, 1, 1, .8)
+        cairo.fill()
+        cairo.set_source_rgb(.5, 0, 0)
+        for i, line in enumerate(lines):
+            cairo.move_to(8, 4 + height * (i + 1))
+            cairo.show_text(line)
+        cairo.restore()
+
+
 def DefaultPainter(view=None):
     """
     Default painter, containing item, handle and tool painters.
@@ -0,0 +1,197 @@
+"""
+Solve independent constraint components in a pool of worker processes.
+
+The `ParallelSolver` is meant for batch jobs that (re)generate big
+diagrams. When many components are dirty, for example after a bulk import,
+components are packed in compact arrays (variable values, strengths and
+constraint operands), solved in worker processes and the results are
+written back in one batch.
+
+Only components consisting of `EqualsConstraint`, `LessThanConstraint`,
+`CenterConstraint` and `BalanceConstraint` instances between plain
+variables can be packed. Components with other constraints (e.g.
+`EquationConstraint`, which holds a function, or constraints with
+projections) are solved in the current process, as usual.
+
+Values written back from the workers do not mark variables dirty and are
+not recorded by the undo manager. Instead, the ``notify`` callback is
+called once with all changed variables, so an application can request an
+update once per item.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+from array import array
+from itertools import izip
+from multiprocessing import Pool
+
+from gaphas.solver import Solver, WorkQueue, Variable, EPSILON
+from gaphas.constraint import EqualsConstraint, LessThanConstraint, \
+        CenterConstraint, BalanceConstraint
+
+
+# Constraint kinds that can be packed, as (constraint class, function
+# returning the operands, function creating a constraint from operands)
+# tuples. Only constraints of exactly this class are packed, since
+# subclasses may override solve_for().
+KINDS = (
+    (EqualsConstraint, lambda c: (c.a, c.b, c.delta), EqualsConstraint),
+    (LessThanConstraint, lambda c: (c.smaller, c.bigger, c.delta), LessThanConstraint),
+    (CenterConstraint, lambda c: (c.a, c.b, c.center), CenterConstraint),
+    (BalanceConstraint, lambda c: (c.band[0], c.band[1], c.v, c.balance),
+            lambda b1, b2, v, balance: BalanceConstraint((b1, b2), v, balance)),
+)
+
+KIND_INDEX = dict((kind[0], i) for i, kind in enumerate(KINDS))
+
+
+def pack(variables, constraints, marked):
+    """
+    Pack a component in plain data: a tuple of (values, strengths,
+    constraints, marked). Variables are referred to by their index in
+    ``variables``, other operands are stored as floats. For each
+    constraint also the order of its weakest variables list is stored.
+    Returns None if the component can not be packed.
+
+    >>> a, b = Variable(1), Variable(2)
+    >>> eq = EqualsConstraint(a, b, delta=1)
+    >>> pack([a, b], [eq], [eq])
+    (array('d', [1.0, 2.0]), array('i', [20, 20]), [(0, (0, 1, 1.0), [0, 1])], [0])
+    """
+    index = dict((v, i) for i, v in enumerate(variables))
+
+    def operand(op):
+        if isinstance(op, Variable):
+            return index[op]
+        return float(op)
+
+    packed = []
+    for c in constraints:
+        kind = KIND_INDEX.get(type(c))
+        if kind is None or c._solver_has_projections:
+            return None
+        operands = tuple(operand(op) for op in KINDS[kind][1](c))
+        packed.append((kind, operands, [index[v] for v in c._weakest]))
+    cindex = dict((c, i) for i, c in enumerate(constraints))
+    return (array('d', (v._value for v in variables)),
+            array('i', (v._strength for v in variables)),
+            packed,
+            [cindex[c] for c in marked])
+
+
+def solve_packed(component):
+    """
+    Solve a packed component (see `pack()`) and return the new values and
+    the number of constraints solved. This function is run in the worker
+    processes.
+
+    >>> a, b = Variable(1), Variable(2)
+    >>> eq = EqualsConstraint(a, b, delta=1)
+    >>> a.value = 4
+    >>> eq.mark_dirty(a)
+    >>> solve_packed(pack([a, b], [eq], [eq]))
+    (array('d', [4.0, 5.0]), 2)
+
+    The constraint is solved twice, since it marks itself dirty.
+    """
+    values, strengths, packed, marked = component
+    variables = [Variable(value, strength) for value, strength in izip(values, strengths)]
+    solver = Solver()
+    constraints = []
+    for kind, operands, weakest in packed:
+        c = KINDS[kind][2](*[type(op) is int and variables[op] or op for op in operands])
+        c._weakest = [variables[i] for i in weakest]
+        solver.add_constraint(c)
+        constraints.append(c)
+    solver._marked_cons = WorkQueue(constraints[i] for i in marked)
+    solver.solve()
+    return (array('d', (v._value for v in variables)),
+            sum(component.constraint_solve_count for component in solver.components()))
+
+
+class ParallelSolver(Solver):
+    """
+    Solver that solves big, independent components in worker processes.
+    Components with less than ``min_size`` constraints are solved in the
+    current process; workers are used only if at least two components are
+    to be solved that way.
+
+    The pool of worker processes is created when it's needed first. Call
+    `close()` to stop the workers.
+    """
+
+    min_size = 50
+
+    def __init__(self, processes=None, notify=None):
+        super(ParallelSolver, self).__init__()
+        self._processes = processes
+        self._notify = notify
+        self._pool = None
+
+    def __getstate__(self):
+        d = super(ParallelSolver, self).__getstate__()
+        d['_pool'] = None
+        return d
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def solve(self):
+        """
+        Solve the marked constraints. Big components are packed and solved
+        in the worker processes, the other constraints are solved as usual.
+        """
+        jobs = []
+        local = []
+        for component, marked in self._components.partition(self._marked_cons):
+            if component is not None and len(component) >= self.min_size:
+                variables = list(component.variables)
+                packed = pack(variables, list(component.constraints), marked)
+                if packed:
+                    jobs.append((component, variables, packed, marked))
+                    continue
+            local.extend(marked)
+
+        if len(jobs) < 2:
+            # Not worth the trouble, solve everything right here
+            super(ParallelSolver, self).solve()
+            return
+
+        self._marked_cons = WorkQueue(local)
+        try:
+            super(ParallelSolver, self).solve()
+
+            if not self._pool:
+                self._pool = Pool(self._processes)
+            results = self._pool.map(solve_packed, [job[2] for job in jobs])
+        except:
+            # The unsolved local constraints are still marked, keep the
+            # constraints of the packed components marked, too.
+            marked_cons = self._marked_cons
+            for job in jobs:
+                for c in job[3]:
+                    marked_cons.append(c)
+            raise
+
+        # Write back the values in one go
+        changed = []
+        for (component, variables, packed, marked), (values, count) in izip(jobs, results):
+            for v, value in izip(variables, values):
+                if abs(v._value - value) > EPSILON:
+                    v._value = value
+                    changed.append(v)
+            component.solve_count += 1
+            component.constraint_solve_count += count
+
+        if changed and self._notify:
+            self._notify(changed)
+
+
+# vim:sw=4:et:ai
@@ -21,11 +21,13 @@ common features:
 __version__ = "$Revision$"
 # $HeadURL$
 
-import operator
+from heapq import heappush, heappop
 from geometry import rectangle_contains, rectangle_intersects, rectangle_clip
+from geometry import distance_rectangle_point
+from spatialindex import SpatialIndex
 
 
-class Quadtree(object):
+class Quadtree(SpatialIndex):
     """
     The Quad-tree.
 
@@ -79,6 +81,8 @@ class Quadtree(object):
     ['12', '13', '14', '15']
     >>> sorted([qtree.get_bounds(item) for item in qtree.find_intersect((40, 40, 20, 20))])
     [(48, 30, 10, 10), (52, 40, 10, 10), (56, 50, 10, 10), (60, 60, 10, 10)]
+    >>> qtree.find_nearest((95, 95))
+    '17'
     >>> qtree.rebuild()
     """
 
@@ -91,11 +95,12 @@ class Quadtree(object):
         
         Capacity defines the number of elements in one tree bucket (default: 10)
         """
+        super(Quadtree, self).__init__()
         self._capacity = capacity
         self._bucket = QuadtreeBucket(bounds, capacity)
 
-        # Easy lookup item->(bounds, data, clipped bounds) mapping
-        self._ids = dict()
+        # Easy lookup item->(bounds, data, clipped bounds) mapping is
+        # kept in self._ids
 
 
     bounds = property(lambda s: s._bucket.bounds)
@@ -130,17 +135,7 @@ class Quadtree(object):
         >>> qtree.bounds
         (0, 0, 0, 0)
         """
-        x_y_w_h = zip(*map(operator.getitem, self._ids.itervalues(), [0] * len(self._ids)))
-        if not x_y_w_h:
-            return 0, 0, 0, 0
-        x0 = min(x_y_w_h[0])
-        y0 = min(x_y_w_h[1])
-        add = operator.add
-        x1 = max(map(add, x_y_w_h[0], x_y_w_h[2]))
-        y1 = max(map(add, x_y_w_h[1], x_y_w_h[3]))
-        return (x0, y0, x1 - x0, y1 - y0)
-
-    soft_bounds = property(get_soft_bounds)
+        return super(Quadtree, self).get_soft_bounds()
 
 
     def add(self, item, bounds, data=None):
@@ -206,20 +201,6 @@ class Quadtree(object):
             self._ids[item] = (bounds, data, clipped_bounds)
 
 
-    def get_bounds(self, item):
-        """
-        Return the bounding box for the given item.
-        """
-        return self._ids[item][0]
-
-
-    def get_data(self, item):
-        """
-        Return the data for the given item, None if no data was provided.
-        """
-        return self._ids[item][1]
-
-
     def get_clipped_bounds(self, item):
         """
         Return the bounding box for the given item. The bounding box is clipped
@@ -244,20 +225,29 @@ class Quadtree(object):
         Returns a set.
         """
         return set(self._bucket.find(rect, method=rectangle_intersects))
-        
-
-    def __len__(self):
-        """
-        Return number of items in tree.
-        """
-        return len(self._ids)
 
 
-    def __contains__(self, item):
+    def find_nearest(self, pos):
         """
-        Check if an item is in tree.
+        Find the item closest to point ``pos``. Only the part of the items
+        within the bounds of the tree are considered.
+
+        Buckets are visited closest first, so only buckets that may contain
+        a closer item than the one found so far are examined.
         """
-        return item in self._ids
+        queue = [(distance_rectangle_point(self._bucket.bounds, pos), 0, False, self._bucket)]
+        n = 1
+        while queue:
+            d, _, is_item, obj = heappop(queue)
+            if is_item:
+                return obj
+            for item, bounds in obj.items.iteritems():
+                heappush(queue, (distance_rectangle_point(bounds, pos), n, True, item))
+                n += 1
+            for bucket in obj._buckets:
+                heappush(queue, (distance_rectangle_point(bucket.bounds, pos), n, False, bucket))
+                n += 1
+        return None
 
 
     def dump(self):
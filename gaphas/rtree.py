@@ -0,0 +1,481 @@
+"""
+R-tree
+======
+
+An R-tree groups nearby objects and represents them with their minimum
+bounding rectangle in the next higher level of the tree. Unlike a
+quadtree, an R-tree does not partition a fixed area: it follows the data,
+so it handles unbounded coordinates and big items just as well.
+
+This implementation builds the tree with the Sort-Tile-Recursive (STR)
+bulk loading algorithm on `RTree.rebuild()`. Items added afterwards are
+inserted in the node that needs the least enlargement, nodes are split
+in half along their longest axis when they overflow.
+
+New items are added to the tree when the tree is queried. If more items
+are added than there are in the tree, the tree is bulk loaded again.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+from math import ceil, sqrt
+from heapq import heappush, heappop
+from spatialindex import SpatialIndex
+
+
+class RTreeNode(object):
+    """
+    A node in an R-tree. The children of a leaf node are items, the
+    children of other nodes are nodes. The box is the bounding box of all
+    children, as (x0, y0, x1, y1) (or None for an empty node).
+    """
+
+    __slots__ = ('leaf', 'parent', 'children', 'box')
+
+    def __init__(self, leaf, children=None):
+        self.leaf = leaf
+        self.parent = None
+        self.children = children or []
+        self.box = None
+
+
+def union(boxes):
+    """
+    Return the bounding box of a sequence of boxes (x0, y0, x1, y1).
+
+    >>> union([(0, 0, 10, 10), (-5, 5, 8, 20)])
+    (-5, 0, 10, 20)
+    """
+    x0s, y0s, x1s, y1s = zip(*boxes)
+    return min(x0s), min(y0s), max(x1s), max(y1s)
+
+
+def box_distance(box, pos):
+    """
+    Distance (fast) from a box (x0, y0, x1, y1) to a point, like
+    `geometry.distance_rectangle_point()`.
+
+    >>> box_distance((0, 0, 10, 10), (11, -1))
+    2
+    >>> box_distance((0, 0, 10, 10), (5, 5))
+    0
+    """
+    x0, y0, x1, y1 = box
+    px, py = pos
+    return max(x0 - px, 0, px - x1) + max(y0 - py, 0, py - y1)
+
+
+def _center(entry):
+    # Sort key for (box, child) entries
+    x0, y0, x1, y1 = entry[0]
+    return x0 + x1, y0 + y1
+
+
+class RTree(SpatialIndex):
+    """
+    An R-tree.
+
+    Rectangles use the same scheme throughout Gaphas: (x, y, width, height).
+
+    >>> rtree = RTree(capacity=4)
+    >>> for i in range(20):
+    ...     rtree.add('%d' % i, ((i * 4) % 90, (i * 10) % 90, 10, 10))
+    >>> len(rtree)
+    20
+    >>> rtree.rebuild()
+    >>> rtree.dump() # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+     <...RTreeNode object at 0x...> (0, 0, 86, 90)
+       <...RTreeNode object at 0x...> (0, 0, 86, 90)
+         <...RTreeNode object at 0x...> (0, 0, 50, 20)
+           0 (0, 0, 10, 10)
+           1 (4, 10, 14, 20)
+           10 (40, 10, 50, 20)
+           9 (36, 0, 46, 10)
+         <...RTreeNode object at 0x...> (48, 0, 86, 50)
+         ...
+
+    Items are not bound to an area:
+
+    >>> rtree.add('far', (-1000, 2000, 10, 10))
+    >>> rtree.soft_bounds
+    (-1000, 0, 1086, 2010)
+
+    Find all items in a section of the tree:
+
+    >>> sorted(rtree.find_inside((40, 40, 40, 40)))
+    ['13', '14', '15', '16']
+    >>> sorted(rtree.find_intersect((40, 40, 20, 20)))
+    ['12', '13', '14', '15']
+    >>> rtree.find_nearest((-900, 1900))
+    'far'
+    """
+
+    def __init__(self, bounds=None, capacity=16):
+        """
+        Create a new R-tree. ``bounds`` is accepted for compatibility with
+        `quadtree.Quadtree`, but not used: the tree is not bound to an area.
+
+        Capacity defines the maximum number of children per node (default:
+        16).
+        """
+        super(RTree, self).__init__()
+        assert capacity > 1
+        self._capacity = capacity
+        self._root = RTreeNode(leaf=True)
+
+        # Item -> (bounds, data, box), item -> leaf node mappings
+        self._leaves = dict()
+
+        # Items not yet in the tree
+        self._pending = set()
+
+
+    def __getstate__(self):
+        """
+        Persist the items only, the tree is built again when it's queried.
+        """
+        return self._capacity, self._ids
+
+
+    def __setstate__(self, state):
+        capacity, ids = state
+        self.__init__(capacity=capacity)
+        self._ids = ids
+        self._pending.update(ids)
+
+
+    bounds = property(lambda s: s.get_soft_bounds())
+
+
+    def get_soft_bounds(self):
+        """
+        Calculate the size of all items in the tree.
+
+        >>> rtree = RTree()
+        >>> rtree.add('1', (10, 20, 30, 40))
+        >>> rtree.add('2', (20, 30, 40, 10))
+        >>> rtree.soft_bounds
+        (10, 20, 50, 40)
+        """
+        self._flush()
+        box = self._root.box
+        if not box:
+            return 0, 0, 0, 0
+        x0, y0, x1, y1 = box
+        return x0, y0, x1 - x0, y1 - y0
+
+
+    def add(self, item, bounds, data=None):
+        """
+        Add an item to the tree.
+        If an item already exists, its bounds are updated.
+        Data can be used to add some extra info to the item
+        """
+        x, y, w, h = bounds
+        box = (x, y, x + w, y + h)
+        leaf = self._leaves.get(item)
+        if leaf:
+            lx0, ly0, lx1, ly1 = leaf.box
+            # Fast lane, if item still fits in its leaf node, keep it there
+            if lx0 <= box[0] and ly0 <= box[1] and lx1 >= box[2] and ly1 >= box[3]:
+                self._ids[item] = (bounds, data, box)
+                self._tighten(leaf)
+                return
+            self.remove(item)
+        self._ids[item] = (bounds, data, box)
+        self._pending.add(item)
+
+
+    def remove(self, item):
+        """
+        Remove an item from the tree.
+        """
+        del self._ids[item]
+        if item in self._pending:
+            self._pending.remove(item)
+            return
+        node = self._leaves.pop(item)
+        node.children.remove(item)
+
+        # Remove empty nodes
+        while not node.children and node.parent:
+            parent = node.parent
+            parent.children.remove(node)
+            node = parent
+        self._tighten(node)
+
+        # Shorten the tree
+        root = self._root
+        while not root.leaf and len(root.children) == 1:
+            root = root.children[0]
+            root.parent = None
+        if not root.children:
+            root = RTreeNode(leaf=True)
+        self._root = root
+
+
+    def clear(self):
+        """
+        Remove all items from the tree.
+        """
+        self._root = RTreeNode(leaf=True)
+        self._ids.clear()
+        self._leaves.clear()
+        self._pending.clear()
+
+
+    def _flush(self):
+        """
+        Add pending items to the tree.
+        """
+        pending = self._pending
+        if len(pending) > len(self._leaves):
+            self.rebuild()
+        elif pending:
+            ids = self._ids
+            for item in pending:
+                self._insert(item, ids[item][2])
+            pending.clear()
+
+
+    def rebuild(self):
+        """
+        Rebuild the tree structure, using STR bulk loading.
+        """
+        ids = self._ids
+        entries = [(box, item) for item, (bounds, data, box) in ids.iteritems()]
+        self._leaves.clear()
+        self._pending.clear()
+        if not entries:
+            self._root = RTreeNode(leaf=True)
+            return
+
+        nodes = self._pack(entries, leaf=True)
+        for node in nodes:
+            for item in node.children:
+                self._leaves[item] = node
+        while len(nodes) > 1:
+            nodes = self._pack([(node.box, node) for node in nodes], leaf=False)
+            for node in nodes:
+                for child in node.children:
+                    child.parent = node
+        self._root = nodes[0]
+        self._root.parent = None
+
+
+    def _pack(self, entries, leaf):
+        """
+        Pack a list of (box, child) entries in nodes (Sort-Tile-Recursive):
+        entries are sorted on x and divided in vertical slices, each slice
+        is sorted on y and divided in nodes.
+        """
+        capacity = self._capacity
+        count = int(ceil(len(entries) / float(capacity)))
+        slice_size = int(ceil(sqrt(count))) * capacity
+        entries.sort(key=lambda e: _center(e)[0])
+        nodes = []
+        for i in xrange(0, len(entries), slice_size):
+            part = entries[i:i + slice_size]
+            part.sort(key=lambda e: _center(e)[1])
+            for j in xrange(0, len(part), capacity):
+                chunk = part[j:j + capacity]
+                node = RTreeNode(leaf, [child for box, child in chunk])
+                node.box = union([box for box, child in chunk])
+                nodes.append(node)
+        return nodes
+
+
+    def _box_of(self, node, child):
+        if node.leaf:
+            return self._ids[child][2]
+        return child.box
+
+
+    def _insert(self, item, box):
+        x0, y0, x1, y1 = box
+        node = self._root
+        while not node.leaf:
+            # Pick the child that needs least enlargement, then smallest
+            best = None
+            for child in node.children:
+                cx0, cy0, cx1, cy1 = child.box
+                area = (cx1 - cx0) * (cy1 - cy0)
+                enlarged = (max(cx1, x1) - min(cx0, x0)) * (max(cy1, y1) - min(cy0, y0))
+                key = (enlarged - area, area)
+                if best is None or key < best[0]:
+                    best = key, child
+            node = best[1]
+
+        node.children.append(item)
+        self._leaves[item] = node
+
+        # Enlarge boxes upwards
+        n = node
+        while n:
+            if n.box:
+                nx0, ny0, nx1, ny1 = n.box
+                if nx0 <= x0 and ny0 <= y0 and nx1 >= x1 and ny1 >= y1:
+                    break
+                n.box = min(nx0, x0), min(ny0, y0), max(nx1, x1), max(ny1, y1)
+            else:
+                n.box = box
+            n = n.parent
+
+        while len(node.children) > self._capacity:
+            node = self._split(node)
+
+
+    def _split(self, node):
+        """
+        Split a node in two, along the axis with the biggest spread. Returns
+        the parent node, which may need to be split in turn.
+        """
+        box_of = self._box_of
+        entries = [(box_of(node, child), child) for child in node.children]
+        x0, y0, x1, y1 = node.box
+        axis = (x1 - x0) < (y1 - y0) and 1 or 0
+        entries.sort(key=lambda e: _center(e)[axis])
+        half = len(entries) // 2
+
+        sibling = RTreeNode(node.leaf, [child for box, child in entries[half:]])
+        sibling.box = union([box for box, child in entries[half:]])
+        node.children = [child for box, child in entries[:half]]
+        node.box = union([box for box, child in entries[:half]])
+        if node.leaf:
+            for item in sibling.children:
+                self._leaves[item] = sibling
+        else:
+            for child in sibling.children:
+                child.parent = sibling
+
+        parent = node.parent
+        if parent is None:
+            parent = self._root = RTreeNode(leaf=False, children=[node])
+            parent.box = node.box
+            node.parent = parent
+        parent.children.append(sibling)
+        sibling.parent = parent
+        parent.box = union([parent.box, sibling.box])
+        return parent
+
+
+    def _tighten(self, node):
+        """
+        Recalculate the boxes of ``node`` and its ancestors, until a box
+        does not change.
+        """
+        while node:
+            if node.children:
+                box_of = self._box_of
+                box = union([box_of(node, child) for child in node.children])
+            else:
+                box = None
+            if box == node.box:
+                break
+            node.box = box
+            node = node.parent
+
+
+    def find_inside(self, rect):
+        """
+        Find all items in the given rectangle (x, y, with, height).
+        Returns a set.
+        """
+        self._flush()
+        x, y, w, h = rect
+        qx0, qy0, qx1, qy1 = x, y, x + w, y + h
+        ids = self._ids
+        result = set()
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.box:
+                continue
+            x0, y0, x1, y1 = node.box
+            if x0 > qx1 or x1 < qx0 or y0 > qy1 or y1 < qy0:
+                continue
+            if node.leaf:
+                for item in node.children:
+                    x0, y0, x1, y1 = ids[item][2]
+                    if qx0 <= x0 and qy0 <= y0 and qx1 >= x1 and qy1 >= y1:
+                        result.add(item)
+            else:
+                stack.extend(node.children)
+        return result
+
+
+    def find_intersect(self, rect):
+        """
+        Find all items that intersect with the given rectangle
+        (x, y, width, height).
+        Returns a set.
+        """
+        self._flush()
+        x, y, w, h = rect
+        qx0, qy0, qx1, qy1 = x, y, x + w, y + h
+        ids = self._ids
+        result = set()
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.box:
+                continue
+            x0, y0, x1, y1 = node.box
+            if x0 > qx1 or x1 < qx0 or y0 > qy1 or y1 < qy0:
+                continue
+            if node.leaf:
+                for item in node.children:
+                    x0, y0, x1, y1 = ids[item][2]
+                    if x0 <= qx1 and x1 >= qx0 and y0 <= qy1 and y1 >= qy0:
+                        result.add(item)
+            else:
+                stack.extend(node.children)
+        return result
+
+
+    def find_nearest(self, pos):
+        """
+        Find the item closest to point ``pos``. Nodes are visited closest
+        first, so only nodes that may contain a closer item than the one
+        found so far are examined.
+        """
+        self._flush()
+        root = self._root
+        if not root.box:
+            return None
+        ids = self._ids
+        queue = [(box_distance(root.box, pos), 0, False, root)]
+        n = 1
+        while queue:
+            d, _, is_item, obj = heappop(queue)
+            if is_item:
+                return obj
+            if obj.leaf:
+                for item in obj.children:
+                    heappush(queue, (box_distance(ids[item][2], pos), n, True, item))
+                    n += 1
+            else:
+                for child in obj.children:
+                    heappush(queue, (box_distance(child.box, pos), n, False, child))
+                    n += 1
+        return None
+
+
+    def dump(self, node=None, indent=''):
+        """
+        Print structure to stdout.
+        """
+        self._flush()
+        node = node or self._root
+        print indent, node, node.box
+        indent += '   '
+        if node.leaf:
+            for item in sorted(node.children):
+                print indent, item, self._ids[item][2]
+        else:
+            for child in node.children:
+                self.dump(child, indent)
+
+
+# vim:sw=4:et:ai
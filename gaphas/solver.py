@@ -37,6 +37,9 @@ __version__ = "$Revision$"
 # $HeadURL$
 
 from operator import isCallable
+from array import array
+from itertools import izip, islice
+from timeit import default_timer as timer
 from state import observed, reversible_pair, reversible_property
 
 # epsilon for float comparison
@@ -60,15 +63,29 @@ class Variable(object):
     
     You can even do some calculating with it. The Variable always represents
     a float variable.
+
+    Variables use slots, since there are many of them (two per handle and
+    port point). The constraints set is created once the variable is added
+    to the solver.
     """
 
+    __slots__ = ('_value', '_strength', '_solver', '_constraints')
+
     def __init__(self, value=0.0, strength=NORMAL):
         self._value = float(value)
         self._strength = strength
 
         # These variables are set by the Solver:
         self._solver = None
-        self._constraints = set()
+        self._constraints = ()
+
+    def __getstate__(self):
+        return dict(_value=self._value, _strength=self._strength,
+                    _solver=self._solver, _constraints=self._constraints)
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     @observed
     def _set_strength(self, strength):
@@ -309,6 +326,114 @@ class Variable(object):
         return self._value.__rtruediv__(other)
 
 
+class StoredVariable(Variable):
+    """
+    A Variable whose value and strength are kept in a `VariableStore`.
+    Stored variables are created by the store:
+
+    >>> store = VariableStore()
+    >>> v = store.variable(3, WEAK)
+    >>> v
+    Variable(3, 10)
+    >>> v.value = 4
+    >>> store.get_values([v])
+    array('d', [4.0])
+    """
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, *args, **kwargs):
+        raise TypeError, 'Stored variables are created by VariableStore.variable()'
+
+    def _set_stored_value(self, value):
+        self._store._values[self._index] = value
+
+    _value = property(lambda s: s._store._values[s._index], _set_stored_value)
+
+    def _set_stored_strength(self, strength):
+        self._store._strengths[self._index] = strength
+
+    _strength = property(lambda s: s._store._strengths[s._index], _set_stored_strength)
+
+    def __getstate__(self):
+        # Value and strength are pickled along with the store
+        return dict(_store=self._store, _index=self._index,
+                    _solver=self._solver, _constraints=self._constraints)
+
+
+class VariableStore(object):
+    """
+    Compact storage for a large number of variables. Values and strengths
+    are kept in typed arrays, the variables themselves are small proxy
+    objects that refer to their slot in the arrays.
+
+    Slots are not reused: a store is meant to live as long as the diagram
+    it's used for.
+
+    The store also provides bulk access to the values, e.g. to fetch all
+    handle positions at once.
+
+    >>> store = VariableStore()
+    >>> a, b = store.variable(1), store.variable(2, WEAK)
+    >>> len(store)
+    2
+    >>> store.get_values([b, a])
+    array('d', [2.0, 1.0])
+    >>> store.set_values([a, b], [5, 6])
+    >>> a, b
+    (Variable(5, 20), Variable(6, 10))
+    """
+
+    def __init__(self):
+        self._values = array('d')
+        self._strengths = array('i')
+
+    def __len__(self):
+        return len(self._values)
+
+    def variable(self, value=0.0, strength=NORMAL):
+        """
+        Create a new variable in this store.
+        """
+        v = StoredVariable.__new__(StoredVariable)
+        v._store = self
+        v._index = len(self._values)
+        v._solver = None
+        v._constraints = ()
+        self._values.append(value)
+        self._strengths.append(strength)
+        return v
+
+    def get_values(self, variables):
+        """
+        Return the values of ``variables`` (created by this store) as an
+        array of doubles.
+        """
+        values = self._values
+        return array('d', [values[v._index] for v in variables])
+
+    def set_values(self, variables, values):
+        """
+        Set the values of a list of variables. The variables are marked
+        dirty in the solver, as if they were set one by one.
+        """
+        for v, value in izip(variables, values):
+            v.value = value
+
+    def get_positions(self, positions):
+        """
+        Return the values of a list of `connector.Position` instances
+        (e.g. ``[h.pos for h in item.handles()]``) as one array of doubles,
+        with x and y values interleaved.
+        """
+        values = self._values
+        result = array('d')
+        extend = result.extend
+        for p in positions:
+            extend((values[p.x._index], values[p.y._index]))
+        return result
+
+
 class Projection(object):
     """
     Projections are used to convert values from one space to another,
@@ -364,20 +489,519 @@ class Projection(object):
     __repr__ = __str__
 
 
+class Component(object):
+    """
+    A set of variables and constraints that is not connected to any other
+    constraint in the solver. Components can be solved independently.
+
+    A component also keeps some statistics: the number of times it has been
+    solved, and the total number of constraints solved.
+    """
+
+    def __init__(self):
+        self.variables = set()
+        self.constraints = set()
+        self.solve_count = 0
+        self.constraint_solve_count = 0
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def __str__(self):
+        return '<Component: %d variables, %d constraints, solved %d times, %d constraint solves>' % (len(self.variables), len(self.constraints), self.solve_count, self.constraint_solve_count)
+    __repr__ = __str__
+
+
+def _sample_constraints(constraints, count=3):
+    """
+    Describe ``constraints`` by their number and the first ``count`` of
+    them, so error messages stay short for big diagrams.
+
+    >>> _sample_constraints(['a', 'b'])
+    '2 constraints (a, b)'
+    >>> _sample_constraints(['a', 'b', 'c', 'd'])
+    '4 constraints (a, b, c, ...)'
+    """
+    sample = [str(c) for c in islice(constraints, count + 1)]
+    if len(sample) > count:
+        sample[count:] = ['...']
+    return '%d constraints (%s)' % (len(constraints), ', '.join(sample))
+
+
+def _constraint_variables(constraint):
+    """
+    Return the variables of a constraint, with projections peeled off.
+    """
+    for v in constraint.variables():
+        while isinstance(v, Projection):
+            v = v.variable()
+        yield v
+
+
+class Components(object):
+    """
+    Partitions the constraints of a solver in connected components. Two
+    constraints are in the same component if they share a variable.
+
+    The partitioning is maintained with a union-find structure: every
+    variable refers to its component, and when two components are joined
+    the smaller one is merged into the bigger one. Since components can not
+    be split that way, a component is marked stale when a constraint is
+    removed from it. Stale components are only partitioned again when the
+    components are asked for (`components()`, `component_of()`).
+    `partition()`, used when solving, groups constraints per component
+    as is: a stale component may consist of several components, solving
+    those together does no harm. This keeps removing and adding back a
+    constraint (e.g. when a line is disconnected and connected again)
+    cheap.
+
+    >>> from constraint import EqualsConstraint
+    >>> a, b, c, d = Variable(1), Variable(2), Variable(3), Variable(4)
+    >>> ab, cd, bc = EqualsConstraint(a, b), EqualsConstraint(c, d), EqualsConstraint(b, c)
+    >>> components = Components()
+    >>> components.add(ab)
+    >>> components.add(cd)
+    >>> len(components)
+    2
+    >>> components.add(bc)
+    >>> len(components)
+    1
+    >>> components.component_of(ab) is components.component_of(cd)
+    True
+    >>> components.remove(bc)
+    >>> len(components)
+    2
+    >>> components.component_of(ab).variables == set([a, b])
+    True
+    """
+
+    def __init__(self):
+        # variable -> component
+        self._index = {}
+        self._stale = set()
+
+    def __len__(self):
+        return len(self.components())
+
+    def add(self, constraint):
+        """
+        Add a constraint, joining the components of its variables.
+        """
+        index = self._index
+        component = None
+        for v in _constraint_variables(constraint):
+            other = index.get(v)
+            if other is component and other is not None:
+                continue
+            if other is None:
+                other = Component()
+                other.variables.add(v)
+                index[v] = other
+            if component is None:
+                component = other
+                continue
+            # Merge the smaller component into the bigger one
+            if len(other.variables) > len(component.variables):
+                component, other = other, component
+            for w in other.variables:
+                index[w] = component
+            component.variables.update(other.variables)
+            component.constraints.update(other.constraints)
+            component.solve_count += other.solve_count
+            component.constraint_solve_count += other.constraint_solve_count
+            if other in self._stale:
+                self._stale.discard(other)
+                self._stale.add(component)
+        if component is not None:
+            component.constraints.add(constraint)
+
+    def remove(self, constraint):
+        """
+        Remove a constraint. Its component is partitioned again later.
+        """
+        component = self._component_of(constraint)
+        if component is not None:
+            component.constraints.discard(constraint)
+            self._stale.add(component)
+
+    def _split(self, component):
+        """
+        Partition the variables of a stale component again. The new
+        components start with fresh statistics.
+        """
+        index = self._index
+        for v in component.variables:
+            del index[v]
+        for c in component.constraints:
+            self.add(c)
+
+    def _update(self):
+        while self._stale:
+            self._split(self._stale.pop())
+
+    def component_of(self, constraint):
+        """
+        Return the component ``constraint`` belongs to, or None if it's not
+        part of any component.
+        """
+        self._update()
+        return self._component_of(constraint)
+
+    def _component_of(self, constraint):
+        # All variables of a constraint are in the same component
+        v = next(_constraint_variables(constraint), None)
+        component = self._index.get(v)
+        if component is not None and constraint in component.constraints:
+            return component
+        return None
+
+    def components(self):
+        """
+        Return a list of all components.
+        """
+        self._update()
+        seen = set()
+        result = []
+        for component in self._index.itervalues():
+            if component not in seen and component.constraints:
+                seen.add(component)
+                result.append(component)
+        return result
+
+    def partition(self, constraints):
+        """
+        Group ``constraints`` per component. Returns a list of (component,
+        constraints) tuples, in order of first appearance. Constraints that
+        are not part of a component are grouped with component None.
+
+        Stale components are not partitioned again.
+        """
+        component_of = self._component_of
+        groups = {}
+        result = []
+        for c in constraints:
+            component = component_of(c)
+            group = groups.get(component)
+            if group is None:
+                group = groups[component] = []
+                result.append((component, group))
+            group.append(c)
+        return result
+
+
+class WorkQueue(object):
+    """
+    Queue of constraints to be solved. The queue behaves like a list, but
+    membership tests, counting and moving a constraint to the end of the
+    queue take constant time. Removed entries leave a hole that is skipped
+    when iterating.
+
+    >>> q = WorkQueue(['a', 'b', 'a'])
+    >>> q
+    ['a', 'b', 'a']
+    >>> q.count('a'), len(q), 'b' in q
+    (2, 3, True)
+    >>> q.move_to_end('a')
+    >>> q
+    ['b', 'a']
+    >>> q.discard('b')
+    >>> q == ['a']
+    True
+
+    Constraints can be appended while iterating. Iteration continues with
+    the new entries:
+
+    >>> for c in q:
+    ...     if c == 'a': q.append('c')
+    ...     print c,
+    a c
+    """
+
+    def __init__(self, items=()):
+        # Queued constraints, with None for removed entries
+        self._items = []
+        # constraint -> positions in _items
+        self._positions = {}
+        self._len = 0
+        for item in items:
+            self.append(item)
+
+    def append(self, item):
+        """
+        Add ``item`` to the end of the queue. Items can be queued more than
+        once.
+        """
+        positions = self._positions.get(item)
+        if positions is None:
+            positions = self._positions[item] = []
+        positions.append(len(self._items))
+        self._items.append(item)
+        self._len += 1
+
+    def discard(self, item):
+        """
+        Remove all occurrences of ``item`` from the queue.
+        """
+        positions = self._positions.pop(item, None)
+        if positions:
+            items = self._items
+            for i in positions:
+                items[i] = None
+            self._len -= len(positions)
+
+    def move_to_end(self, item):
+        """
+        Replace all occurrences of ``item`` by one at the end of the queue.
+        Should not be used while iterating, since the queue may be compacted.
+        """
+        self.discard(item)
+        self.append(item)
+        if len(self._items) > 2 * self._len + 32:
+            self._compact()
+
+    def _compact(self):
+        items = [item for item in self._items if item is not None]
+        self._items = []
+        self._positions = {}
+        self._len = 0
+        for item in items:
+            self.append(item)
+
+    def count(self, item):
+        """
+        Return the number of times ``item`` is queued.
+        """
+        return len(self._positions.get(item, ()))
+
+    def counts(self):
+        """
+        Iterate (item, count) tuples for all queued items.
+        """
+        for item, positions in self._positions.iteritems():
+            yield item, len(positions)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        items = self._items
+        n = 0
+        while n < len(items):
+            item = items[n]
+            if item is not None:
+                yield item
+            n += 1
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class SolveStatistics(object):
+    """
+    Statistics of one or more `Solver.solve()` calls:
+
+    - ``solve_count``: the number of solve() calls recorded
+    - ``constraint_count``: the number of constraints solved
+    - ``requeue_count``: the number of times a constraint was solved again
+      in the same solve() call
+    - ``time``: total time spent in solve(), in seconds
+    - ``class_times``: a constraint class -> [count, seconds] mapping
+    - ``constraint_counts``: a constraint -> times solved mapping
+
+    >>> s = SolveStatistics()
+    >>> s.add_queue(WorkQueue(['a', 'b', 'a']))
+    >>> s.constraint_count, s.requeue_count
+    (3, 1)
+    >>> s.worst()
+    [('a', 2), ('b', 1)]
+    """
+
+    def __init__(self):
+        self.solve_count = 0
+        self.constraint_count = 0
+        self.requeue_count = 0
+        self.time = 0.0
+        self.class_times = {}
+        self.constraint_counts = {}
+
+    def add_time(self, constraint, time):
+        """
+        Record the time it took to solve ``constraint``.
+        """
+        cls = type(constraint)
+        entry = self.class_times.get(cls)
+        if entry is None:
+            self.class_times[cls] = [1, time]
+        else:
+            entry[0] += 1
+            entry[1] += time
+
+    def add_queue(self, queue):
+        """
+        Record the constraints solved from a `WorkQueue`.
+        """
+        counts = self.constraint_counts
+        for c, n in queue.counts():
+            self.constraint_count += n
+            self.requeue_count += n - 1
+            counts[c] = counts.get(c, 0) + n
+
+    def update(self, other):
+        """
+        Add the statistics of ``other`` to these statistics.
+        """
+        self.solve_count += other.solve_count
+        self.constraint_count += other.constraint_count
+        self.requeue_count += other.requeue_count
+        self.time += other.time
+        for cls, (n, time) in other.class_times.iteritems():
+            entry = self.class_times.setdefault(cls, [0, 0.0])
+            entry[0] += n
+            entry[1] += time
+        counts = self.constraint_counts
+        for c, n in other.constraint_counts.iteritems():
+            counts[c] = counts.get(c, 0) + n
+
+    def worst(self, n=5):
+        """
+        Return the ``n`` constraints that were solved most often, as a list
+        of (constraint, count) tuples.
+        """
+        return sorted(self.constraint_counts.iteritems(),
+                      key=lambda e: e[1], reverse=True)[:n]
+
+    def __str__(self):
+        lines = ['%d solves, %d constraints solved (%d requeued) in %.3fs' % \
+                 (self.solve_count, self.constraint_count, self.requeue_count,
+                  self.time)]
+        for cls, (n, time) in sorted(self.class_times.iteritems(),
+                                     key=lambda e: e[1][1], reverse=True):
+            lines.append('  %s: %d solved in %.3fs' % (cls.__name__, n, time))
+        for c, n in self.worst():
+            lines.append('  %dx %s' % (n, c))
+        return '\n'.join(lines)
+
+
+class SolverStatistics(object):
+    """
+    Statistics collector for a `Solver`. Set it as the solver's
+    ``statistics`` attribute to record a `SolveStatistics` instance for
+    every solve() call. If a ``callback`` is provided, it's called with the
+    statistics of each solve() call. The statistics of the last ``keep``
+    calls are kept.
+
+    Statistics are only collected by `Solver.solve()`, for other solvers
+    only the statistics of the constraints they leave to `Solver.solve()`
+    are recorded.
+
+    >>> from constraint import EqualsConstraint
+    >>> s = Solver()
+    >>> s.statistics = SolverStatistics()
+    >>> a, b = Variable(1), Variable(2)
+    >>> eq = s.add_constraint(EqualsConstraint(a, b))
+    >>> s.solve()
+    >>> a.value = 3
+    >>> s.solve()
+    >>> summary = s.statistics.summary()
+    >>> summary.solve_count, summary.constraint_count, summary.requeue_count
+    (2, 4, 2)
+    >>> summary.class_times[EqualsConstraint][0]
+    4
+    """
+
+    def __init__(self, callback=None, keep=100):
+        self.callback = callback
+        self.keep = keep
+        self.solves = []
+
+    def record(self, stats):
+        """
+        Record the statistics of one solve() call.
+        """
+        self.solves.append(stats)
+        del self.solves[:-self.keep]
+        if self.callback:
+            self.callback(stats)
+
+    def clear(self):
+        del self.solves[:]
+
+    def summary(self):
+        """
+        Return a `SolveStatistics` instance with the accumulated statistics
+        of the recorded solve() calls.
+        """
+        summary = SolveStatistics()
+        for stats in self.solves:
+            summary.update(stats)
+        return summary
+
+
 class Solver(object):
     """
     Solve constraints. A constraint should have accompanying
     variables.
+
+    Constraints are partitioned in independent components (see
+    `Components`), so only the components with dirty constraints are
+    visited when solving.
+
+    Statistics are collected when ``statistics`` is set to a
+    `SolverStatistics` instance.
     """
 
+    statistics = None
+
     def __init__(self):
         # a dict of constraint -> name/variable mappings
         self._constraints = set()
-        self._marked_cons = []
+        self._marked_cons = WorkQueue()
         self._solving = False
+        self._components = Components()
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d.pop('statistics', None)
+        return d
 
     constraints = property(lambda s: s._constraints)
 
+    def components(self):
+        """
+        Return the independent components of the constraints in this
+        solver. Each component keeps track of how often it has been solved.
+
+        >>> from constraint import EqualsConstraint
+        >>> a, b, c = Variable(1.0), Variable(2.0), Variable(3.0)
+        >>> s = Solver()
+        >>> ab = s.add_constraint(EqualsConstraint(a, b))
+        >>> cd = s.add_constraint(EqualsConstraint(c, Variable()))
+        >>> s.solve()
+        >>> a.value = 4
+        >>> s.solve()
+        >>> sorted(s.components(), key=lambda c: c.solve_count)
+        [<Component: 2 variables, 1 constraints, solved 1 times, 2 constraint solves>, <Component: 2 variables, 1 constraints, solved 2 times, 4 constraint solves>]
+
+        A constraint is solved twice here, since it marks itself dirty
+        when it changes a variable.
+        """
+        return self._components.components()
+
 
     def request_resolve(self, variable, projections_only=False):
         """
@@ -415,16 +1039,14 @@ class Solver(object):
             variable = variable.variable()
         for c in variable._constraints:
             if not projections_only or c._solver_has_projections:
+                c.mark_dirty(variable)
                 if not self._solving:
-                    if c in self._marked_cons:
-                        self._marked_cons.remove(c)
-                    c.mark_dirty(variable)
-                    self._marked_cons.append(c)
+                    self._marked_cons.move_to_end(c)
                 else:
-                    c.mark_dirty(variable)
                     self._marked_cons.append(c)
-                    if self._marked_cons.count(c) > 100:
-                        raise JuggleError, 'Variable juggling detected, constraint %s resolved %d times out of %d' % (c, self._marked_cons.count(c), len(self._marked_cons))
+                    count = self._marked_cons.count(c)
+                    if count > 100:
+                        raise JuggleError, 'Variable juggling detected, constraint %s resolved %d times out of %d' % (c, count, len(self._marked_cons))
 
 
     @observed
@@ -458,8 +1080,11 @@ class Solver(object):
             while isinstance(v, Projection):
                 v = v.variable()
                 constraint._solver_has_projections = True
+            if not v._constraints:
+                v._constraints = set()
             v._constraints.add(constraint)
             v._solver = self
+        self._components.add(constraint)
         #print 'added constraint', constraint
         return constraint
 
@@ -488,10 +1113,12 @@ class Solver(object):
         for v in constraint.variables():
             while isinstance(v, Projection):
                 v = v.variable()
-            v._constraints.discard(constraint)
+            if v._constraints:
+                v._constraints.discard(constraint)
+        if constraint in self._constraints:
+            self._components.remove(constraint)
         self._constraints.discard(constraint)
-        while constraint in self._marked_cons:
-            self._marked_cons.remove(constraint)
+        self._marked_cons.discard(constraint)
 
     reversible_pair(add_constraint, remove_constraint)
 
@@ -509,6 +1136,8 @@ class Solver(object):
         The variable in question should be exposed by the constraints
         `constraint.Constraint.variables()` method.
 
+        Only the constraints of the variables in question are examined.
+
         >>> from constraint import EquationConstraint
         >>> s = Solver()
         >>> a, b, c = Variable(), Variable(2.0), Variable(4.0)
@@ -549,10 +1178,23 @@ class Solver(object):
         >>> eq_pr_a_b in s.constraints_with_variable(a, d)
         False
         """
+        # Only constraints registered with all variables are candidates.
+        # Variables know their constraints, also those that use the variable
+        # through a projection (see `add_constraint()`).
+        candidates = []
+        for v in variables:
+            while isinstance(v, Projection):
+                v = v.variable()
+            candidates.append(v._constraints)
+        if not candidates:
+            return
+        candidates.sort(key=len)
+
         # Use a copy of the original set, so constraints may be
         # deleted in the meantime.
+        candidates = set(candidates[0]).intersection(self._constraints, *candidates[1:])
         variables = set(variables)
-        for c in set(self._constraints):
+        for c in candidates:
             if variables.issubset(set(c.variables())):
                 yield c
             elif c._solver_has_projections:
@@ -605,23 +1247,261 @@ class Solver(object):
         >>> c._value
         10.0
         """
-        marked_cons = self._marked_cons
+        statistics = self.statistics
+        if statistics is not None:
+            stats = SolveStatistics()
+            start = timer()
+
+        # Components are independent, so they're solved one by one.
+        # Constraints marked while solving a component are part of
+        # that same component.
+        groups = self._components.partition(self._marked_cons)
+        marked_cons = None
+        solved = n = 0
         try:
             self._solving = True
 
-            # Solve each constraint. Using a counter makes it
-            # possible to also solve constraints that are marked as
-            # a result of other variabled being solved.
-            n = 0
-            while n < len(marked_cons):
-                c = marked_cons[n]
-                if not c.disabled:
-                    c.solve()
-                n += 1
-
-            self._marked_cons = []
+            for component, marked_cons in groups:
+                self._marked_cons = marked_cons = WorkQueue(marked_cons)
+
+                # Solve each constraint. Iterating the queue makes it
+                # possible to also solve constraints that are marked as
+                # a result of other variabled being solved.
+                n = 0
+                if statistics is None:
+                    for c in marked_cons:
+                        if not c.disabled:
+                            c.solve()
+                        n += 1
+                else:
+                    for c in marked_cons:
+                        if not c.disabled:
+                            t = timer()
+                            c.solve()
+                            stats.add_time(c, timer() - t)
+                        n += 1
+                    stats.add_queue(marked_cons)
+
+                if component is not None:
+                    component.solve_count += 1
+                    component.constraint_solve_count += n
+                solved += 1
+
+            self._marked_cons = WorkQueue()
+        except:
+            # Keep all constraints that have not been solved marked: the
+            # one that failed, the ones queued after it and the ones of the
+            # components that have not been visited
+            pending = WorkQueue()
+            if marked_cons is not None:
+                for c in list(marked_cons)[n:]:
+                    pending.move_to_end(c)
+            for component, cons in groups[solved + 1:]:
+                for c in cons:
+                    pending.move_to_end(c)
+            self._marked_cons = pending
+            raise
+        finally:
+            self._solving = False
+
+        if statistics is not None:
+            stats.solve_count = 1
+            stats.time = timer() - start
+            statistics.record(stats)
+
+
+
+class DependencySolver(Solver):
+    """
+    Solver that propagates changes in dependency order.
+
+    Constraints and variables form a bipartite graph: a constraint reads
+    all its variables and changes the ones returned by
+    `constraint.Constraint.solved_variables()`. When solving, the
+    constraints reachable from the marked constraints are put in
+    topological order, so a constraint is solved only after the constraints
+    it depends on have been solved. Each affected constraint is solved at
+    most once per pass.
+
+    Cycles are detected structurally, as strongly connected components of
+    the graph. Constraints that are marked dirty again after they have been
+    solved (this only happens in cycles) are solved in a next pass. If
+    this still happens after `max_passes` passes, a `JuggleError` is
+    raised.
+
+    >>> from constraint import EqualsConstraint
+    >>> a, b, c = Variable(1.0), Variable(2.0, WEAK), Variable(3.0, VERY_WEAK)
+    >>> s = DependencySolver()
+    >>> c_bc = s.add_constraint(EqualsConstraint(b, c))
+    >>> c_ab = s.add_constraint(EqualsConstraint(a, b))
+    >>> order, cycles = s.schedule([c_bc, c_ab])
+    >>> order == [c_ab, c_bc], cycles
+    (True, [])
+    >>> s.solve()
+    >>> a, b, c
+    (Variable(1, 20), Variable(1, 10), Variable(1, 0))
+    >>> a.value = 4
+    >>> s.solve()
+    >>> a, b, c
+    (Variable(4, 20), Variable(4, 10), Variable(4, 0))
+
+    Constraints that solve for the same variable form a cycle:
+
+    >>> c_ca = s.add_constraint(EqualsConstraint(c, a))
+    >>> s.solve()
+    >>> s.cycles == [[c_ca, c_bc]]
+    True
+    """
+
+    max_passes = 100
+
+    def __init__(self):
+        super(DependencySolver, self).__init__()
+        # Constraints marked during solving
+        self._dirty = set()
+        self._cycles = []
+
+    cycles = property(lambda s: s._cycles,
+                      doc="Cycles (lists of constraints) found by the last solve()")
+
+
+    def request_resolve(self, variable, projections_only=False):
+        """
+        See `Solver.request_resolve()`. During solving, constraints are not
+        queued, but only flagged dirty: the schedule determines the order.
+        """
+        if not self._solving:
+            return super(DependencySolver, self).request_resolve(variable, projections_only)
+
+        while isinstance(variable, Projection):
+            variable = variable.variable()
+        dirty = self._dirty
+        for c in variable._constraints:
+            if not projections_only or c._solver_has_projections:
+                c.mark_dirty(variable)
+                dirty.add(c)
+
+
+    def request_resolve_constraint(self, c):
+        if self._solving:
+            self._dirty.add(c)
+        else:
+            super(DependencySolver, self).request_resolve_constraint(c)
+
+
+    def dependants(self, constraint):
+        """
+        Iterate the constraints that use one of the variables ``constraint``
+        solves for.
+        """
+        for v in constraint.solved_variables():
+            while isinstance(v, Projection):
+                v = v.variable()
+            for c in v._constraints:
+                if c is not constraint:
+                    yield c
+
+
+    def schedule(self, constraints):
+        """
+        Find all constraints reachable from ``constraints`` and return them
+        in topological order, together with a list of cycles found.
+
+        Strongly connected components (cycles) are found with Tarjan's
+        algorithm. Constraints within a cycle are ordered as they are
+        found.
+        """
+        dependants = self.dependants
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        for root in constraints:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, dependants(root))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, dependants(child)))
+                        break
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    # All dependants of node have been visited
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            c = stack.pop()
+                            on_stack.discard(c)
+                            component.append(c)
+                            if c is node:
+                                break
+                        component.reverse()
+                        components.append(component)
+
+        # Components are found in reverse topological order
+        components.reverse()
+        order = []
+        cycles = []
+        for component in components:
+            if len(component) > 1:
+                cycles.append(component)
+            order.extend(component)
+        return order, cycles
+
+
+    def solve(self):
+        """
+        Solve the marked constraints, and all constraints that are marked
+        dirty as a result, in dependency order.
+        """
+        pending = self._marked_cons
+        self._marked_cons = WorkQueue()
+        self._cycles = []
+        dirty = self._dirty
+        passes = 0
+        try:
+            self._solving = True
+            while pending:
+                passes += 1
+                if passes > self.max_passes:
+                    raise JuggleError, 'Variable juggling detected, %s are still dirty after %d passes' % (_sample_constraints(pending), self.max_passes)
+
+                dirty.update(pending)
+                order, cycles = self.schedule(pending)
+                if passes == 1:
+                    self._cycles = cycles
+
+                for c in order:
+                    if c in dirty:
+                        if not c.disabled:
+                            c.solve()
+                        # A constraint may mark itself dirty, ignore that
+                        dirty.discard(c)
+
+                # Constraints marked after they have been solved, or outside
+                # the schedule, are solved in the next pass
+                pending = [c for c in order if c in dirty]
+                dirty.difference_update(pending)
+                pending.extend(dirty)
+                dirty.clear()
         finally:
             self._solving = False
+            dirty.clear()
 
 
 class solvable(object):
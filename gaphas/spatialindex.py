@@ -0,0 +1,148 @@
+"""
+Spatial index interface.
+
+A canvas keeps the bounding boxes of its items (in canvas coordinates) in a
+spatial index, so views can quickly find the items in an area or at a
+point. Any object that implements the `SpatialIndex` interface can be used
+(see `canvas.Canvas.__init__()`). Gaphas provides an `rtree.RTree` (the
+default) and a `quadtree.Quadtree`.
+
+Rectangles use the same scheme throughout Gaphas: (x, y, width, height).
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import operator
+from abc import ABCMeta, abstractmethod
+
+
+class SpatialIndex(object):
+    """
+    Base class for spatial indexes. Subclasses keep an ``_ids`` dictionary
+    with an item -> (bounds, data, ...) mapping, so the lookup methods can
+    be shared. The abstract methods have to be implemented.
+
+    >>> SpatialIndex()
+    Traceback (most recent call last):
+        ...
+    TypeError: Can't instantiate abstract class SpatialIndex with abstract methods add, clear, find_inside, find_intersect, find_nearest, rebuild, remove
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self._ids = dict()
+
+
+    def resize(self, bounds):
+        """
+        Resize the index to cover ``bounds``. Indexes that are not bound to
+        an area may ignore this.
+        """
+        pass
+
+
+    @abstractmethod
+    def add(self, item, bounds, data=None):
+        """
+        Add an item to the index. If an item already exists, its bounds are
+        updated. Data can be used to add some extra info to the item.
+        """
+
+
+    @abstractmethod
+    def remove(self, item):
+        """
+        Remove an item from the index.
+        """
+
+
+    @abstractmethod
+    def clear(self):
+        """
+        Remove all items from the index.
+        """
+
+
+    @abstractmethod
+    def rebuild(self):
+        """
+        Rebuild the index structure.
+        """
+
+
+    @abstractmethod
+    def find_inside(self, rect):
+        """
+        Find all items in the given rectangle (x, y, with, height).
+        Returns a set.
+        """
+
+
+    @abstractmethod
+    def find_intersect(self, rect):
+        """
+        Find all items that intersect with the given rectangle
+        (x, y, width, height).
+        Returns a set.
+        """
+
+
+    @abstractmethod
+    def find_nearest(self, pos):
+        """
+        Find the item closest to point ``pos``, as determined by
+        `geometry.distance_rectangle_point()`. Returns None if the index is
+        empty.
+        """
+
+
+    def get_bounds(self, item):
+        """
+        Return the bounding box for the given item.
+        """
+        return self._ids[item][0]
+
+
+    def get_data(self, item):
+        """
+        Return the data for the given item, None if no data was provided.
+        """
+        return self._ids[item][1]
+
+
+    def get_soft_bounds(self):
+        """
+        Calculate the size of all items in the index.
+
+        Returns a tuple (x, y, width, height).
+        """
+        x_y_w_h = zip(*map(operator.getitem, self._ids.itervalues(), [0] * len(self._ids)))
+        if not x_y_w_h:
+            return 0, 0, 0, 0
+        x0 = min(x_y_w_h[0])
+        y0 = min(x_y_w_h[1])
+        add = operator.add
+        x1 = max(map(add, x_y_w_h[0], x_y_w_h[2]))
+        y1 = max(map(add, x_y_w_h[1], x_y_w_h[3]))
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    soft_bounds = property(lambda s: s.get_soft_bounds())
+
+
+    def __len__(self):
+        """
+        Return number of items in the index.
+        """
+        return len(self._ids)
+
+
+    def __contains__(self, item):
+        """
+        Check if an item is in the index.
+        """
+        return item in self._ids
+
+
+# vim:sw=4:et:ai
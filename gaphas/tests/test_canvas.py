@@ -4,6 +4,8 @@ from gaphas.canvas import Canvas, ConnectionError
 from gaphas.examples import Box
 from gaphas.item import Line, Handle
 from gaphas.constraint import BalanceConstraint, EqualsConstraint
+from gaphas.geometry import Rectangle
+from gaphas.tracer import Tracer, ItemCosts
 import cairo
 
 class MatricesTestCase(unittest.TestCase):
@@ -23,6 +25,25 @@ class MatricesTestCase(unittest.TestCase):
         self.assertEquals(i._matrix_i2c, cairo.Matrix(1, 0, 0, 1, 5, 0))
         self.assertEquals(ii._matrix_i2c, cairo.Matrix(1, 0, 0, 1, 5, 8))
 
+    def test_update_matrices_deep(self):
+        """Test only changed subtrees are updated"""
+        c = Canvas()
+        chain = [Box() for n in range(20)]
+        c.add_many(chain, [None] + chain[:-1])
+        other = Box()
+        c.add(other)
+
+        chain[10].matrix.translate(0, 10)
+        updated = c.update_matrices(chain + [other])
+        self.assertEquals(set(chain[10:]), updated)
+        self.assertEquals(21, c.matrix_update_count)
+        self.assertEquals(cairo.Matrix(1, 0, 0, 1, 0, 10), chain[-1]._matrix_i2c)
+
+        # Items below an unchanged parent are not visited
+        updated = c.update_matrices([chain[0]])
+        self.assertEquals(set(), updated)
+        self.assertEquals(1, c.matrix_update_count)
+
     def test_reparent(self):
         c = Canvas()
         b1 = Box()
@@ -31,6 +52,184 @@ class MatricesTestCase(unittest.TestCase):
         c.add(b2, b1)
         c.reparent(b2, None)
 
+
+class IndexTestCase(unittest.TestCase):
+    def test_item_bounds(self):
+        """Test item bounds are projected when matrices change"""
+        c = Canvas()
+        i = Box()
+        ii = Box()
+        c.add(i)
+        c.add(ii, i)
+        c.set_item_bounds(i, Rectangle(0, 0, 10, 10))
+        c.set_item_bounds(ii, Rectangle(0, 0, 10, 10))
+
+        i.matrix.translate(5, 0)
+        c.request_matrix_update(i)
+        c.update_now()
+
+        self.assertEquals(Rectangle(5, 0, 10, 10), c.get_item_bounds(i))
+        self.assertEquals(Rectangle(5, 0, 10, 10), c.get_item_bounds(ii))
+        self.assertEquals(set([i, ii]), c.index.find_intersect((12, 2, 1, 1)))
+
+        c.remove(ii)
+        self.assertEquals(1, len(c.index))
+        self.assertRaises(KeyError, c.get_item_bounds, ii)
+
+
+class UpdateRecorder(object):
+    """
+    A minimal view, that records the update requests.
+    """
+    def __init__(self):
+        self.updates = []
+
+    def request_update(self, items, matrix_only_items=(), removed_items=()):
+        self.updates.append((set(items), set(matrix_only_items), set(removed_items)))
+
+    def queue_draw_item(self, *items):
+        pass
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_batch(self):
+        """Test updates are deferred to the end of a batch"""
+        c = Canvas()
+        view = UpdateRecorder()
+        c.register_view(view)
+        b1 = Box()
+        c.add(b1)
+        del view.updates[:]
+
+        with c.batch() as touched:
+            b2 = Box()
+            c.add(b2)
+            line = Line()
+            c.add(line)
+            with c.batch() as nested:
+                assert nested is touched
+                b1.width = 50
+                c.request_update(b1)
+                c.remove(line)
+            b2.height = 40
+            assert c.require_update()
+            self.assertEquals([], view.updates)
+
+        self.assertEquals(set([b1, b2, line]), touched)
+        self.assertEquals(2, len(view.updates))
+        self.assertEquals(set([line]), view.updates[0][2])
+        self.assertEquals(set([b1, b2]), view.updates[1][0])
+        self.assert_(not c.require_update())
+        self.assertEquals(40, b2.height)
+
+    def test_batch_with_exception(self):
+        """Test an update is performed if the batch is aborted"""
+        c = Canvas()
+        b = Box()
+        try:
+            with c.batch():
+                c.add(b)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assert_(not c.require_update())
+        self.assertEquals(None, c._batch_items)
+
+    def test_sliced_update(self):
+        """Test items can change in between the steps of a sliced update"""
+        c = Canvas()
+        view = UpdateRecorder()
+        c.register_view(view)
+        b1, b2, b3 = Box(), Box(), Box()
+        with c.batch():
+            c.add(b1)
+            c.add(b2)
+            c.add(b3)
+        del view.updates[:]
+
+        c._dirty_items.update((b1, b2, b3))
+        steps = c._update_steps(sliced=True)
+        steps.next()
+        c.remove(b3)
+        b1.width = 30
+        c.request_update(b1)
+        for step in steps:
+            pass
+
+        self.assertEquals(set([b3]), view.updates[0][2])
+        self.assertEquals(set([b1, b2]), view.updates[1][0])
+        # b1 requested an update while the canvas was updating
+        self.assert_(c.require_update())
+        c.update_now()
+        self.assert_(not c.require_update())
+
+    def test_update_now_during_update(self):
+        """Test update_now() during a sliced update schedules another pass"""
+        c = Canvas()
+        view = UpdateRecorder()
+        c.register_view(view)
+        b1, b2 = Box(), Box()
+        with c.batch():
+            c.add(b1)
+            c.add(b2)
+        del view.updates[:]
+
+        c._dirty_items.update((b1, b2))
+        steps = c._update_steps(sliced=True)
+        steps.next()
+        b1.width = 30
+        c.request_update(b1)
+        c.update_now()
+        # Nothing is updated until the executing update is done
+        self.assertEquals([], view.updates)
+        for step in steps:
+            pass
+
+        self.assertEquals(2, len(view.updates))
+        self.assertEquals(set([b1]), view.updates[1][0])
+        self.assert_(not c.require_update())
+
+
+class TracerTestCase(unittest.TestCase):
+    def test_update_phases(self):
+        """Test the phases of an update are traced"""
+        c = Canvas()
+        c.tracer = Tracer()
+        b = Box()
+        c.add(b)
+        c.tracer.clear()
+
+        # Outside a main loop an update request is handled right away,
+        # the batch makes sure it's handled once
+        b.matrix.translate(5, 0)
+        with c.batch():
+            c.request_matrix_update(b)
+
+        # Exactly one pass is traced
+        phases = list(c.tracer.phases)
+        self.assertEquals(['sort', 'pre_update', 'matrices', 'constraints',
+                           'normalize', 'resolve', 'post_update', 'index',
+                           'views'], [p.name for p in phases])
+        self.assertEquals(set(['Canvas.update_now']), set(p.category for p in phases))
+        self.assertEquals(1, phases[2].count)
+        self.assertEquals([], c.tracer._stack)
+        self.assertEquals(len(phases), len(c.tracer.chrome_trace()))
+
+    def test_item_costs(self):
+        """Test item update costs are recorded per class"""
+        c = Canvas()
+        c.costs = ItemCosts()
+        c.add(Box())
+        c.add(Box())
+        c.add(Line())
+
+        self.assertEquals(2, c.costs.costs[Box, 'pre_update'][0])
+        self.assertEquals(2, c.costs.costs[Box, 'post_update'][0])
+        self.assertEquals(1, c.costs.costs[Line, 'post_update'][0])
+        self.assertEquals(set([Box, Line]),
+                          set(cls for cls, total, methods in c.costs.per_class()))
+
+
 # fixme: what about multiple constraints for a handle?
 #        what about 1d projection?
 
@@ -1,7 +1,7 @@
 
 import unittest
 from gaphas.connector import Position, Handle
-from gaphas.solver import Variable
+from gaphas.solver import Variable, VariableStore
 
 class PositionTestCase(unittest.TestCase):
 
@@ -27,6 +27,25 @@ class PositionTestCase(unittest.TestCase):
         assert x is pos.x
         assert y is pos.y
         
+    def test_store(self):
+        store = VariableStore()
+        pos = Position((1, 2), store=store)
+        self.assertEquals([1, 2], list(store.get_positions([pos])))
+        pos.pos = (3, 4)
+        self.assertEquals([3, 4], list(store.get_positions([pos])))
+
+    def test_default_store(self):
+        store = VariableStore()
+        Position.store = store
+        try:
+            handles = [Handle((i, -i)) for i in range(3)]
+        finally:
+            Position.store = None
+        self.assertEquals(6, len(store))
+        self.assertEquals([0, 0, 1, -1, 2, -2],
+                          list(store.get_positions([h.pos for h in handles])))
+        self.assertEquals(2, len(Position((0, 0)).__dict__))
+
 class HandleTestCase(unittest.TestCase):
 
     def test_handle_x_y(self):
@@ -0,0 +1,142 @@
+"""
+Unit tests for the exporter.
+"""
+
+import os
+import tempfile
+import unittest
+
+import cairo
+
+from gaphas.canvas import Canvas
+from gaphas.examples import Box
+from gaphas.geometry import Rectangle
+from gaphas.export import Exporter, ParallelExporter
+
+
+class ExportTestCase(unittest.TestCase):
+    """
+    Export a canvas with two boxes to a temporary directory.
+    """
+
+    def setUp(self):
+        self.canvas = Canvas()
+        self.box1 = Box(40, 40)
+        self.canvas.add(self.box1)
+        self.box2 = Box(40, 40)
+        self.box2.matrix.translate(200, 100)
+        self.canvas.add(self.box2)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+
+class ExporterTestCase(ExportTestCase):
+
+    def test_bounds(self):
+        """Test the export bounds cover all items, at the given scale"""
+        progress = []
+        exporter = Exporter(self.canvas, scale=2, padding=5,
+                            progress=lambda *args: progress.append(args))
+        b = exporter.bounds
+        assert b.x <= -5 and b.y <= -5, b
+        assert b.x1 >= 485 and b.y1 >= 285, b
+        self.assertEquals([('bounding_box', 2, 2)], progress)
+
+    def test_tiles(self):
+        """Test tiles are culled with the spatial index"""
+        exporter = Exporter(self.canvas, tile_size=100)
+        tiles = list(exporter.tiles(100, 100))
+        self.assertEquals((2, 1), tiles[-1][:2])
+        self.assertEquals([self.box1], exporter.get_items_in_rectangle(tiles[0][2]))
+        self.assertEquals([], exporter.get_items_in_rectangle(tiles[3][2]))
+
+    def test_canvas_index(self):
+        """Test the canvas' spatial index is not changed"""
+        index = self.canvas.index
+        Exporter(self.canvas, scale=2).bounds
+        self.assertEquals(0, len(index))
+
+        self.canvas.set_item_bounds(self.box1, Rectangle(0, 0, 50, 50))
+        exporter = Exporter(self.canvas, scale=2)
+        self.assertEquals((0, 0, 100, 100), tuple(exporter._index.get_bounds(self.box1)))
+        self.assertEquals((0, 0, 50, 50), tuple(self.canvas.get_item_bounds(self.box1)))
+        self.assertEquals(1, len(index))
+
+    def test_write_png(self):
+        """Test the PNG is written in strips"""
+        progress = []
+        filename = os.path.join(self.dir, 'test.png')
+        exporter = Exporter(self.canvas, tile_size=50,
+                            progress=lambda *args: progress.append(args))
+        exporter.write_png(filename)
+        self.assertEquals(('render', 3, 3), progress[-1])
+
+        surface = cairo.ImageSurface.create_from_png(filename)
+        self.assertEquals(int(exporter.bounds.width), surface.get_width())
+        self.assertEquals(int(exporter.bounds.height), surface.get_height())
+
+    def test_write_pdf(self):
+        """Test the PDF is split in pages"""
+        progress = []
+        filename = os.path.join(self.dir, 'test.pdf')
+        exporter = Exporter(self.canvas,
+                            progress=lambda *args: progress.append(args))
+        exporter.write_pdf(filename, page_size=(100, 100))
+        self.assertEquals(('render', 6, 6), progress[-1])
+        assert os.path.getsize(filename) > 0
+
+    def test_write_svg(self):
+        """Test SVG tiles are written"""
+        exporter = Exporter(self.canvas)
+        filenames = exporter.write_svg(os.path.join(self.dir, 'test-%d-%d.svg'), page_size=(100, 100))
+        self.assertEquals(6, len(filenames))
+        for filename in filenames:
+            assert os.path.exists(filename)
+
+
+
+class ParallelExporterTestCase(ExportTestCase):
+
+    def test_write_png(self):
+        """Test tiles rendered by the workers are stitched"""
+        filename = os.path.join(self.dir, 'test.png')
+        Exporter(self.canvas).write_png(filename)
+        expected = cairo.ImageSurface.create_from_png(filename)
+
+        progress = []
+        exporter = ParallelExporter(self.canvas, tile_size=50, processes=2,
+                                    progress=lambda *args: progress.append(args))
+        exporter.write_png(filename)
+        self.assertEquals(('render', 15, 15), progress[-1])
+        surface = cairo.ImageSurface.create_from_png(filename)
+        self.assertEquals(str(expected.get_data()), str(surface.get_data()))
+
+    def test_write_png_tiles(self):
+        """Test PNG tiles are written by the workers"""
+        exporter = ParallelExporter(self.canvas, tile_size=100, processes=2)
+        filenames = exporter.write_png_tiles(os.path.join(self.dir, 'test-%d-%d.png'))
+        self.assertEquals(6, len(filenames))
+        for filename in filenames:
+            assert os.path.exists(filename)
+
+    def test_write_pdf(self):
+        """Test the PDF pages are rendered by the workers"""
+        filename = os.path.join(self.dir, 'test.pdf')
+        exporter = ParallelExporter(self.canvas, processes=2)
+        exporter.write_pdf(filename, page_size=(100, 100), resolution=144)
+        # The resolution does not change the page size
+        f = open(filename, 'rb')
+        try:
+            assert '/MediaBox [ 0 0 100 100 ]' in f.read()
+        finally:
+            f.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:sw=4:et:ai
@@ -4,7 +4,8 @@ Generic gaphas item tests.
 
 import unittest
 
-from gaphas.item import Item
+from gaphas.item import Item, Line
+from gaphas.examples import Box
 from gaphas.constraint import LineAlignConstraint, LineConstraint, \
     EqualsConstraint, LessThanConstraint
 from gaphas.solver import Variable
@@ -94,3 +95,34 @@ class ItemConstraintTestCase(unittest.TestCase):
         self.assertTrue(isinstance(c, LessThanConstraint))
         self.assertEquals(2, c.smaller)
         self.assertEquals(4, c.bigger)
+
+
+class ItemBoundsTestCase(unittest.TestCase):
+    """
+    Declared bounds tests.
+    """
+    def test_no_bounds(self):
+        """
+        Test items are drawn to calculate their bounds by default.
+        """
+        self.assertEquals(None, Item().bounds())
+        self.assertEquals(None, Line().bounds())
+
+
+    def test_box_bounds(self):
+        """
+        Test bounds declared from handles and padding.
+        """
+        box = Box(20, 10)
+        self.assertEquals((-1, -1, 22, 12), tuple(box.bounds()))
+
+
+    def test_line_bounds(self):
+        """
+        Test line bounds include the line width.
+        """
+        line = Line()
+        line.bounds_padding = 0
+        line.line_width = 4
+        self.assertEquals((-2, -2, 14, 14), tuple(line.bounds()))
+
@@ -0,0 +1,125 @@
+"""
+Unit tests for the NumPy solver backend.
+"""
+
+import unittest
+import random
+
+from gaphas.solver import Solver, Variable, JuggleError
+from gaphas.solver import WEAK, NORMAL, STRONG, REQUIRED
+from gaphas.constraint import EquationConstraint, EqualsConstraint, \
+    LessThanConstraint, CenterConstraint, BalanceConstraint
+
+try:
+    from gaphas.numpysolver import NumpySolver
+except ImportError:
+    NumpySolver = None
+
+
+def create_constraints(solver, count):
+    """
+    Create a set of element like constraints: ``count`` boxes with a
+    minimal width, a center point, a port balanced on the right side and
+    a label next to the box.
+    """
+    variables = []
+    for i in xrange(count):
+        left, right, center, top, bottom = [Variable(i * 10 + j, NORMAL)
+                                            for j in range(5)]
+        port, label = Variable(0, WEAK), Variable(0, WEAK)
+        min_width = Variable(10, REQUIRED)
+        solver.add_constraint(LessThanConstraint(smaller=left, bigger=right,
+                                                 delta=min_width))
+        solver.add_constraint(EqualsConstraint(top, bottom, delta=5))
+        solver.add_constraint(CenterConstraint(left, right, center))
+        solver.add_constraint(BalanceConstraint(band=(top, bottom), v=port,
+                                                balance=0.3))
+        solver.add_constraint(EquationConstraint(lambda a, b: a - b - 5,
+                                                 a=label, b=right))
+        variables.append((left, right, center, top, bottom, port, label))
+    return variables
+
+
+@unittest.skipIf(NumpySolver is None, 'NumPy is not installed')
+class NumpySolverTestCase(unittest.TestCase):
+    """
+    Test the NumPy solver backend.
+    """
+    def test_min_size(self):
+        """Test minimal size constraint"""
+        solver = NumpySolver()
+        v1 = Variable(0)
+        v2 = Variable(10)
+        v3 = Variable(10)
+        solver.add_constraint(EqualsConstraint(a=v2, b=v3))
+        solver.add_constraint(LessThanConstraint(smaller=v1, bigger=v3, delta=10))
+        solver.solve()
+
+        v1.value = 2
+        solver.solve()
+        self.assertEquals(0, v1)
+
+        v3.value = 0
+        solver.solve()
+        self.assertEquals(0, v1)
+        self.assertEquals(10, v2)
+        self.assertEquals(10, v3)
+
+    def test_same_result(self):
+        """Test the NumPy backend solves like the default solver"""
+        default, numpy = Solver(), NumpySolver()
+        numpy.min_batch = 1
+        expected = create_constraints(default, 20)
+        actual = create_constraints(numpy, 20)
+        default.solve()
+        numpy.solve()
+
+        r = random.Random(4)
+        for n in range(10):
+            for i, j in [(r.randrange(20), r.randrange(5)) for k in range(5)]:
+                value = r.uniform(-100, 100)
+                expected[i][j].value = value
+                actual[i][j].value = value
+            default.solve()
+            numpy.solve()
+            self.assertEquals([[v.value for v in vs] for vs in expected],
+                              [[v.value for v in vs] for vs in actual])
+
+    def test_remove_constraint(self):
+        """Test slots are released and reused"""
+        solver = NumpySolver()
+        solver.min_batch = 1
+        a, b, c = Variable(1), Variable(2), Variable(3, WEAK)
+        ab = solver.add_constraint(EqualsConstraint(a, b, delta=1))
+        bc = solver.add_constraint(EqualsConstraint(b, c))
+        solver.solve()
+        self.assertEquals(5, len(solver._slot_variables))
+
+        solver.remove_constraint(ab)
+        self.assertEquals(set([b, c]), set(solver._slots))
+        b.value = 10
+        solver.solve()
+        self.assertEquals(10, c.value)
+
+        solver.add_constraint(LessThanConstraint(smaller=c, bigger=a))
+        self.assertEquals(5, len(solver._slot_variables))
+        solver.solve()
+        self.assertEquals(10, a.value)
+
+    def test_juggle_error(self):
+        """Test contradicting constraints raise a JuggleError"""
+        solver = NumpySolver()
+        a, b = Variable(1), Variable(2)
+        solver.add_constraint(EqualsConstraint(a, b, delta=1))
+        solver.add_constraint(EqualsConstraint(b, a, delta=1))
+        try:
+            solver.solve()
+        except JuggleError, e:
+            # Only a few constraints are named
+            self.assert_('2 constraints (' in str(e), str(e))
+        else:
+            self.fail('No JuggleError raised')
+        assert solver._marked_cons, 'Unsolved constraints should stay marked'
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,96 @@
+"""
+Unit tests for the parallel solver.
+"""
+
+import unittest
+
+from gaphas.solver import Solver, Variable
+from gaphas.solver import WEAK, STRONG
+from gaphas.constraint import EqualsConstraint, EquationConstraint
+from gaphas import parallelsolver
+from gaphas.parallelsolver import ParallelSolver
+
+
+def create_clusters(solver, count, size):
+    """
+    Create ``count`` independent chains of ``size`` variables, each
+    variable at least 10 bigger than the previous one.
+    """
+    clusters = []
+    for i in xrange(count):
+        variables = [Variable(i, STRONG)]
+        variables.extend(Variable(i, WEAK) for j in range(size - 1))
+        for a, b in zip(variables[:-1], variables[1:]):
+            solver.add_constraint(EqualsConstraint(a, b, delta=10))
+        clusters.append(variables)
+    return clusters
+
+
+def failing_solve_packed(packed):
+    """
+    Replacement for `parallelsolver.solve_packed()` that fails in the
+    worker process.
+    """
+    raise ValueError('Worker failed')
+
+
+class ParallelSolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.changed = []
+        self.solver = ParallelSolver(processes=2, notify=self.changed.append)
+        self.solver.min_size = 5
+
+    def tearDown(self):
+        self.solver.close()
+
+    def test_same_result(self):
+        """Test the parallel solver solves like the default solver"""
+        default = Solver()
+        expected = create_clusters(default, 4, 20)
+        actual = create_clusters(self.solver, 4, 20)
+        default.solve()
+        self.solver.solve()
+        self.assert_(self.solver._pool)
+        self.assertEquals([[v.value for v in vs] for vs in expected],
+                          [[v.value for v in vs] for vs in actual])
+        self.assertEquals(1, len(self.changed))
+        self.assertEquals(4 * 19, len(self.changed[0]))
+        self.assertEquals([1] * 4, [c.solve_count for c in self.solver.components()])
+
+        # Values written back are not dirty
+        self.assertEquals([], self.solver._marked_cons)
+
+    def test_local(self):
+        """Test small and unpackable components are solved locally"""
+        clusters = create_clusters(self.solver, 1, 20)
+        a, b = Variable(1), Variable(2)
+        self.solver.add_constraint(EquationConstraint(lambda a, b: a - b, a=a, b=b))
+        small = create_clusters(self.solver, 1, 2)
+        self.solver.solve()
+        self.assertEquals(None, self.solver._pool)
+        self.assertEquals(190, clusters[0][-1].value)
+        self.assertEquals(a.value, b.value)
+        self.assertEquals(10, small[0][-1].value)
+        self.assertEquals([], self.changed)
+
+    def test_keep_marked_on_error(self):
+        """Test constraints stay marked if a worker fails"""
+        clusters = create_clusters(self.solver, 4, 20)
+        marked = len(self.solver._marked_cons)
+        solve_packed = parallelsolver.solve_packed
+        parallelsolver.solve_packed = failing_solve_packed
+        try:
+            self.assertRaises(ValueError, self.solver.solve)
+        finally:
+            parallelsolver.solve_packed = solve_packed
+        self.assertEquals(marked, len(self.solver._marked_cons))
+
+        # The workers were started with the failing function
+        self.solver.close()
+        self.solver.solve()
+        self.assertEquals(190, clusters[0][-1].value)
+        self.assertEquals([], self.solver._marked_cons)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,121 @@
+
+import unittest
+import random
+import pickle
+from gaphas.rtree import RTree
+from gaphas.geometry import rectangle_contains, rectangle_intersects, \
+        distance_rectangle_point
+
+
+class RTreeTestCase(unittest.TestCase):
+
+    def check(self, rtree, items):
+        """
+        Compare the results of rtree queries with a brute force search in
+        ``items`` (a name -> bounds dict).
+        """
+        r = random.Random(1)
+        for n in range(20):
+            rect = (r.uniform(-500, 500), r.uniform(-500, 500),
+                    r.uniform(0, 300), r.uniform(0, 300))
+            self.assertEquals(set(i for i, b in items.iteritems()
+                                  if rectangle_intersects(b, rect)),
+                              rtree.find_intersect(rect))
+            self.assertEquals(set(i for i, b in items.iteritems()
+                                  if rectangle_contains(b, rect)),
+                              rtree.find_inside(rect))
+            pos = rect[:2]
+            nearest = rtree.find_nearest(pos)
+            if items:
+                self.assertEquals(min(distance_rectangle_point(b, pos) for b in items.itervalues()),
+                                  distance_rectangle_point(items[nearest], pos))
+            else:
+                self.assertEquals(None, nearest)
+
+        # Boxes of nodes contain their children
+        stack = [rtree._root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                for item in node.children:
+                    self.assert_(rtree._leaves[item] is node)
+                    x0, y0, x1, y1 = rtree._ids[item][2]
+                    self.assert_(rectangle_contains((x0, y0, x1 - x0, y1 - y0),
+                                                    rtree.get_soft_bounds()))
+            else:
+                for child in node.children:
+                    self.assert_(child.parent is node)
+                stack.extend(node.children)
+        self.assertEquals(len(items), len(rtree))
+
+    def test_queries(self):
+        rtree = RTree(capacity=4)
+        items = {}
+        r = random.Random(0)
+        for i in range(300):
+            items[i] = (r.uniform(-500, 500), r.uniform(-500, 500),
+                        r.uniform(0, 50), r.uniform(0, 50))
+            rtree.add(i, items[i])
+        self.check(rtree, items)
+
+        rtree.rebuild()
+        self.check(rtree, items)
+
+        # Move items around
+        for i in range(0, 300, 3):
+            x, y, w, h = items[i]
+            items[i] = (x + r.uniform(-20, 20), y + r.uniform(-20, 20), w, h)
+            rtree.add(i, items[i])
+        self.check(rtree, items)
+
+        for i in range(0, 300, 2):
+            rtree.remove(i)
+            del items[i]
+        self.check(rtree, items)
+
+        for i in items.keys():
+            rtree.remove(i)
+        items.clear()
+        self.check(rtree, items)
+        self.assertEquals((0, 0, 0, 0), rtree.soft_bounds)
+
+    def test_get_data(self):
+        """
+        Extra data may be added to a node:
+        """
+        rtree = RTree()
+        for i in range(0, 100, 10):
+            for j in range(0, 100, 10):
+                rtree.add("%dx%d" % (i, j), (i, j, 10, 10), i+j)
+
+        for i in range(0, 100, 10):
+            for j in range(0, 100, 10):
+                assert i+j == rtree.get_data("%dx%d" % (i, j))
+
+    def test_pickle(self):
+        rtree = RTree(capacity=4)
+        items = {}
+        for i in range(50):
+            items[i] = (i * 10, i * 5, 10, 10)
+            rtree.add(i, items[i])
+        rtree.find_nearest((0, 0))
+
+        rtree = pickle.loads(pickle.dumps(rtree))
+        self.assertEquals(4, rtree._capacity)
+        self.check(rtree, items)
+
+
+    def test_unbounded(self):
+        rtree = RTree((0, 0, 100, 100))
+        rtree.add(1, (-100, -100, 120, 120))
+        rtree.add(2, (1e6, 1e6, 10, 10))
+        rtree.resize((0, 0, 10, 10))
+        self.assertEquals(set([1]), rtree.find_intersect((-50, -50, 1, 1)))
+        self.assertEquals(set([2]), rtree.find_inside((0, 0, 2e6, 2e6)))
+        self.assertEquals(2, rtree.find_nearest((1e7, 1e6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:sw=4:et:ai
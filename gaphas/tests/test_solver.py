@@ -5,7 +5,11 @@ Unit tests for Gaphas' solver.
 import unittest
 from timeit import Timer
 
-from gaphas.solver import Solver, Variable
+import pickle
+
+from gaphas.solver import Solver, DependencySolver, Variable, JuggleError
+from gaphas.solver import VariableStore, Components, Projection, SolverStatistics
+from gaphas.solver import VERY_WEAK, WEAK, NORMAL, STRONG
 from gaphas.constraint import EquationConstraint, EqualsConstraint, \
     LessThanConstraint
 
@@ -137,6 +141,340 @@ class SizeTestCase(unittest.TestCase):
 
 
 
+class CountingEqualsConstraint(EqualsConstraint):
+    """
+    Equals constraint that counts the number of times it's solved.
+    """
+    count = 0
+
+    def solve_for(self, var):
+        self.count += 1
+        super(CountingEqualsConstraint, self).solve_for(var)
+
+
+class CountingProjection(Projection):
+    """
+    Projection that counts how often its variable is requested.
+    """
+    count = 0
+
+    def variable(self):
+        CountingProjection.count += 1
+        return super(CountingProjection, self).variable()
+
+
+class ConstraintsWithVariableTestCase(unittest.TestCase):
+    """
+    Test constraint lookup by variable.
+    """
+    def test_lookup(self):
+        """Test only the constraints of the variables are examined"""
+        solver = Solver()
+        variables = [Variable(i) for i in range(100)]
+        for a, b in zip(variables[:-1], variables[1:]):
+            solver.add_constraint(EqualsConstraint(CountingProjection(a),
+                                                   CountingProjection(b)))
+        a, b, c = variables[10:13]
+        ab = solver.add_constraint(EqualsConstraint(a, b))
+
+        CountingProjection.count = 0
+        found = list(solver.constraints_with_variable(a, b))
+        self.assertEquals(2, len(found))
+        self.assert_(ab in found)
+        self.assertEquals(1, len(list(solver.constraints_with_variable(b, c))))
+        self.assertEquals([ab], list(solver.constraints_with_variable(b)))
+        self.assert_(CountingProjection.count < 20, CountingProjection.count)
+
+        solver.remove_constraint(ab)
+        self.assertEquals(1, len(list(solver.constraints_with_variable(a, b))))
+        self.assertEquals([], list(solver.constraints_with_variable(a, c)))
+        self.assertEquals([], list(solver.constraints_with_variable(Variable())))
+
+
+
+class DependencySolverTestCase(unittest.TestCase):
+    """
+    Test the dependency based solver.
+    """
+    def test_min_size(self):
+        """Test minimal size constraint"""
+        solver = DependencySolver()
+        v1 = Variable(0)
+        v2 = Variable(10)
+        v3 = Variable(10)
+        solver.add_constraint(EqualsConstraint(a=v2, b=v3))
+        solver.add_constraint(LessThanConstraint(smaller=v1, bigger=v3, delta=10))
+        solver.solve()
+
+        v3.value = 0
+        solver.solve()
+
+        self.assertEquals(0, v1)
+        self.assertEquals(10, v2)
+        self.assertEquals(10, v3)
+
+    def test_solve_once(self):
+        """Test each constraint in a chain is solved once"""
+        solver = DependencySolver()
+        variables = [Variable(0, strength) for strength in (STRONG, NORMAL, WEAK)]
+        variables.append(Variable(0, VERY_WEAK))
+        # Add the constraints in reverse order
+        constraints = [CountingEqualsConstraint(a, b)
+                       for a, b in zip(variables[:-1], variables[1:])]
+        for c in reversed(constraints):
+            solver.add_constraint(c)
+        solver.solve()
+        for c in constraints:
+            c.count = 0
+
+        variables[0].value = 5
+        solver.solve()
+        self.assertEquals([1, 1, 1], [c.count for c in constraints])
+        self.assertEquals([5] * 4, [v.value for v in variables])
+        self.assertEquals([], solver.cycles)
+
+    def test_juggle_error(self):
+        """Test contradicting constraints raise a JuggleError"""
+        solver = DependencySolver()
+        a, b = Variable(1), Variable(2)
+        solver.add_constraint(EqualsConstraint(a, b, delta=1))
+        solver.add_constraint(EqualsConstraint(b, a, delta=1))
+        self.assertRaises(JuggleError, solver.solve)
+        self.assertEquals(1, len(solver.cycles))
+
+    def test_juggle_error_message(self):
+        """Test the JuggleError message names a few constraints only"""
+        solver = DependencySolver()
+        for i in xrange(100):
+            a, b = Variable(1), Variable(2)
+            solver.add_constraint(EqualsConstraint(a, b, delta=1))
+            solver.add_constraint(EqualsConstraint(b, a, delta=1))
+        try:
+            solver.solve()
+        except JuggleError, e:
+            self.assert_('100 constraints (' in str(e), str(e))
+            self.assert_(len(str(e)) < 1000, len(str(e)))
+        else:
+            self.fail('No JuggleError raised')
+
+
+
+class WorkQueueTestCase(unittest.TestCase):
+    """
+    Test the queue of marked constraints.
+    """
+    def test_request_resolve_order(self):
+        """Test constraints marked again move to the end of the queue"""
+        solver = Solver()
+        a, b, c = Variable(1), Variable(2), Variable(3)
+        ab = solver.add_constraint(EqualsConstraint(a, b))
+        bc = solver.add_constraint(EqualsConstraint(b, c))
+        self.assertEquals([ab, bc], solver._marked_cons)
+        a.value = 4
+        self.assertEquals([bc, ab], solver._marked_cons)
+        c.value = 4
+        self.assertEquals([ab, bc], solver._marked_cons)
+        solver.remove_constraint(ab)
+        self.assertEquals([bc], solver._marked_cons)
+        solver.solve()
+        self.assertEquals([], solver._marked_cons)
+
+    def test_compact(self):
+        """Test the queue does not grow when constraints are marked often"""
+        solver = Solver()
+        a, b = Variable(1), Variable(2)
+        solver.add_constraint(EqualsConstraint(a, b))
+        for i in xrange(1000):
+            a.value = i
+        self.assertEquals(1, len(solver._marked_cons))
+        self.assert_(len(solver._marked_cons._items) < 100)
+
+    def test_juggle_error(self):
+        """Test contradicting constraints raise a JuggleError"""
+        solver = Solver()
+        a, b = Variable(1), Variable(2)
+        solver.add_constraint(EqualsConstraint(a, b, delta=1))
+        solver.add_constraint(EqualsConstraint(b, a, delta=1))
+        self.assertRaises(JuggleError, solver.solve)
+
+
+
+class StatisticsTestCase(unittest.TestCase):
+    """
+    Test solver statistics.
+    """
+    def test_callback(self):
+        """Test statistics are reported per solve() call"""
+        recorded = []
+        solver = Solver()
+        solver.statistics = SolverStatistics(recorded.append, keep=2)
+        variables = [Variable(0, strength) for strength in (STRONG, NORMAL, WEAK)]
+        solver.add_constraint(EqualsConstraint(variables[0], variables[1]))
+        solver.add_constraint(CountingEqualsConstraint(variables[1], variables[2]))
+        for i in range(3):
+            variables[0].value = i + 1
+            solver.solve()
+
+        self.assertEquals(3, len(recorded))
+        self.assertEquals(recorded[1:], solver.statistics.solves)
+        stats = recorded[-1]
+        self.assertEquals(1, stats.solve_count)
+        self.assertEquals(sum(stats.constraint_counts.values()), stats.constraint_count)
+        self.assertEquals(stats.constraint_count - 2, stats.requeue_count)
+        self.assertEquals(set([EqualsConstraint, CountingEqualsConstraint]), set(stats.class_times))
+        self.assertEquals(max(stats.constraint_counts.values()), stats.worst(1)[0][1])
+
+        summary = solver.statistics.summary()
+        self.assertEquals(2, summary.solve_count)
+        self.assertEquals(recorded[1].constraint_count + recorded[2].constraint_count,
+                          summary.constraint_count)
+
+    def test_pickle(self):
+        """Test statistics are not pickled"""
+        solver = Solver()
+        solver.statistics = SolverStatistics(lambda stats: None)
+        solver = pickle.loads(pickle.dumps(solver))
+        self.assertEquals(None, solver.statistics)
+
+
+
+class ComponentsTestCase(unittest.TestCase):
+    """
+    Test partitioning of constraints in connected components.
+    """
+    def test_clusters(self):
+        """Test only dirty clusters are solved"""
+        solver = Solver()
+        clusters = []
+        for i in range(10):
+            variables = [Variable(i, strength) for strength in (STRONG, NORMAL, WEAK)]
+            solver.add_constraint(EqualsConstraint(variables[0], variables[1]))
+            solver.add_constraint(EqualsConstraint(variables[1], variables[2], delta=5))
+            clusters.append(variables)
+        solver.solve()
+        self.assertEquals(10, len(solver.components()))
+
+        clusters[3][0].value = 20
+        solver.solve()
+        self.assertEquals([20, 20, 25], [v.value for v in clusters[3]])
+        counts = sorted(c.solve_count for c in solver.components())
+        self.assertEquals([1] * 9 + [2], counts)
+
+    def test_merge_and_split(self):
+        """Test components are merged and split again"""
+        components = Components()
+        variables = [Variable(i) for i in range(6)]
+        constraints = [EqualsConstraint(a, b)
+                       for a, b in zip(variables[:-1], variables[1:])]
+        for c in constraints[::2]:
+            components.add(c)
+        self.assertEquals(3, len(components))
+        for c in constraints[1::2]:
+            components.add(c)
+        self.assertEquals(1, len(components))
+        self.assertEquals(set(variables), components.components()[0].variables)
+
+        components.remove(constraints[2])
+        self.assertEquals(2, len(components))
+        self.assertEquals(set(variables[:3]), components.component_of(constraints[0]).variables)
+        self.assertEquals(set(variables[3:]), components.component_of(constraints[4]).variables)
+        self.assertEquals(None, components.component_of(constraints[2]))
+
+        components.remove(constraints[0])
+        components.remove(constraints[1])
+        self.assertEquals(1, len(components))
+        self.assertEquals([(None, [constraints[1]])],
+                          components.partition([constraints[1]]))
+
+    def test_remove_from_solver(self):
+        """Test the solver keeps components up to date"""
+        solver = Solver()
+        a, b, c = Variable(1), Variable(2), Variable(3)
+        ab = solver.add_constraint(EqualsConstraint(a, b))
+        bc = solver.add_constraint(EqualsConstraint(b, c))
+        self.assertEquals(1, len(solver.components()))
+        solver.remove_constraint(bc)
+        self.assertEquals(1, len(solver.components()))
+        self.assertEquals(set([a, b]), solver.components()[0].variables)
+        solver.remove_constraint(ab)
+        self.assertEquals([], solver.components())
+
+    def test_reconnect(self):
+        """Test components are not split when solving"""
+        solver = Solver()
+        hub = Variable(1)
+        constraints = [solver.add_constraint(EqualsConstraint(hub, Variable()))
+                       for i in range(4)]
+        solver.solve()
+        component = solver.components()[0]
+
+        solver.remove_constraint(constraints[0])
+        solver.add_constraint(constraints[0])
+        solver.solve()
+        assert solver._components.partition(constraints[:1])[0][0] is component
+        self.assertEquals(2, component.solve_count)
+
+    def test_keep_marked_on_error(self):
+        """Test constraints stay marked if solving fails"""
+        class FailingConstraint(EqualsConstraint):
+            def solve_for(self, var):
+                raise ValueError, 'Failed'
+        solver = Solver()
+        a, b, c, d = Variable(1), Variable(2), Variable(3), Variable(4)
+        ab = solver.add_constraint(EqualsConstraint(a, b))
+        bc = solver.add_constraint(FailingConstraint(b, c))
+        cd = solver.add_constraint(EqualsConstraint(c, d))
+        other = solver.add_constraint(EqualsConstraint(Variable(), Variable()))
+        self.assertRaises(ValueError, solver.solve)
+        # ab is marked again, since it changed a
+        self.assertEquals([bc, cd, ab, other], list(solver._marked_cons))
+
+
+
+class VariableStoreTestCase(unittest.TestCase):
+    """
+    Test array backed variables.
+    """
+    def test_solve(self):
+        """Test stored variables can be solved"""
+        store = VariableStore()
+        solver = Solver()
+        a, b = store.variable(1), store.variable(2, WEAK)
+        c = Variable(3, WEAK)
+        solver.add_constraint(EqualsConstraint(a, b))
+        solver.add_constraint(EqualsConstraint(b, c, delta=1))
+        a.value = 4
+        solver.solve()
+        self.assertEquals([4, 4], list(store.get_values([a, b])))
+        self.assertEquals(5, c)
+
+    def test_pickle(self):
+        """Test stored variables can be pickled, along with their store"""
+        store = VariableStore()
+        solver = Solver()
+        a, b = store.variable(1), store.variable(2, WEAK)
+        solver.add_constraint(EqualsConstraint(a, b))
+        solver.solve()
+
+        a, b, solver = pickle.loads(pickle.dumps((a, b, solver)))
+        self.assert_(a._store is b._store)
+        self.assertEquals((1, 1), (a.value, b.value))
+        self.assertEquals(WEAK, b.strength)
+        a.value = 3
+        solver.solve()
+        self.assertEquals(3, b.value)
+
+    def test_plain_variable_pickle(self):
+        """Test slotted variables can be pickled"""
+        solver = Solver()
+        a, b = Variable(1), Variable(2, WEAK)
+        solver.add_constraint(EqualsConstraint(a, b))
+        a, b, solver = pickle.loads(pickle.dumps((a, b, solver)))
+        solver.solve()
+        self.assertEquals(1, b.value)
+
+
+
 class SolverSpeedTestCase(unittest.TestCase):
     """
     Solver speed tests.
@@ -0,0 +1,177 @@
+"""
+Unit tests for the tile cache.
+"""
+
+import unittest
+
+import cairo
+from cairo import Matrix
+
+from gaphas.canvas import Context
+from gaphas.freehand import FreeHandCairoContext
+from gaphas.geometry import Rectangle
+from gaphas.painter import Painter, PainterChain
+from gaphas.tilecache import TileCache, ItemCache
+
+
+class TileCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rendered = []
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 200, 200)
+        self.cache = TileCache(tile_size=100, max_tiles=6)
+
+    def render(self, cr, area):
+        self.rendered.append(tuple(area))
+        cr.set_source_rgb(1, 0, 0)
+        cr.rectangle(*area)
+        cr.fill()
+
+    def paint(self, area=(0, 0, 200, 200), matrix=None):
+        self.cache.set_matrix(matrix or Matrix())
+        cr = cairo.Context(self.surface)
+        self.cache.paint(cr, area, self.render)
+
+    def test_reuse(self):
+        """Test valid tiles are not rendered again"""
+        self.paint()
+        self.assertEquals(4, len(self.rendered))
+        self.assertEquals(4, len(self.cache))
+        self.paint()
+        self.assertEquals(4, len(self.rendered))
+        self.assertEquals(4, self.cache.render_count)
+
+    def test_invalidate(self):
+        """Test only the invalidated part of a tile is rendered"""
+        self.paint()
+        del self.rendered[:]
+        self.cache.invalidate((90, 10, 20, 10))
+        self.paint()
+        self.assertEquals([(90, 100), (100, 110)], sorted((r[0], r[0] + r[2]) for r in self.rendered))
+
+        del self.rendered[:]
+        self.cache.invalidate()
+        self.paint()
+        self.assertEquals(4, len(self.rendered))
+
+    def test_scroll(self):
+        """Test tiles are reused when scrolling by whole pixels"""
+        self.paint()
+        del self.rendered[:]
+        self.paint(matrix=Matrix(x0=-100))
+        self.assertEquals(2, len(self.rendered))
+
+        # Zooming drops all tiles
+        self.paint(matrix=Matrix(xx=2, yy=2))
+        self.assertEquals(6, len(self.rendered))
+        self.assertEquals(4, len(self.cache))
+
+    def test_max_tiles(self):
+        """Test invisible tiles are dropped"""
+        self.paint()
+        self.paint(matrix=Matrix(x0=-200))
+        self.assertEquals(6, len(self.cache))
+        self.paint(matrix=Matrix(x0=-400))
+        self.assertEquals(6, len(self.cache))
+
+    def test_uncacheable_painters(self):
+        """Test only cacheable painters render in tiles"""
+        painted = []
+        class Recorder(Painter):
+            def paint(self, context):
+                painted.append(self)
+        tile, overlay = Recorder(), Recorder()
+        overlay.cacheable = False
+        chain = PainterChain().append(tile).append(PainterChain().append(overlay))
+
+        chain.paint(Context(cacheable=True))
+        self.assertEquals([tile], painted)
+        del painted[:]
+        chain.paint(Context(cacheable=False))
+        self.assertEquals([overlay], painted)
+        del painted[:]
+        chain.paint(Context())
+        self.assertEquals([tile, overlay], painted)
+
+
+class ItemView(object):
+    """
+    A minimal view with items at a position.
+    """
+    selected_items = ()
+    focused_item = hovered_item = dropzone_item = None
+
+    def __init__(self):
+        self.matrices = {}
+
+    def get_item_bounding_box(self, item):
+        m = self.matrices[item]
+        return Rectangle(m[4] - 5, m[5] - 5, 20, 20)
+
+    def get_matrix_i2v(self, item):
+        return self.matrices[item]
+
+
+class ItemRecorder(object):
+    """
+    A painter that records the items it renders.
+    """
+    def __init__(self, view):
+        self.view = view
+        self.rendered = []
+
+    def _render_item(self, item, cairo, area=None):
+        self.rendered.append(item)
+
+
+class ItemCacheTestCase(unittest.TestCase):
+
+    def test_translate(self):
+        """Test cached items are painted when moved"""
+        view = ItemView()
+        painter = ItemRecorder(view)
+        cache = ItemCache()
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+
+        view.matrices['a'] = Matrix(x0=10, y0=10)
+        self.assert_(cache.paint(cr, painter, 'a'))
+        view.matrices['a'] = Matrix(x0=20.5, y0=10)
+        self.assert_(cache.paint(cr, painter, 'a'))
+        self.assertEquals(['a'], painter.rendered)
+
+        # Zooming renders the item again
+        view.matrices['a'] = Matrix(xx=2, yy=2)
+        self.assert_(cache.paint(cr, painter, 'a'))
+        self.assertEquals(['a', 'a'], painter.rendered)
+
+        cache.invalidate(['a'])
+        self.assert_('a' not in cache)
+        self.assertEquals(0, cache._pixels)
+
+    def test_classes(self):
+        """Test only items of the provided classes are cached"""
+        view = ItemView()
+        painter = ItemRecorder(view)
+        cache = ItemCache(classes=(int,))
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+        view.matrices['a'] = view.matrices[1] = Matrix()
+        self.assert_(not cache.paint(cr, painter, 'a'))
+        self.assert_(cache.paint(cr, painter, 1))
+        self.assertEquals(1, len(cache))
+
+    def test_wrapped_context(self):
+        """Test items drawn on a wrapped cairo context are not cached"""
+        view = ItemView()
+        painter = ItemRecorder(view)
+        cache = ItemCache()
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+        view.matrices['a'] = Matrix()
+        self.assert_(not cache.paint(FreeHandCairoContext(cr), painter, 'a'))
+        self.assertEquals(0, len(cache))
+        self.assertEquals([], painter.rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:sw=4:et:ai
@@ -1,5 +1,6 @@
 
 import unittest
+import random
 from gaphas.tree import Tree
 
 
@@ -159,5 +160,81 @@ class TreeTestCase(unittest.TestCase):
         tree.reparent(n4, parent=None, index=0)
         assert tree.nodes == [n4, n5, n1, n2, n3], tree.nodes
 
+    def test_order_keys(self):
+        """
+        Order keys follow the nodes list, also when nodes are inserted in
+        front of each other over and over (which exhausts the key space).
+        """
+        tree = Tree()
+        tree.add('root')
+        for n in range(40):
+            tree.add(n, parent='root', index=0)
+        tree.add('last')
+        tree.reparent(39, 'last')
+
+        assert tree.nodes == ['root'] + range(38, -1, -1) + ['last', 39], tree.nodes
+        assert tree._keys == sorted(tree._keys)
+        assert [tree._order[n] for n in tree.nodes] == tree._keys
+        assert tree.sort([0, 'last', 'root', 39]) == ['root', 0, 'last', 39]
+
+        tree.remove('root')
+        assert tree.nodes == ['last', 39], tree.nodes
+        assert len(tree._keys) == len(tree._order) == 2
+
+    def test_ancestors(self):
+        """
+        Cached ancestors are updated when nodes are moved or removed.
+        """
+        tree = Tree()
+        tree.add_many(['a', 'b', 'c', 'd', 'e'], [None, 'a', 'b', None, 'd'])
+        assert list(tree.get_ancestors('c')) == ['b', 'a']
+        assert tree.get_depth('c') == 2
+        assert tree.is_descendant('c', 'a')
+        assert not tree.is_descendant('e', 'a')
+
+        tree.reparent('b', 'e')
+        assert list(tree.get_ancestors('c')) == ['b', 'e', 'd']
+        assert tree.get_depth('b') == 2
+        assert not tree.is_descendant('c', 'a')
+        assert tree.is_descendant('c', 'd')
+
+        tree.remove('b')
+        tree.add('b')
+        tree.add('c', 'a')
+        assert list(tree.get_ancestors('c')) == ['a']
+        assert tree.get_depth('b') == 0
+
+    def test_add_many(self):
+        """
+        Adding nodes in bulk results in the same tree as adding them one
+        by one.
+        """
+        r = random.Random(0)
+        nodes = range(1, 101)
+        parents = [None] + [r.choice([None] + nodes[:i]) for i in range(1, len(nodes))]
+
+        tree1 = Tree()
+        for node, parent in zip(nodes, parents):
+            tree1.add(node, parent)
+
+        tree2 = Tree()
+        tree2.add_many(nodes[:10], parents[:10])
+        tree2.add_many(nodes[10:], parents[10:])
+        assert tree2.nodes == tree1.nodes, tree2.nodes
+        assert tree2._children == tree1._children
+        assert tree2._parents == tree1._parents
+        assert tree2._keys == sorted(tree2._keys)
+        assert [tree2._order[n] for n in tree2.nodes] == tree2._keys
+
+        removed = [n for n in tree1.nodes if n % 3 == 0]
+        removed = tree1.sort(set(removed + [c for n in removed for c in tree1.get_all_children(n)]))
+        for node in reversed(removed):
+            tree1.remove(node)
+        tree2.remove_many(removed)
+        assert tree2.nodes == tree1.nodes, tree2.nodes
+        assert tree2._children == tree1._children
+        assert tree2._parents == tree1._parents
+        assert [tree2._order[n] for n in tree2.nodes] == tree2._keys
+
 
 # vi:sw=4:et:ai
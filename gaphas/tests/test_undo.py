@@ -93,6 +93,36 @@ class UndoTestCase(unittest.TestCase):
 
 #        self.assertEquals(list(canvas.solver.constraints_with_variable(line.handles()[-1].pos.x)))
 #        self.assertTrue(list(canvas.solver.constraints_with_variable(line.handles()[-1].pos.y)))
+
+    def testUndoAddMany(self):
+        b1, b2, b3 = Box(), Box(), Box()
+        canvas = Canvas()
+        canvas.add(b3)
+
+        del undo_list[:]
+        canvas.add_many([b1, b2], [None, b1])
+        self.assertEquals(1, len(undo_list))
+        self.assertEquals([b3, b1, b2], canvas.get_all_items())
+        self.assertEquals(6, len(canvas.solver.constraints))
+
+        undo()
+        self.assertEquals([b3], canvas.get_all_items())
+        self.assertEquals(2, len(canvas.solver.constraints))
+
+    def testUndoRemoveMany(self):
+        b1, b2, b3 = Box(), Box(), Box()
+        canvas = Canvas()
+        canvas.add_many([b1, b2, b3], [None, b1, None])
+
+        del undo_list[:]
+        canvas.remove_many([b1])
+        self.assertEquals(1, len(undo_list))
+        self.assertEquals([b3], canvas.get_all_items())
+
+        undo()
+        self.assertEquals([b1, b2, b3], canvas.get_all_items())
+        self.assertEquals(b1, canvas.get_parent(b2))
+        self.assertEquals(6, len(canvas.solver.constraints))
         
 if __name__ == '__main__':
     unittest.main()
@@ -4,11 +4,15 @@ Test cases for the View class.
 
 import unittest
 import gtk
+import cairo
 from gaphas.view import View, GtkView
 from gaphas.canvas import Canvas, Context
+from gaphas.geometry import Rectangle
 from gaphas.item import Line
 from gaphas.examples import Box
 from gaphas.tool import HoverTool
+from gaphas.quadtree import Quadtree
+from gaphas.painter import ItemPainter
 
 
 class ViewTestCase(unittest.TestCase):
@@ -76,8 +80,8 @@ class ViewTestCase(unittest.TestCase):
         while gtk.events_pending():
             gtk.main_iteration()
 
-        assert len(view._qtree._ids) == 1
-        assert not view._qtree._bucket.bounds == (0, 0, 0, 0), view._qtree._bucket.bounds
+        assert len(canvas.index) == 1
+        assert not canvas.index.soft_bounds == (0, 0, 0, 0), canvas.index.soft_bounds
 
         assert view.get_item_at_point((10, 10)) is box
         assert view.get_item_at_point((60, 10)) is None
@@ -101,16 +105,117 @@ class ViewTestCase(unittest.TestCase):
         while gtk.events_pending():
             gtk.main_iteration()
 
-        assert len(canvas.get_all_items()) == len(view._qtree)
+        assert len(canvas.get_all_items()) == len(canvas.index)
 
         view.focused_item = box
         canvas.remove(box)
 
         assert len(canvas.get_all_items()) == 0
-        assert len(view._qtree) == 0
+        assert len(canvas.index) == 0
 
         window.destroy()
 
+    def test_quadtree_index(self):
+        """
+        A canvas can use another spatial index.
+        """
+        canvas = Canvas(index=Quadtree((-2000, -2000, 4000, 4000)))
+        view = GtkView(canvas)
+        window = gtk.Window(gtk.WINDOW_TOPLEVEL)
+        window.add(view)
+        window.show_all()
+
+        box = Box()
+        canvas.add(box)
+        box.matrix.translate(-1000, -1000)
+        canvas.request_matrix_update(box)
+        canvas.update_now()
+
+        while gtk.events_pending():
+            gtk.main_iteration()
+
+        assert len(canvas.index) == 1
+        assert view.get_item_at_point((-990, -990)) is box
+        assert view.get_item_at_point((60, 10)) is None
+
+        canvas.remove(box)
+        assert len(canvas.index) == 0
+
+        window.destroy()
+
+    def test_shared_index(self):
+        """
+        Views share the canvas' index. Zooming a view does not change it.
+        """
+        canvas = Canvas()
+        view1 = GtkView(canvas)
+        view2 = GtkView(canvas)
+        window = gtk.Window(gtk.WINDOW_TOPLEVEL)
+        box = gtk.VBox()
+        box.add(view1)
+        box.add(view2)
+        window.add(box)
+        window.show_all()
+
+        item = Box()
+        canvas.add(item)
+        item.matrix.translate(10, 10)
+        canvas.request_matrix_update(item)
+        canvas.update_now()
+
+        while gtk.events_pending():
+            gtk.main_iteration()
+
+        bounds = canvas.get_item_bounds(item)
+        m = view1.bounding_box_margin
+        expected = Rectangle(*bounds)
+        expected.expand(m)
+        assert tuple(view1.get_item_bounding_box(item)) == tuple(expected)
+        assert tuple(view2.get_item_bounding_box(item)) == tuple(expected)
+
+        view1.zoom(2)
+        assert canvas.get_item_bounds(item) == bounds
+        assert tuple(view2.get_item_bounding_box(item)) == tuple(expected)
+        b = view1.get_item_bounding_box(item)
+        assert (b.x, b.y, b.width, b.height) == \
+                (bounds.x * 2 - m, bounds.y * 2 - m,
+                 bounds.width * 2 + 2 * m, bounds.height * 2 + 2 * m), b
+
+        assert view1.get_item_at_point((30, 30)) is item
+        assert view2.get_item_at_point((30, 30)) is None
+        assert view2.get_item_at_point((15, 15)) is item
+
+        window.destroy()
+
+    def test_zoomed_bounds(self):
+        """
+        The bounds in the index do not depend on the zoom level of the view
+        that calculated them.
+        """
+        canvas = Canvas()
+        box = Box(100, 50)
+        box.bounds_padding = None
+        canvas.add(box)
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+
+        view = View(canvas)
+        view.update_bounding_box(cr)
+        bounds = canvas.get_item_bounds(box)
+        assert bounds.width < 110 and bounds.height < 60, bounds
+
+        view.zoom(0.05)
+        view.update_bounding_box(cr)
+        zoomed = canvas.get_item_bounds(box)
+        for a, b in zip(bounds, zoomed):
+            assert abs(a - b) < 3, (bounds, zoomed)
+
+        # The margin for the handles is added in view coordinates
+        b = view.get_item_bounding_box(box)
+        assert b.x == zoomed.x * 0.05 - view.bounding_box_margin, b
+        assert view.get_items_in_rectangle((5.5, 2.5, 10, 10)) == [box]
+        assert view.get_items_in_rectangle((-10, -10, 25, 25), intersect=False) == [box]
+        assert view.get_items_in_rectangle((-5, -5, 15, 15), intersect=False) == []
+
     def test_view_registration(self):
         canvas = Canvas()
 
@@ -208,6 +313,65 @@ class ViewTestCase(unittest.TestCase):
         assert sc.get_vadjustment() is view.vadjustment
 
 
+    def test_level_of_detail(self):
+        """
+        Items smaller than lod_size are drawn as proxies.
+        """
+        drawn = []
+        class LodBox(Box):
+            def draw(self, context):
+                drawn.append('draw')
+                super(LodBox, self).draw(context)
+            def draw_proxy(self, context):
+                drawn.append(tuple(context.bounds))
+
+        canvas = Canvas()
+        box = LodBox(10, 10)
+        canvas.add(box)
+        view = View(canvas)
+        painter = ItemPainter(view, lod_size=20)
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+
+        view.update_bounding_box(cr)
+        del drawn[:]
+        painter.paint(Context(cairo=cr, items=[box], area=None))
+        # Declared bounds, without the view's handle margin
+        self.assertEquals([(-1, -1, 12, 12)], drawn)
+
+        view.zoom(4)
+        view.update_bounding_box(cr)
+        del drawn[:]
+        painter.paint(Context(cairo=cr, items=[box], area=None))
+        self.assertEquals(['draw'], drawn)
+
+
+    def test_declared_bounds(self):
+        """
+        Declared bounds are used instead of drawing the item.
+        """
+        drawn = []
+        class DeclaredBox(Box):
+            def draw(self, context):
+                drawn.append(self)
+                super(DeclaredBox, self).draw(context)
+
+        canvas = Canvas()
+        box = DeclaredBox(20, 10)
+        box.matrix.translate(10, 10)
+        canvas.add(box)
+        view = View(canvas)
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 100, 100))
+
+        view.update_bounding_box(cr)
+        self.assertEquals([], drawn)
+        declared = view.get_item_bounding_box(box)
+
+        box.bounds_padding = None
+        view.update_bounding_box(cr)
+        self.assertEquals([box], drawn)
+        self.assertEquals(declared, view.get_item_bounding_box(box))
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,324 @@
+"""
+Render caches for `view.GtkView`.
+
+Tile cache
+----------
+The view is rendered in square tiles (cairo image surfaces). When an area
+of the view is exposed, the tiles covering it are copied to the screen.
+Only tiles that have been invalidated (`GtkView.queue_draw_area()` and
+`GtkView.queue_draw_item()` invalidate the areas they redraw) are rendered
+again, and only the invalidated part of those tiles.
+
+Tiles are positioned relative to the whole pixel part of the view
+translation, so tiles can be reused when the view is scrolled. If the
+scale or rotation of the view (or the sub-pixel part of its translation)
+changes, all tiles are dropped. The view moves the tiles as soon as its
+matrix changes, before areas are invalidated.
+
+Painters that are not ``cacheable`` (see `painter.Painter`), such as the
+`painter.CostPainter` overlay, do not render in tiles. They are painted on
+top of the tiles on every expose.
+
+To use the cache, set it on a view::
+
+    view.tile_cache = TileCache()
+
+Item cache
+----------
+The `ItemCache` keeps the rendering of items in image surfaces. When an
+item is only moved, the cached rendering is painted at the new position,
+instead of drawing the item again. Cached renderings are dropped when an
+update is requested for the item (see `GtkView.request_update()`), or
+when the item is scaled or rotated in the view (e.g. by zooming). Items
+drawn on a wrapped cairo context (e.g. by the `freehand.FreeHandPainter`)
+are not cached::
+
+    view.item_cache = ItemCache()
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+from math import floor, ceil
+
+from cairo import ImageSurface, Context, FORMAT_ARGB32, OPERATOR_CLEAR, \
+        OPERATOR_OVER
+
+from gaphas.geometry import Rectangle
+
+
+class TileCache(object):
+    """
+    Cache of rendered tiles of ``tile_size`` x ``tile_size`` pixels. At most
+    ``max_tiles`` tiles are kept, tiles that are not visible are dropped
+    first.
+
+    The number of (partially) rendered tiles is counted in
+    ``render_count``.
+    """
+
+    def __init__(self, tile_size=256, max_tiles=64):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.render_count = 0
+        # (xx, yx, xy, yy, sub-pixel x0, sub-pixel y0) of the view matrix
+        self._key = None
+        # Whole pixel translation of the view matrix
+        self._offset = (0, 0)
+        # (column, row) -> [surface, invalid area (x0, y0, x1, y1) or None]
+        # The invalid area is in pixels, relative to the tile.
+        self._tiles = {}
+
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+    def set_matrix(self, matrix):
+        """
+        Set the view matrix to render the tiles with. Tiles are dropped if
+        they can not be reused with this matrix.
+        """
+        xx, yx, xy, yy, x0, y0 = matrix
+        ox, oy = int(floor(x0)), int(floor(y0))
+        key = (xx, yx, xy, yy, round(x0 - ox, 6), round(y0 - oy, 6))
+        if key != self._key:
+            self._tiles.clear()
+            self._key = key
+        self._offset = ox, oy
+
+
+    def clear(self):
+        """
+        Drop all tiles.
+        """
+        self._tiles.clear()
+
+
+    def _tile_range(self, area):
+        """
+        Iterate (column, row, x0, y0, x1, y1) tuples for the tiles
+        covering ``area`` (in view coordinates). The coordinates are the
+        whole pixels of the area, relative to the tile.
+        """
+        x, y, w, h = area
+        size = self.tile_size
+        ox, oy = self._offset
+        px0, py0 = int(floor(x - ox)), int(floor(y - oy))
+        px1, py1 = int(ceil(x + w - ox)), int(ceil(y + h - oy))
+        for col in xrange(px0 // size, (px1 - 1) // size + 1):
+            tx = col * size
+            for row in xrange(py0 // size, (py1 - 1) // size + 1):
+                ty = row * size
+                yield (col, row,
+                       max(px0 - tx, 0), max(py0 - ty, 0),
+                       min(px1 - tx, size), min(py1 - ty, size))
+
+
+    def invalidate(self, area=None):
+        """
+        Mark ``area`` (in view coordinates) to be rendered again. If no
+        area is provided, all tiles are rendered again.
+        """
+        tiles = self._tiles
+        if area is None:
+            size = self.tile_size
+            for tile in tiles.itervalues():
+                tile[1] = (0, 0, size, size)
+            return
+        if area[2] <= 0 or area[3] <= 0:
+            return
+        for col, row, x0, y0, x1, y1 in self._tile_range(area):
+            tile = tiles.get((col, row))
+            if tile is None:
+                continue
+            invalid = tile[1]
+            if invalid:
+                tile[1] = (min(x0, invalid[0]), min(y0, invalid[1]),
+                           max(x1, invalid[2]), max(y1, invalid[3]))
+            else:
+                tile[1] = (x0, y0, x1, y1)
+
+
+    def paint(self, cairo, area, render):
+        """
+        Paint ``area`` (in view coordinates) on ``cairo`` from the tiles.
+        Tiles that are missing or invalid are rendered first, by calling
+        ``render(cairo, area)``: ``cairo`` is the context to draw the tile
+        with (in view coordinates) and ``area`` is a `geometry.Rectangle`,
+        the part of the tile to render.
+        """
+        tiles = self._tiles
+        size = self.tile_size
+        ox, oy = self._offset
+        visible = set()
+        cairo.save()
+        try:
+            for col, row, x0, y0, x1, y1 in self._tile_range(area):
+                tile = tiles.get((col, row))
+                if tile is None:
+                    tile = [ImageSurface(FORMAT_ARGB32, size, size),
+                            (0, 0, size, size)]
+                    tiles[col, row] = tile
+                visible.add((col, row))
+                vx, vy = col * size + ox, row * size + oy
+                if tile[1]:
+                    self._render(tile, vx, vy, render)
+                cairo.set_source_surface(tile[0], vx, vy)
+                cairo.rectangle(vx + x0, vy + y0, x1 - x0, y1 - y0)
+                cairo.fill()
+        finally:
+            cairo.restore()
+
+        # Drop invisible tiles
+        if len(tiles) > self.max_tiles:
+            for key in tiles.keys():
+                if key not in visible:
+                    del tiles[key]
+                    if len(tiles) <= self.max_tiles:
+                        break
+
+
+    def _render(self, tile, vx, vy, render):
+        """
+        Render the invalid part of a tile, positioned at (vx, vy) in the
+        view.
+        """
+        surface, (x0, y0, x1, y1) = tile
+        # Draw in view coordinates, also if painters reset the matrix
+        surface.set_device_offset(-vx, -vy)
+        cr = Context(surface)
+        area = Rectangle(vx + x0, vy + y0, x1 - x0, y1 - y0)
+        cr.rectangle(*area)
+        cr.clip()
+        cr.set_operator(OPERATOR_CLEAR)
+        cr.paint()
+        cr.set_operator(OPERATOR_OVER)
+        render(cr, area)
+        del cr
+        surface.flush()
+        surface.set_device_offset(0, 0)
+        tile[1] = None
+        self.render_count += 1
+
+
+class ItemCache(object):
+    """
+    Cache of item renderings. Only items that are an instance of one of
+    ``classes`` are cached (by default all items are). Renderings are
+    painted at whole pixel positions, so cached items may be drawn up to
+    half a pixel from their exact position.
+
+    At most ``max_pixels`` pixels are kept, for all items together. Items
+    bigger than a quarter of that are not cached.
+
+    The number of items rendered in the cache is counted in
+    ``render_count``.
+    """
+
+    def __init__(self, classes=None, max_pixels=4096 * 4096):
+        self.classes = classes
+        self.max_pixels = max_pixels
+        self.render_count = 0
+        # item -> (surface, key, x offset, y offset)
+        self._items = {}
+        self._pixels = 0
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def __contains__(self, item):
+        return item in self._items
+
+
+    def invalidate(self, items):
+        """
+        Drop the cached rendering of ``items``.
+        """
+        cached = self._items
+        for item in items:
+            entry = cached.pop(item, None)
+            if entry:
+                surface = entry[0]
+                self._pixels -= surface.get_width() * surface.get_height()
+
+
+    def clear(self):
+        """
+        Drop all cached renderings.
+        """
+        self._items.clear()
+        self._pixels = 0
+
+
+    def paint(self, cairo, painter, item):
+        """
+        Paint ``item`` on ``cairo`` from the cache. The item is rendered in
+        the cache with ``painter._render_item()`` first, if needed.
+        Returns False if the item can not be cached; the painter should
+        draw it directly then.
+
+        Items are rendered in the cache on a plain cairo context, so items
+        are not cached if ``cairo`` is a wrapper, such as the
+        `freehand.FreeHandCairoContext`: the rendering would not be the same.
+        """
+        if self.classes and not isinstance(item, self.classes):
+            return False
+        if not isinstance(cairo, Context):
+            return False
+        view = painter.view
+        try:
+            bounds = view.get_item_bounding_box(item)
+        except KeyError:
+            return False
+
+        xx, yx, xy, yy, tx, ty = view.get_matrix_i2v(item)
+        # The item is drawn differently when selected, focused, etc.
+        key = (xx, yx, xy, yy,
+               item in view.selected_items,
+               item is view.focused_item,
+               item is view.hovered_item,
+               item is view.dropzone_item)
+
+        entry = self._items.get(item)
+        if entry is None or entry[1] != key:
+            self.invalidate((item,))
+            x0, y0 = int(floor(bounds.x)), int(floor(bounds.y))
+            width = int(ceil(bounds.x1)) - x0
+            height = int(ceil(bounds.y1)) - y0
+            pixels = width * height
+            if width <= 0 or height <= 0 or pixels * 4 > self.max_pixels:
+                return False
+            if self._pixels + pixels > self.max_pixels:
+                self.clear()
+
+            surface = ImageSurface(FORMAT_ARGB32, width, height)
+            # Render in view coordinates
+            surface.set_device_offset(-x0, -y0)
+            cr = Context(surface)
+            painter._render_item(item, cr)
+            del cr
+            surface.flush()
+            surface.set_device_offset(0, 0)
+
+            entry = (surface, key, x0 - tx, y0 - ty)
+            self._items[item] = entry
+            self._pixels += pixels
+            self.render_count += 1
+
+        surface, key, dx, dy = entry
+        x, y = round(tx + dx), round(ty + dy)
+        cairo.save()
+        try:
+            cairo.identity_matrix()
+            cairo.set_source_surface(surface, x, y)
+            cairo.rectangle(x, y, surface.get_width(), surface.get_height())
+            cairo.fill()
+        finally:
+            cairo.restore()
+        return True
+
+
+# vim:sw=4:et:ai
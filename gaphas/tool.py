@@ -266,7 +266,10 @@ class ItemTool(Tool):
         selected_items = set(view.selected_items)
         for item in selected_items:
             # Do not move subitems of selected items
-            if not set(get_ancestors(item)).intersection(selected_items):
+            for ancestor in get_ancestors(item):
+                if ancestor in selected_items:
+                    break
+            else:
                 yield InMotion(item, view)
         
 
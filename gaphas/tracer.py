@@ -0,0 +1,225 @@
+"""
+Timing of canvas and view updates.
+
+Set a `Tracer` as the ``tracer`` attribute of a canvas to record the wall
+time and the number of items handled in each phase of
+`canvas.Canvas.update_now()`. The views of the canvas record their
+updates with the same tracer, so a slow solver can be told apart from a
+slow bounding box pass::
+
+    canvas.tracer = Tracer()
+    ...
+    canvas.tracer.dump_chrome_trace('trace.json')
+
+The trace file can be loaded in Chrome's ``chrome://tracing`` page. Note
+that the post_update phase of an update spread over several idle jobs (see
+`canvas.Canvas.update()`) includes the time spent in between.
+
+Set an `ItemCosts` instance as the ``costs`` attribute of a canvas to find
+out which item classes are expensive to draw, update or pick. The
+`painter.CostPainter` shows the costs in a view.
+"""
+
+__version__ = "$Revision$"
+# $HeadURL$
+
+import os
+import json
+from collections import namedtuple, deque
+from timeit import default_timer as timer
+
+
+Phase = namedtuple('Phase', 'category name start duration count')
+
+
+class Tracer(object):
+    """
+    Record `Phase` tuples for the phases of an update: the update
+    (``category``), the phase name, start time and duration (in seconds)
+    and the number of items handled in the phase.
+
+    An update is started with `begin()`. Every call to `phase()` ends a
+    phase, which started with the previous phase (or the update itself).
+    `end()` ends the update. Updates may be nested.
+
+    If a ``callback`` is provided, it's called with every phase recorded.
+    The last ``keep`` phases are kept.
+
+    >>> tracer = Tracer()
+    >>> tracer.begin('update')
+    >>> tracer.phase('matrices', 4)
+    >>> tracer.phase('constraints', 2)
+    >>> tracer.end()
+    >>> [(p.category, p.name, p.count) for p in tracer.phases]
+    [('update', 'matrices', 4), ('update', 'constraints', 2)]
+    >>> tracer.phases[1].start == tracer.phases[0].start + tracer.phases[0].duration
+    True
+    """
+
+    def __init__(self, callback=None, keep=10000):
+        self.callback = callback
+        self.phases = deque(maxlen=keep)
+        # [category, start of current phase] for each running update
+        self._stack = []
+
+    def begin(self, category):
+        """
+        Start an update.
+        """
+        self._stack.append([category, timer()])
+
+    def phase(self, name, count=0):
+        """
+        End phase ``name`` of the current update, in which ``count`` items
+        were handled.
+        """
+        now = timer()
+        current = self._stack[-1]
+        phase = Phase(current[0], name, current[1], now - current[1], count)
+        current[1] = now
+        self.phases.append(phase)
+        if self.callback:
+            self.callback(phase)
+
+    def end(self):
+        """
+        End the current update.
+        """
+        self._stack.pop()
+
+    def clear(self):
+        self.phases.clear()
+
+    def totals(self):
+        """
+        Return a (category, name) -> (calls, duration, count) mapping with
+        the accumulated values of the recorded phases.
+
+        >>> tracer = Tracer()
+        >>> for i in range(3):
+        ...     tracer.begin('update')
+        ...     tracer.phase('matrices', i)
+        ...     tracer.end()
+        >>> calls, duration, count = tracer.totals()['update', 'matrices']
+        >>> calls, count
+        (3, 3)
+        """
+        totals = {}
+        for phase in self.phases:
+            key = phase.category, phase.name
+            calls, duration, count = totals.get(key, (0, 0.0, 0))
+            totals[key] = (calls + 1, duration + phase.duration, count + phase.count)
+        return totals
+
+    def chrome_trace(self):
+        """
+        Return the recorded phases in Chrome's trace event format, as a
+        list of complete ('X') events. Times are in microseconds.
+
+        >>> tracer = Tracer()
+        >>> tracer.begin('update')
+        >>> tracer.phase('matrices', 4)
+        >>> tracer.end()
+        >>> event = tracer.chrome_trace()[0]
+        >>> event['name'], event['cat'], event['ph'], event['args']
+        ('matrices', 'update', 'X', {'count': 4})
+        """
+        pid = os.getpid()
+        return [dict(name=phase.name, cat=phase.category, ph='X',
+                     ts=phase.start * 1e6, dur=phase.duration * 1e6,
+                     pid=pid, tid=0, args=dict(count=phase.count))
+                for phase in self.phases]
+
+    def dump_chrome_trace(self, filename):
+        """
+        Write the recorded phases to ``filename`` as a Chrome trace file.
+        """
+        f = open(filename, 'w')
+        try:
+            json.dump(dict(traceEvents=self.chrome_trace()), f)
+        finally:
+            f.close()
+
+
+class ItemCosts(object):
+    """
+    Time spent in the methods of items, per item class. The canvas and its
+    views time the calls to `item.Item.draw()` (as 'draw', or
+    'bounding_box' when bounding boxes are calculated), ``bounds()``,
+    ``pre_update()``, ``post_update()`` and ``point()``.
+
+    >>> class Item(object):
+    ...     def point(self, pos):
+    ...         return 0
+    >>> costs = ItemCosts()
+    >>> costs.call(Item(), 'point', (0, 0))
+    0
+    >>> costs.call(Item(), 'point', (1, 0))
+    0
+    >>> calls, time = costs.costs[Item, 'point']
+    >>> calls
+    2
+    """
+
+    def __init__(self):
+        # (item class, method name) -> [calls, seconds]
+        self.costs = {}
+
+    def call(self, item, name, *args):
+        """
+        Call method ``name`` of ``item`` and record the time it took.
+        """
+        start = timer()
+        try:
+            return getattr(item, name)(*args)
+        finally:
+            self.add(type(item), name, timer() - start)
+
+    def add(self, cls, name, time):
+        """
+        Record one call to method ``name`` of an instance of ``cls``.
+        """
+        entry = self.costs.get((cls, name))
+        if entry is None:
+            self.costs[cls, name] = [1, time]
+        else:
+            entry[0] += 1
+            entry[1] += time
+
+    def clear(self):
+        self.costs.clear()
+
+    def per_class(self):
+        """
+        Return a list of (item class, total time, {name: (calls, time)})
+        tuples, most expensive class first.
+
+        >>> costs = ItemCosts()
+        >>> costs.add(int, 'draw', 0.5)
+        >>> costs.add(float, 'draw', 0.1)
+        >>> costs.add(float, 'point', 0.6)
+        >>> [(cls.__name__, total) for cls, total, methods in costs.per_class()]
+        [('float', 0.7), ('int', 0.5)]
+        """
+        classes = {}
+        for (cls, name), (calls, time) in self.costs.iteritems():
+            classes.setdefault(cls, {})[name] = (calls, time)
+        result = [(cls, sum(time for calls, time in methods.itervalues()), methods)
+                  for cls, methods in classes.iteritems()]
+        result.sort(key=lambda e: e[1], reverse=True)
+        return result
+
+    def report(self, n=10):
+        """
+        Return a list of lines describing the ``n`` most expensive item
+        classes. Times are in milliseconds.
+        """
+        lines = []
+        for cls, total, methods in self.per_class()[:n]:
+            lines.append('%s: %.1fms (%s)' % (cls.__name__, total * 1000,
+                ', '.join('%s %dx %.1fms' % (name, calls, time * 1000)
+                          for name, (calls, time) in sorted(methods.iteritems()))))
+        return lines
+
+
+# vim:sw=4:et:ai
@@ -7,6 +7,11 @@ __version__ = "$Revision$"
 # $HeadURL$
 
 from operator import attrgetter
+from itertools import izip
+from bisect import bisect_left
+
+# Space left between the order keys of two subsequently added nodes.
+KEY_GAP = 1 << 16
 
 
 class Tree(object):
@@ -15,7 +20,19 @@ class Tree(object):
     
     ``None`` is the root node.
 
+    Each node is assigned an order key. Keys are sparse (there is room
+    between the keys of two adjacent nodes), so a node can be added, removed
+    or moved without renumbering the other nodes. Only when there is no room
+    left between two keys, all keys are spread again.
+
+    The position of a node is found by bisecting the keys (O(log n)), but
+    the nodes and keys are kept in plain lists, so inserting or removing
+    a block still moves the entries after it (a memmove, O(n) but with a
+    very small constant). Iteration and slicing, used for every draw, stay
+    as cheap as for a list.
+
     @invariant: len(self._children) == len(self._nodes) + 1
+    @invariant: self._keys == sorted(self._keys)
     """
 
     def __init__(self):
@@ -23,14 +40,35 @@ class Tree(object):
         # rendered
         self._nodes = []
 
+        # The order keys, self._keys[n] is the key of self._nodes[n].
+        self._keys = []
+
+        # node -> order key mapping
+        self._order = {}
+
         # Per entry a list of children is maintained.
         self._children = { None: [] }
 
         # For easy and fast lookups, also maintain a child -> parent mapping
         self._parents = { }
 
+        # Cached node -> tuple of ancestors (parent first) mapping. Entries
+        # are dropped when a node is moved or removed.
+        self._ancestors = { }
+
     nodes = property(lambda s: list(s._nodes))
 
+    def __contains__(self, node):
+        """
+        Check if ``node`` is in the tree.
+
+        >>> tree = Tree()
+        >>> tree.add('n1')
+        >>> 'n1' in tree, 'n2' in tree
+        (True, False)
+        """
+        return node in self._order
+
     def get_parent(self, node):
         """
         Return the parent item of ``node``.
@@ -151,10 +189,56 @@ class Tree(object):
         >>> list(tree.get_ancestors('n1'))
         []
         """
-        parent = self.get_parent(node)
-        while parent:
+        for parent in self._get_ancestors(node):
             yield parent
-            parent = self.get_parent(parent)
+
+    def _get_ancestors(self, node):
+        """
+        Return the ancestors of ``node`` as a tuple (parent first). The
+        ancestors are cached.
+        """
+        ancestors = self._ancestors
+        try:
+            return ancestors[node]
+        except KeyError:
+            pass
+        # Find the nearest node with cached ancestors, fill in the rest
+        chain = []
+        parent = self._parents.get(node)
+        while parent and parent not in ancestors:
+            chain.append(parent)
+            parent = self._parents.get(parent)
+        result = parent and (parent,) + ancestors[parent] or ()
+        for parent in reversed(chain):
+            ancestors[parent] = result
+            result = (parent,) + result
+        ancestors[node] = result
+        return result
+
+    def get_depth(self, node):
+        """
+        Return the depth of ``node``. Top level nodes have depth 0.
+
+        >>> tree = Tree()
+        >>> tree.add('n1')
+        >>> tree.add('n2', parent='n1')
+        >>> tree.get_depth('n1'), tree.get_depth('n2')
+        (0, 1)
+        """
+        return len(self._get_ancestors(node))
+
+    def is_descendant(self, node, ancestor):
+        """
+        Check if ``node`` is a descendant of ``ancestor``.
+
+        >>> tree = Tree()
+        >>> tree.add('n1')
+        >>> tree.add('n2', parent='n1')
+        >>> tree.add('n3', parent='n2')
+        >>> tree.is_descendant('n3', 'n1'), tree.is_descendant('n1', 'n3')
+        (True, False)
+        """
+        return ancestor in self._get_ancestors(node)
 
     def index_nodes(self, index_key):
         """
@@ -183,9 +267,10 @@ class Tree(object):
         lnodes = len(nodes)
         map(setattr, nodes, [index_key] * lnodes, xrange(lnodes))
 
-    def sort(self, nodes, index_key, reverse=False):
+    def sort(self, nodes, index_key=None, reverse=False):
         """
-        Sort a set (or list) of nodes.
+        Sort a set (or list) of nodes. If no ``index_key`` is provided, the
+        tree's own order keys are used, so no indexing is required.
         
         >>> class A(object):
         ...     def __init__(self, n):
@@ -203,49 +288,111 @@ class Tree(object):
         >>> selection = (t.nodes[2], t.nodes[1])
         >>> t.sort(selection, index_key='my_key')
         [c, b]
+        >>> t.sort(selection)
+        [c, b]
+        >>> t.sort(selection, reverse=True)
+        [b, c]
         """
         if index_key:
             return sorted(nodes, key=attrgetter(index_key), reverse=reverse)
         else:
-            raise NotImplemented('index_key should be provided.')
+            return sorted(nodes, key=self._order.__getitem__, reverse=reverse)
+
+    def _index_of(self, node):
+        """
+        Return the position of ``node`` in the nodes list.
+        """
+        return bisect_left(self._keys, self._order[node])
+
+
+    def _last_descendant(self, node):
+        """
+        Return the last node in the subtree of ``node`` (``node`` itself if
+        it has no children).
+        """
+        children = self._children[node]
+        while children:
+            node = children[-1]
+            children = self._children[node]
+        return node
+
+
+    def _renumber(self):
+        """
+        Spread the order keys evenly. This is only needed if there's no
+        room left between two keys.
+        """
+        self._keys = range(KEY_GAP, (len(self._nodes) + 1) * KEY_GAP, KEY_GAP)
+        self._order = dict(izip(self._nodes, self._keys))
 
-    def _add_to_nodes(self, node, parent, index=None):
+
+    def _add_to_nodes(self, nodes, parent, index=None):
         """
         Helper method to place nodes on the right location in the nodes list
         Called only from add() and reparent()
+
+        ``nodes`` is a node followed by its descendants, in depth-first order.
+        They're inserted as one block. The position is found by bisection,
+        the insert itself is a list insert, linear in the number of nodes
+        after it.
         """
-        nodes = self._nodes
         siblings = self._children[parent]
         try:
-            atnode = siblings[index]
+            siblings[index]
         except (TypeError, IndexError):
-            index = len(siblings)
-            #self._add_to_nodes(node, parent)
-            if parent:
-                try:
-                    next_uncle = self.get_next_sibling(parent)
-                except IndexError:
-                    # parent has no younger brothers..
-                    # place it before the next uncle of grant_parent:
-                    return self._add_to_nodes(node, self.get_parent(parent))
-                else:
-                    nodes.insert(nodes.index(next_uncle), node)
+            pred = self._last_descendant(parent)
+        else:
+            if index < 0:
+                index += len(siblings)
+            if index > 0:
+                pred = self._last_descendant(siblings[index - 1])
             else:
-                # append to root node:
-                nodes.append(node)
+                pred = parent
+
+        keys = self._keys
+        if pred is None:
+            pos, lo = 0, 0
         else:
-            nodes.insert(nodes.index(atnode), node)
+            pos = self._index_of(pred) + 1
+            lo = keys[pos - 1]
 
+        count = len(nodes)
+        if pos < len(keys):
+            step = (keys[pos] - lo) // (count + 1)
+        else:
+            step = KEY_GAP
+
+        self._nodes[pos:pos] = nodes
+        if step:
+            new_keys = range(lo + step, lo + step * (count + 1), step)
+            keys[pos:pos] = new_keys
+            self._order.update(izip(nodes, new_keys))
+        else:
+            self._renumber()
 
-    def _add(self, node, parent=None, index=None):
+
+    def _remove_from_nodes(self, node, count=1):
+        """
+        Remove ``node`` and the ``count - 1`` nodes following it from the
+        nodes list.
+        """
+        pos = self._index_of(node)
+        order = self._order
+        for n in self._nodes[pos:pos + count]:
+            del order[n]
+        del self._nodes[pos:pos + count]
+        del self._keys[pos:pos + count]
+
+
+    def _add(self, node, parent=None, index=None, descendants=()):
         """
         Helper method for both add() and reparent().
         """
-        assert node not in self._nodes
+        assert node not in self._order
 
         siblings = self._children[parent]
 
-        self._add_to_nodes(node, parent, index)
+        self._add_to_nodes([node] + list(descendants), parent, index)
         
         # Fix parent-child and child-parent relationship
         try:
@@ -269,12 +416,108 @@ class Tree(object):
         self._children[node] = []
 
 
+    def add_many(self, nodes, parents, indices=None):
+        """
+        Add a list of nodes to the tree. ``parents`` is the list of parent
+        nodes. A parent node should be in the tree already, or precede its
+        children in ``nodes``.
+
+        The nodes are added to their parents as last children, the nodes
+        list is updated once per parent that's already in the tree. If
+        ``indices`` are provided, nodes are added one by one at their
+        index.
+
+        >>> tree = Tree()
+        >>> tree.add('n1')
+        >>> tree.add('n2', parent='n1')
+        >>> tree.add_many(['n3', 'n4', 'n5', 'n6'], ['n1', None, 'n3', 'n4'])
+        >>> tree.nodes
+        ['n1', 'n2', 'n3', 'n5', 'n4', 'n6']
+        >>> tree.get_children('n1')
+        ['n2', 'n3']
+        >>> tree.get_parent('n5')
+        'n3'
+        """
+        if indices is not None:
+            for node, parent, index in izip(nodes, parents, indices):
+                self.add(node, parent, index)
+            return
+
+        children = self._children
+        added = set(nodes)
+        assert len(added) == len(nodes), 'Nodes are added twice'
+        roots = {}
+        for node, parent in izip(nodes, parents):
+            assert node not in self._order
+            children[node] = []
+        for node, parent in izip(nodes, parents):
+            if parent in added:
+                children[parent].append(node)
+                self._parents[node] = parent
+            else:
+                try:
+                    roots[parent].append(node)
+                except KeyError:
+                    roots[parent] = [node]
+
+        # Add the new subtrees of each parent as one block
+        for parent, subtrees in roots.iteritems():
+            block = []
+            stack = list(reversed(subtrees))
+            while stack:
+                node = stack.pop()
+                block.append(node)
+                stack.extend(reversed(children[node]))
+            self._add_to_nodes(block, parent)
+            children[parent].extend(subtrees)
+            if parent:
+                for node in subtrees:
+                    self._parents[node] = parent
+
+
+    def remove_many(self, nodes):
+        """
+        Remove a list of nodes from the tree. All descendants of the nodes
+        should be in the list too.
+
+        >>> tree = Tree()
+        >>> tree.add_many(['n1', 'n2', 'n3', 'n4'], [None, 'n1', 'n1', None])
+        >>> tree.remove_many(['n2', 'n4'])
+        >>> tree.nodes
+        ['n1', 'n3']
+        >>> tree.get_children('n1')
+        ['n3']
+        """
+        removed = set(nodes)
+        children = self._children
+        parents = set()
+        for node in nodes:
+            assert not [c for c in children[node] if c not in removed], \
+                    'Children of %s should be removed too' % (node,)
+            parent = self._parents.pop(node, None)
+            if parent not in removed:
+                parents.add(parent)
+        for parent in parents:
+            siblings = children[parent]
+            siblings[:] = [n for n in siblings if n not in removed]
+        order = self._order
+        ancestors = self._ancestors
+        for node in nodes:
+            del children[node]
+            del order[node]
+            ancestors.pop(node, None)
+        keep = [(n, k) for n, k in izip(self._nodes, self._keys) if n not in removed]
+        self._nodes[:] = [n for n, k in keep]
+        self._keys[:] = [k for n, k in keep]
+
+
     def _remove(self, node):
         # Remove from parent item
         self.get_siblings(node).remove(node)
         # Remove data entries:
         del self._children[node]
-        self._nodes.remove(node)
+        self._ancestors.pop(node, None)
+        self._remove_from_nodes(node)
         try:
             del self._parents[node]
         except KeyError:
@@ -291,18 +534,6 @@ class Tree(object):
             self.remove(c)
         self._remove(node)
 
-    def _reparent_nodes(self, node, parent):
-        """
-        Helper for reparent().
-        The _children and _parent trees can be left intact as far as children
-        of the reparented node are concerned. Only the position in the
-        _nodes list changes.
-        """
-        self._nodes.remove(node)
-        self._add_to_nodes(node, parent)
-        for c in self._children[node]:
-            self._reparent_nodes(c, node)
-        
     def reparent(self, node, parent, index=None):
         """
         Set new parent for a ``node``. ``Parent`` can be ``None``, indicating
@@ -341,15 +572,21 @@ class Tree(object):
         # Remove all node references:
         old_parent = self.get_parent(node)
         self._children[old_parent].remove(node)
-        self._nodes.remove(node)
         if old_parent:
             del self._parents[node]
 
-        self._add(node, parent, index)
+        # The node and its descendants are moved as one block, the
+        # _children and _parent trees of the descendants are left intact.
+        descendants = list(self.get_all_children(node))
+        self._remove_from_nodes(node, len(descendants) + 1)
+
+        # Ancestors of the moved nodes are no longer valid
+        ancestors = self._ancestors
+        ancestors.pop(node, None)
+        for n in descendants:
+            ancestors.pop(n, None)
 
-        # reorganize children in nodes list
-        for c in self._children[node]:
-            self._reparent_nodes(c, node)
+        self._add(node, parent, index, descendants)
 
 
 # vi: sw=4:et:ai
@@ -12,8 +12,8 @@ from canvas import Context
 from geometry import Rectangle
 from quadtree import Quadtree
 from tool import DefaultTool
-from painter import DefaultPainter, BoundingBoxPainter
-from decorators import async, PRIORITY_HIGH_IDLE
+from painter import DefaultPainter, BoundingBoxPainter, PainterChain
+from decorators import async, sliced, PRIORITY_HIGH_IDLE
 from decorators import nonrecursive
 
 # Handy debug flag for drawing bounding boxes around the items.
@@ -27,8 +27,21 @@ DEFAULT_CURSOR = gtk.gdk.LEFT_PTR
 class View(object):
     """
     View class for gaphas.Canvas objects. 
+
+    The bounding boxes of the items are kept by the canvas, in canvas
+    coordinates (see `canvas.Canvas.index`). The view transforms queries
+    with its matrix, so zooming and panning do not update the index.
+
+    Handles are drawn at the same size, whatever the zoom level, so their
+    size is not part of the bounding boxes in the index. Instead the view
+    adds a margin of ``bounding_box_margin`` pixels around the bounding
+    boxes when it looks up items and when it redraws them.
     """
 
+    # Margin around the bounding box of an item (in view coordinates), for
+    # the handles
+    bounding_box_margin = 6
+
     def __init__(self, canvas=None):
         self._matrix = Matrix()
         self._painter = DefaultPainter(self)
@@ -42,9 +55,10 @@ class View(object):
         self._dropzone_item = None
         ###/
 
-        self._qtree = Quadtree()
         self._bounds = Rectangle(0, 0, 0, 0)
 
+        self._item_cache = None
+
         self._canvas = None
         if canvas:
             self._set_canvas(canvas)
@@ -60,7 +74,6 @@ class View(object):
         in the view.
         """
         if self._canvas:
-            self._qtree.clear()
             self._selected_items.clear()
             self._focused_item = None
             self._hovered_item = None
@@ -220,6 +233,18 @@ class View(object):
     bounding_box_painter = property(lambda s: s._bounding_box_painter, _set_bounding_box_painter)
 
 
+    def _set_item_cache(self, item_cache):
+        """
+        Set a `tilecache.ItemCache` to paint items from, or None to draw
+        items directly.
+        """
+        self._item_cache = item_cache
+        self.emit('painter-changed')
+
+
+    item_cache = property(lambda s: s._item_cache, _set_item_cache)
+
+
     def get_item_at_point(self, pos, selected=True):
         """
         Return the topmost item located at ``pos`` (x, y).
@@ -227,14 +252,19 @@ class View(object):
         Parameters:
          - selected: if False returns first non-selected item
         """
-        items = self._qtree.find_intersect((pos[0], pos[1], 1, 1))
+        items = self._find_items((pos[0], pos[1], 1, 1))
+        costs = self._canvas.costs
         for item in self._canvas.sort(items, reverse=True):
             if not selected and item in self.selected_items:
                 continue  # skip selected items
 
             v2i = self.get_matrix_v2i(item)
             ix, iy = v2i.transform_point(*pos)
-            if item.point((ix, iy)) < 0.5:
+            if costs is None:
+                d = item.point((ix, iy))
+            else:
+                d = costs.call(item, 'point', (ix, iy))
+            if d < 0.5:
                 return item
         return None
 
@@ -341,10 +371,7 @@ class View(object):
         Return the items in the rectangle 'rect'.
         Items are automatically sorted in canvas' processing order.
         """
-        if intersect:
-            items = self._qtree.find_intersect(rect)
-        else:
-            items = self._qtree.find_inside(rect)
+        items = self._find_items(rect, intersect)
         return self._canvas.sort(items, reverse=reverse)
 
 
@@ -353,10 +380,26 @@ class View(object):
         Select all items who have their bounding box within the
         rectangle @rect.
         """
-        items = self._qtree.find_inside(rect)
+        items = self._find_items(rect, intersect=False)
         map(self.select_item, items)
 
 
+    def _find_items(self, rect, intersect=True):
+        """
+        Find the items whose bounding box (including the margin) intersects
+        with, or if ``intersect`` is False, is inside rectangle ``rect``
+        (in view coordinates). Returns a set.
+        """
+        m = self.bounding_box_margin
+        x, y, w, h = rect
+        index = self._canvas.index
+        if intersect:
+            return index.find_intersect(self._view_to_canvas((x - m, y - m, w + 2 * m, h + 2 * m)))
+        if w < 2 * m or h < 2 * m:
+            return set()
+        return index.find_inside(self._view_to_canvas((x + m, y + m, w - 2 * m, h - 2 * m)))
+
+
     def zoom(self, factor):
         """
         Zoom in/out by factor @factor.
@@ -364,16 +407,42 @@ class View(object):
         # TODO: should the scale factor be clipped?
         self._matrix.scale(factor, factor)
 
-        # Make sure everything's updated
-        #map(self.update_matrix, self._canvas.get_all_items())
-        self.request_update((), self._canvas.get_all_items())
+        # Item bounds are kept in canvas coordinates, only the item to view
+        # matrices have to be calculated again.
+        self._clear_matrices()
+        self._update_bounds()
+
+
+    def _view_to_canvas(self, rect):
+        """
+        Transform rectangle ``rect`` (x, y, width, height) from view to
+        canvas coordinates.
+        """
+        c2v = Matrix(*self._matrix)
+        c2v.invert()
+        x, y, w, h = rect
+        x0, y0 = c2v.transform_point(x, y)
+        x1, y1 = c2v.transform_point(x + w, y + h)
+        return Rectangle(x0, y0, x1=x1, y1=y1)
+
+
+    def _canvas_to_view(self, rect):
+        """
+        Transform rectangle ``rect`` (x, y, width, height) from canvas to
+        view coordinates.
+        """
+        transform_point = self._matrix.transform_point
+        x, y, w, h = rect
+        x0, y0 = transform_point(x, y)
+        x1, y1 = transform_point(x + w, y + h)
+        return Rectangle(x0, y0, x1=x1, y1=y1)
 
 
     def set_item_bounding_box(self, item, bounds):
         """
         Update the bounding box of the item.
 
-        ``bounds`` is in view coordinates.
+        ``bounds`` is in view coordinates, without margin.
 
         Coordinates are calculated back to item coordinates, so matrix-only
         updates can occur.
@@ -381,14 +450,17 @@ class View(object):
         v2i = self.get_matrix_v2i(item).transform_point
         ix0, iy0 = v2i(bounds.x, bounds.y)
         ix1, iy1 = v2i(bounds.x1, bounds.y1)
-        self._qtree.add(item=item, bounds=bounds, data=Rectangle(ix0, iy0, x1=ix1, y1=iy1))
+        self._canvas.set_item_bounds(item, Rectangle(ix0, iy0, x1=ix1, y1=iy1))
 
 
     def get_item_bounding_box(self, item):
         """
-        Get the bounding box for the item, in view coordinates.
+        Get the bounding box for the item, in view coordinates. The
+        margin is included.
         """
-        return self._qtree.get_bounds(item)
+        bounds = self._canvas_to_view(self._canvas.get_item_bounds(item))
+        bounds.expand(self.bounding_box_margin)
+        return bounds
 
 
     bounding_box = property(lambda s: s._bounds)
@@ -408,8 +480,18 @@ class View(object):
                               items=items,
                               area=None))
 
-        # Update the view's bounding box with the rest of the items
-        self._bounds = Rectangle(*self._qtree.soft_bounds)
+        self._update_bounds()
+
+
+    def _update_bounds(self):
+        """
+        Update the view's bounding box with the bounds of all items.
+        """
+        index = self._canvas.index
+        bounds = self._canvas_to_view(index.soft_bounds)
+        if len(index):
+            bounds.expand(self.bounding_box_margin)
+        self._bounds = bounds
 
 
     def paint(self, cr):
@@ -508,6 +590,9 @@ class GtkView(gtk.DrawingArea, View):
 
         self._dirty_items = set()
         self._dirty_matrix_items = set()
+        # Items waiting for a bounding box update
+        self._bounding_box_items = set()
+        self._tile_cache = None
 
         View.__init__(self, canvas)
 
@@ -549,6 +634,7 @@ class GtkView(gtk.DrawingArea, View):
         if self._canvas:
             self._clear_matrices()
             self._canvas.unregister_view(self)
+            self._bounding_box_items.clear()
 
         super(GtkView, self)._set_canvas(canvas)
         
@@ -572,6 +658,27 @@ class GtkView(gtk.DrawingArea, View):
     tool = property(lambda s: s._tool, _set_tool)
 
 
+    def _set_tile_cache(self, tile_cache):
+        """
+        Set a `tilecache.TileCache` to render the view with, or None to
+        render exposed areas directly.
+        """
+        self._tile_cache = tile_cache
+        if tile_cache is not None:
+            tile_cache.set_matrix(self._matrix)
+        self.queue_draw_refresh()
+
+
+    tile_cache = property(lambda s: s._tile_cache, _set_tile_cache)
+
+
+    def do_painter_changed(self):
+        """
+        Render the view again with the new painter.
+        """
+        self.queue_draw_refresh()
+
+
     hadjustment = property(lambda s: s._hadjustment)
 
 
@@ -603,6 +710,9 @@ class GtkView(gtk.DrawingArea, View):
         Zoom in/out by factor ``factor``.
         """
         super(GtkView, self).zoom(factor)
+        if self._tile_cache is not None:
+            self._tile_cache.set_matrix(self._matrix)
+        self.update_adjustments()
         self.queue_draw_refresh()
 
 
@@ -615,7 +725,7 @@ class GtkView(gtk.DrawingArea, View):
         vadjustment = self._vadjustment
 
         # canvas limits (in view coordinates)
-        c = Rectangle(*self._qtree.soft_bounds)
+        c = Rectangle(*self._bounds)
 
         # view limits
         v = Rectangle(0, 0, allocation.width, allocation.height)
@@ -656,7 +766,7 @@ class GtkView(gtk.DrawingArea, View):
 
         TODO: Should we also create a (sorted) list of items that need redrawal?
         """
-        get_bounds = self._qtree.get_bounds
+        get_bounds = self.get_item_bounding_box
         items = filter(None, items)
         try:
             # create a copy, otherwise we'll change the original rectangle
@@ -672,20 +782,30 @@ class GtkView(gtk.DrawingArea, View):
 
     def queue_draw_area(self, x, y, w, h):
         """
-        Wrap draw_area to convert all values to ints.
+        Wrap draw_area to convert all values to ints. The area is
+        invalidated in the tile cache.
         """
         try:
-            super(GtkView, self).queue_draw_area(int(x), int(y), int(w+1), int(h+1))
+            x, y, w, h = int(x), int(y), int(w+1), int(h+1)
+            tile_cache = self._tile_cache
+            if tile_cache is not None:
+                # The view matrix may have been changed (e.g. by a tool)
+                # since the last expose: move the tiles first, so the
+                # right tiles are invalidated.
+                tile_cache.set_matrix(self._matrix)
+                tile_cache.invalidate((x, y, w, h))
+            super(GtkView, self).queue_draw_area(x, y, w, h)
         except OverflowError:
             # Okay, now the zoom factor is very large or something
-            a = self.allocation
-            super(GtkView, self).queue_draw_area(0, 0, a.width, a.height)
+            self.queue_draw_refresh()
 
 
     def queue_draw_refresh(self):
         """
         Redraw the entire view.
         """
+        if self._tile_cache is not None:
+            self._tile_cache.invalidate()
         a = self.allocation
         super(GtkView, self).queue_draw_area(0, 0, a.width, a.height)
 
@@ -697,16 +817,20 @@ class GtkView(gtk.DrawingArea, View):
         """
         if items:
             self._dirty_items.update(items)
+            if self._item_cache is not None:
+                self._item_cache.invalidate(items)
         if matrix_only_items:
             self._dirty_matrix_items.update(matrix_only_items)
 
         # Remove removed items:
         if removed_items:
+            if self._item_cache is not None:
+                self._item_cache.invalidate(removed_items)
             self._dirty_items.difference_update(removed_items)
+            self._bounding_box_items.difference_update(removed_items)
             self.queue_draw_item(*removed_items)
 
             for item in removed_items:
-                self._qtree.remove(item)
                 self.selected_items.discard(item)
 
             if self.focused_item in removed_items:
@@ -728,54 +852,84 @@ class GtkView(gtk.DrawingArea, View):
 
         dirty_items = self._dirty_items
         dirty_matrix_items = self._dirty_matrix_items
+        tracer = self._canvas.tracer
+        if tracer: tracer.begin('GtkView.update')
 
         try:
             self.queue_draw_item(*dirty_items)
 
-            # Mark old bb section for update
-            self.queue_draw_item(*dirty_matrix_items)
+            # The canvas has projected the bounds of items with a changed
+            # matrix already (and queued the old areas for redraw).
+            index = self._canvas.index
             for i in dirty_matrix_items:
-                if i not in self._qtree:
+                if i not in index:
                     dirty_items.add(i)
-                    self.update_matrix(i)
-                    continue
-
                 self.update_matrix(i)
 
-                if i not in dirty_items:
-                    # Only matrix has changed, so calculate new bb based
-                    # on quadtree data (= bb in item coordinates).
-                    bounds = self._qtree.get_data(i)
-                    i2v = self.get_matrix_i2v(i).transform_point
-                    x0, y0 = i2v(bounds.x, bounds.y)
-                    x1, y1 = i2v(bounds.x1, bounds.y1)
-                    vbounds = Rectangle(x0, y0, x1=x1, y1=y1)
-                    self._qtree.add(i, vbounds, bounds)
-
             self.queue_draw_item(*dirty_matrix_items)
 
+            if tracer: tracer.phase('matrices', len(dirty_matrix_items))
+
             # Request bb recalculation for all 'really' dirty items
             self.update_bounding_box(set(dirty_items))
+
+            if tracer: tracer.phase('request_bounding_box', len(dirty_items))
         finally:
             self._dirty_items.clear()
             self._dirty_matrix_items.clear()
+            if tracer: tracer.end()
 
 
-    @async(single=False)
     def update_bounding_box(self, items):
         """
-        Update bounding box is not necessary.
+        Update the bounding boxes of ``items``. Within the gtk main loop,
+        bounding boxes are calculated in chunks of ``bounding_box_chunk``
+        items, spread over idle jobs (see `decorators.sliced`), so the
+        screen is redrawn in between.
         """
-        cr = self.window.cairo_create()
+        self._bounding_box_items.update(items)
+        self._update_bounding_boxes()
 
-        cr.save()
-        cr.rectangle(0, 0, 0, 0)
-        cr.clip()
-        try:
-            super(GtkView, self).update_bounding_box(cr, items)
-        finally:
-            cr.restore()
-        self.queue_draw_item(*items)
+
+    # Number of items of which the bounding box is calculated in one go
+    bounding_box_chunk = 64
+
+    @sliced(priority=PRIORITY_HIGH_IDLE)
+    def _update_bounding_boxes(self):
+        """
+        Calculate the bounding boxes of the items waiting for it, yield
+        after each chunk of items.
+        """
+        pending = self._bounding_box_items
+        while pending:
+            if not self.window:
+                pending.clear()
+                return
+            tracer = self._canvas.tracer
+            if tracer: tracer.begin('GtkView.update_bounding_box')
+            try:
+                items = [pending.pop() for i in xrange(min(self.bounding_box_chunk, len(pending)))]
+                # Bounding boxes are shared, another view may have
+                # calculated them already
+                dirty = self._canvas.pop_dirty_bounds(items)
+                if dirty:
+                    cr = self.window.cairo_create()
+                    cr.rectangle(0, 0, 0, 0)
+                    cr.clip()
+                    self._bounding_box_painter.paint(Context(cairo=cr,
+                                                             items=dirty,
+                                                             area=None))
+
+                if tracer: tracer.phase('bounding_box', len(dirty))
+
+                self.queue_draw_item(*items)
+
+                if tracer: tracer.phase('redraw', len(items))
+            finally:
+                if tracer: tracer.end()
+            yield
+
+        self._update_bounds()
         self.update_adjustments()
 
 
@@ -786,7 +940,6 @@ class GtkView(gtk.DrawingArea, View):
         """
         gtk.DrawingArea.do_size_allocate(self, allocation)
         self.update_adjustments(allocation)
-        self._qtree.resize((0, 0, allocation.width, allocation.height))
        
 
     def do_realize(self):
@@ -803,10 +956,10 @@ class GtkView(gtk.DrawingArea, View):
             # Although Item._matrix_{i2v|v2i} keys are automatically removed
             # (weak refs), better do it explicitly to be sure.
             self._clear_matrices()
-        self._qtree.clear()
 
         self._dirty_items.clear()
         self._dirty_matrix_items.clear()
+        self._bounding_box_items.clear()
 
         self._canvas.unregister_view(self)
 
@@ -828,9 +981,14 @@ class GtkView(gtk.DrawingArea, View):
         cr.clip()
 
         area = Rectangle(x, y, width=w, height=h)
-        self._painter.paint(Context(cairo=cr,
-                                    items=self.get_items_in_rectangle(area),
-                                    area=area))
+        tile_cache = self._tile_cache
+        if tile_cache is None:
+            self._render_area(cr, area)
+        else:
+            tile_cache.set_matrix(self._matrix)
+            tile_cache.paint(cr, area, self._render_tile)
+            # Painters that can not be cached paint on top of the tiles
+            self._render_area(cr, area, cacheable=False)
 
         if DEBUG_DRAW_BOUNDING_BOX:
             cr.save()
@@ -843,19 +1001,42 @@ class GtkView(gtk.DrawingArea, View):
             cr.restore()
 
         # Draw Quadtree structure
-        if DEBUG_DRAW_QUADTREE:
+        index = self._canvas.index
+        if DEBUG_DRAW_QUADTREE and isinstance(index, Quadtree):
             def draw_qtree_bucket(bucket):
-                cr.rectangle(*bucket.bounds)
+                cr.rectangle(*self._canvas_to_view(bucket.bounds))
                 cr.stroke()
                 for b in bucket._buckets:
                     draw_qtree_bucket(b)
             cr.set_source_rgb(0, 0, .8)
             cr.set_line_width(1.0)
-            draw_qtree_bucket(self._qtree._bucket)
+            draw_qtree_bucket(index._bucket)
 
         return False
 
 
+    def _render_area(self, cr, area, cacheable=None):
+        """
+        Render the items in ``area`` with the view's painter. If
+        ``cacheable`` is True or False, only the (not) cacheable painters
+        paint (see `painter.Painter`).
+        """
+        painter = self._painter
+        if cacheable is not None and not isinstance(painter, PainterChain) \
+                and getattr(painter, 'cacheable', True) != cacheable:
+            return
+        painter.paint(Context(cairo=cr,
+                              items=self.get_items_in_rectangle(area),
+                              area=area, cacheable=cacheable))
+
+
+    def _render_tile(self, cr, area):
+        """
+        Render the cacheable part of ``area`` in a tile.
+        """
+        self._render_area(cr, area, cacheable=True)
+
+
     def do_event(self, event):
         """
         Handle GDK events. Events are delegated to a `tool.Tool`.
@@ -882,11 +1063,19 @@ class GtkView(gtk.DrawingArea, View):
         elif adj is self._vadjustment:
             m.translate(0, - adj.value)
         self._matrix *= m
+        if self._tile_cache is not None:
+            self._tile_cache.set_matrix(self._matrix)
 
-        # Force recalculation of the bounding boxes:
-        self.request_update((), self._canvas.get_all_items())
+        # Item bounds are kept in canvas coordinates, only the item to view
+        # matrices have to be calculated again.
+        self._clear_matrices()
+        self._update_bounds()
 
-        self.queue_draw_refresh()
+        self.update_adjustments()
+
+        # Nothing changed on the canvas, so tiles may be reused
+        a = self.allocation
+        super(GtkView, self).queue_draw_area(0, 0, a.width, a.height)
 
 
 # Set a signal to set adjustments. This way a ScrolledWindow can set its own
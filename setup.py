@@ -56,7 +56,7 @@ setup(
 
     license='GNU Library General Public License (LGPL, see COPYING)',
 
-    packages=find_packages(exclude=['ez_setup']),
+    packages=find_packages(exclude=['ez_setup', 'benchmarks']),
 
     setup_requires = [
      'nose >= 0.10.4',